@@ -0,0 +1,156 @@
+"""Run prompt files headlessly, several sessions at a time.
+
+Each prompt file becomes its own session with its own project directory under
+REPO_DIR/batch_<timestamp>/ and its own session log, so an interrupted session can be
+continued with ``python loop_live.py --resume <session_id>``. Sessions run without a
+terminal display (NullDisplay), never wait for user input (a session ends when the
+model stops calling tools) and stop after --max-turns model requests. A bounded pool
+of --workers sessions runs at once. Each session runs in its own constants scope
+(config.constants_scope), so the tools of every session see that session's PROJECT_DIR.
+
+Usage:
+    python batch.py "prompts/*.md" --workers 3 --max-turns 25 --output batch_results.json
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from rich import print as rr
+
+from config import MAIN_MODEL, METRICS_PORT, PROMPTS_DIR, ROUTER_ENABLED, constants_scope, set_project_dir
+from loop_live import SessionStats, sampling_loop, with_project_dir
+from utils.agent_display import NullDisplay
+from utils.metrics import MetricsExporter
+from utils.prompt_registry import get_prompts
+from utils.request_scheduler import get_scheduler
+from utils.session_log import SessionLog
+
+
+@dataclass
+class SessionResult:
+    """Outcome of one batch session."""
+
+    prompt: str
+    project_dir: str
+    session_id: str = ""
+    wall_seconds: float = 0.0
+    stats: SessionStats = field(default_factory=SessionStats)
+    error: Optional[str] = None
+
+
+def expand_prompts(patterns: List[str]) -> List[Path]:
+    """Resolve file names and glob patterns to a sorted, de-duplicated list of prompt files."""
+    if not patterns:
+        patterns = [str(PROMPTS_DIR / "*.md")]
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        files.extend(Path(match).resolve() for match in matches if Path(match).is_file())
+    return sorted(set(files))
+
+
+async def run_session(prompt_file: Path, batch_name: str, index: int, max_turns: int, api_key: str, routing: bool = ROUTER_ENABLED) -> SessionResult:
+    # PROJECT_DIR is set for this session only; other sessions keep their own
+    with constants_scope():
+        return await _run_session(prompt_file, batch_name, index, max_turns, api_key, routing)
+
+
+async def _run_session(prompt_file: Path, batch_name: str, index: int, max_turns: int, api_key: str, routing: bool) -> SessionResult:
+    project_dir = set_project_dir(Path(batch_name) / f"{index:03d}_{prompt_file.stem}")
+    project_dir.mkdir(parents=True, exist_ok=True)
+    task = with_project_dir(get_prompts().read(prompt_file).text, project_dir)
+    session_log = SessionLog.create(
+        f"{index:03d}_{prompt_file.stem}",
+        task=task,
+        project_dir=str(project_dir),
+        model=MAIN_MODEL,
+        system_prompt_sha256=get_prompts().hash("system"),
+    )
+    result = SessionResult(prompt=str(prompt_file), project_dir=str(project_dir), session_id=session_log.session_id)
+
+    start = time.perf_counter()
+    try:
+        await sampling_loop(
+            model=MAIN_MODEL,
+            messages=[{"role": "user", "content": task}],
+            api_key=api_key,
+            display=NullDisplay(),
+            pacing_mode="throughput",
+            ask_user=lambda: None,
+            max_turns=max_turns,
+            stats=result.stats,
+            session_log=session_log,
+            routing=routing,
+        )
+    except Exception as e:
+        result.error = str(e)
+        if not result.stats.exit_reason:
+            result.stats.exit_reason = "error"
+    finally:
+        session_log.close()
+    result.wall_seconds = round(time.perf_counter() - start, 2)
+    return result
+
+
+async def run_batch(
+    prompt_files: List[Path], workers: int, max_turns: int, metrics_port: int = METRICS_PORT, routing: bool = ROUTER_ENABLED
+) -> List[SessionResult]:
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise ValueError("API key not found. Please set the ANTHROPIC_API_KEY environment variable.")
+    batch_name = f"batch_{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    pool = asyncio.Semaphore(max(1, workers))
+
+    async def worker(index: int, prompt_file: Path) -> SessionResult:
+        async with pool:
+            rr(f"[cyan]Starting[/cyan] {prompt_file.name}")
+            result = await run_session(prompt_file, batch_name, index, max_turns, api_key, routing)
+            rr(
+                f"[green]Finished[/green] {prompt_file.name}: {result.stats.exit_reason}, "
+                f"{result.stats.turns} turns, {result.wall_seconds}s"
+            )
+            return result
+
+    async with MetricsExporter(port=metrics_port):
+        results = await asyncio.gather(*(worker(i, f) for i, f in enumerate(prompt_files, 1)))
+    # All sessions share one request scheduler, so rate limits are handled batch-wide
+    rr(f"[yellow]Request scheduler:[/yellow] {get_scheduler()}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("prompts", nargs="*", help=f"Prompt files or glob patterns (default: {PROMPTS_DIR}/*.md)")
+    parser.add_argument("--workers", type=int, default=2, help="Sessions to run at the same time")
+    parser.add_argument("--max-turns", type=int, default=30, help="Model requests per session")
+    parser.add_argument("--output", help="Write the per-session results as JSON to this file")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve OpenMetrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument(
+        "--route",
+        action=argparse.BooleanOptionalAction,
+        default=ROUTER_ENABLED,
+        help="Send light follow-up turns to the cheaper model (per-model stats are in the results)",
+    )
+    args = parser.parse_args()
+
+    prompt_files = expand_prompts(args.prompts)
+    if not prompt_files:
+        parser.error("no prompt files matched")
+    results = asyncio.run(run_batch(prompt_files, args.workers, args.max_turns, args.metrics_port, args.route))
+    report = json.dumps([asdict(result) for result in results], indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
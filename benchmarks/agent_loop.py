@@ -0,0 +1,248 @@
+"""End-to-end benchmark of the agent loop against a local mock Messages API.
+
+Drives ``run_sampling_loop`` -> ``sampling_loop`` -> ``ToolCollection`` through scripted
+scenarios (plain chat, file editing, parallel reads, reads followed by a long
+explanation, shell commands) served by ``MockMessagesServer``. The bash scenario runs
+its commands with the backend chosen by --bash-backend: "native" hands them to the
+shell, "llm" first asks the (mocked) light model for a script, as on Windows.
+Follow-up user messages come from a script instead of the interactive prompt and the
+loop runs with the "throughput" pacing mode, so nothing waits on a human or the display.
+
+For every model request of a scenario it reports:
+    wall_ms      time from this request to the next one (or to the end of the loop)
+    api_ms       time the mock server spent answering (the configured latency)
+    tools_ms     time spent inside ToolCollection.run_many (after the response; tool calls
+                 started early while it streamed overlap api_ms instead)
+    own_ms       wall_ms - api_ms - tools_ms: our own code in the loop
+    messages     number of messages sent, and request body size in bytes
+    input_tokens tokens sent (the mock server bills body bytes / 4)
+    traced_kb    Python heap in use when the request arrived (tracemalloc)
+
+Run from the repository root:
+    python -m benchmarks.agent_loop --rounds 4 --first-token-delay 0.2 --output results.json
+    python -m benchmarks.agent_loop --scenarios bash --bash-backend llm
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+from benchmarks.mock_server import MockMessagesServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+
+from config import MAIN_MODEL, SUMMARY_MODEL, constants_scope, set_project_dir  # noqa: E402
+from loop_live import run_sampling_loop  # noqa: E402
+from tools import ToolCollection  # noqa: E402
+from tools.script_cache import ScriptCache, set_script_cache  # noqa: E402
+from utils.agent_display import NullDisplay  # noqa: E402
+from utils.request_scheduler import set_scheduler  # noqa: E402
+
+FILE_TEXT = "\n".join(f"def handler_{i}(event):\n    return {{'id': {i}, 'event': event}}\n" for i in range(40))
+SUMMARY_SCRIPT = [{"content": [{"type": "text", "text": "<SUMMARY_RESPONSE>I worked on the project files.</SUMMARY_RESPONSE>"}]}]
+# What the light model answers BashTool's llm backend with (the same script for every command)
+BASH_SCRIPT_RESPONSE = [{"content": [{"type": "text", "text": "Python Script:\n```python\nprint('done')\n```"}]}]
+
+
+def _text(text: str) -> Dict[str, Any]:
+    return {"type": "text", "text": text}
+
+
+def _editor(command: str, path: str, **extra) -> Dict[str, Any]:
+    return {"type": "tool_use", "name": "str_replace_editor", "input": {"command": command, "path": path, **extra}}
+
+
+def _bash(command: str) -> Dict[str, Any]:
+    return {"type": "tool_use", "name": "bash", "input": {"command": command}}
+
+
+def chat_script() -> List[Dict[str, Any]]:
+    return [{"content": [_text("Here is what I would do next. " * 20)]}]
+
+
+def editor_script() -> List[Dict[str, Any]]:
+    return [
+        {"content": [_text("I will create the handlers module."), _editor("create", "handlers.py", file_text=FILE_TEXT)]},
+        {"content": [_text("Let me check the file."), _editor("view", "handlers.py")]},
+        {"content": [_text("Renaming the first handler."), _editor("str_replace", "handlers.py", old_str="handler_0(", new_str="handler_first(")]},
+        {"content": [_text("The module is in place and the first handler is renamed.")]},
+    ]
+
+
+def parallel_reads_script() -> List[Dict[str, Any]]:
+    create = [_editor("create", f"module_{i}.py", file_text=FILE_TEXT) for i in range(4)]
+    view = [_editor("view", f"module_{i}.py") for i in range(4)]
+    return [
+        {"content": [_text("Creating four modules.")] + create},
+        {"content": [_text("Reading all four modules at once.")] + view},
+        {"content": [_text("All four modules look right.")]},
+    ]
+
+
+def early_reads_script() -> List[Dict[str, Any]]:
+    create = [_editor("create", f"module_{i}.py", file_text=FILE_TEXT) for i in range(2)]
+    view = [_editor("view", f"module_{i}.py") for i in range(2)]
+    return [
+        {"content": [_text("Creating two modules.")] + create},
+        # The views come first and can run while the explanation is still streaming
+        {"content": view + [_text("While those load: the modules share one handler layout. " * 15)]},
+        {"content": [_text("Both modules look right.")]},
+    ]
+
+
+def bash_script() -> List[Dict[str, Any]]:
+    return [
+        {"content": [_text("Setting up the package."), _bash("mkdir -p handlers && touch handlers/__init__.py")]},
+        {"content": [_text("Checking what is there."), _bash("ls -la handlers")]},
+        {"content": [_text("Counting the files."), _bash("find . -name '*.py' | wc -l")]},
+        {"content": [_text("The package directory is in place.")]},
+    ]
+
+
+SCENARIOS = {
+    "chat": chat_script,
+    "editor": editor_script,
+    "parallel_reads": parallel_reads_script,
+    "early_reads": early_reads_script,
+    "bash": bash_script,
+}
+
+
+class _ToolTimer:
+    """Wraps ToolCollection.run_many to record when tool batches ran."""
+
+    def __init__(self):
+        self.spans: List[tuple] = []
+        self._original = ToolCollection.run_many
+
+    def __enter__(self):
+        timer = self
+
+        async def run_many(collection, calls, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await timer._original(collection, calls, **kwargs)
+            finally:
+                timer.spans.append((start, time.perf_counter()))
+
+        ToolCollection.run_many = run_many
+        return self
+
+    def __exit__(self, *exc):
+        ToolCollection.run_many = self._original
+
+
+async def run_scenario(name: str, rounds: int, first_token_delay: float, chunk_delay: float) -> Dict[str, Any]:
+    project_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    set_project_dir(project_dir)
+    # Every run translates its commands afresh, and the real cache file is left alone
+    set_script_cache(ScriptCache(os.path.join(project_dir, "bash_scripts.json")))
+
+    server = MockMessagesServer(
+        script=SCENARIOS[name](),
+        model_scripts={SUMMARY_MODEL: BASH_SCRIPT_RESPONSE if name == "bash" else SUMMARY_SCRIPT},
+        first_token_delay=first_token_delay,
+        chunk_delay=chunk_delay,
+        probe=lambda: {"traced": tracemalloc.get_traced_memory()[0]},
+    )
+    os.environ["ANTHROPIC_BASE_URL"] = server.start()
+    # The shared client was created for the previous scenario's server
+    set_scheduler(None)
+    follow_ups = iter([f"Round {i + 2}: carry on with the next step." for i in range(rounds - 1)])
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with _ToolTimer() as tools:
+            messages = await run_sampling_loop(
+                f"Build a small handlers package in {project_dir}.",
+                NullDisplay(),
+                pacing_mode="throughput",
+                ask_user=lambda: next(follow_ups, None),
+            )
+    finally:
+        end = time.perf_counter()
+        tracemalloc.stop()
+        server.stop()
+
+    requests = [r for r in server.requests if r.model == MAIN_MODEL]
+    turns = []
+    for i, record in enumerate(requests):
+        turn_end = requests[i + 1].received_at if i + 1 < len(requests) else end
+        wall = turn_end - record.received_at
+        api = record.finished_at - record.received_at
+        tool_time = sum(t1 - t0 for t0, t1 in tools.spans if record.received_at <= t0 < turn_end)
+        turns.append({
+            "turn": i + 1,
+            "wall_ms": round(wall * 1000, 2),
+            "api_ms": round(api * 1000, 2),
+            "tools_ms": round(tool_time * 1000, 2),
+            "own_ms": round((wall - api - tool_time) * 1000, 2),
+            "messages": record.n_messages,
+            "body_bytes": record.body_bytes,
+            "input_tokens": max(1, record.body_bytes // 4),
+            "traced_kb": round(record.probe.get("traced", 0) / 1024, 1),
+        })
+
+    own = [t["own_ms"] for t in turns]
+    return {
+        "turns": turns,
+        "summary": {
+            "requests": len(turns),
+            "side_requests": len(server.requests) - len(requests),
+            "final_messages": len(messages),
+            "total_ms": round((end - start) * 1000, 2),
+            # From run_sampling_loop() to the first request: tool construction, first prompt
+            "setup_ms": round((requests[0].received_at - start) * 1000, 2) if requests else 0.0,
+            "api_ms": round(sum(t["api_ms"] for t in turns), 2),
+            "tools_ms": round(sum(t["tools_ms"] for t in turns), 2),
+            "own_ms": round(sum(own), 2),
+            "own_ms_median": round(statistics.median(own), 2) if own else 0.0,
+            "own_ms_max": max(own, default=0.0),
+            "input_tokens": sum(t["input_tokens"] for t in turns),
+            "traced_kb_growth": round(turns[-1]["traced_kb"] - turns[0]["traced_kb"], 1) if turns else 0.0,
+        },
+    }
+
+
+async def main_async(args) -> Dict[str, Any]:
+    results = {}
+    for name in args.scenarios:
+        with constants_scope(BASH_BACKEND=args.bash_backend):
+            results[name] = await run_scenario(name, args.rounds, args.first_token_delay, args.chunk_delay)
+    set_script_cache(None)
+    return {
+        "config": {
+            "rounds": args.rounds,
+            "first_token_delay": args.first_token_delay,
+            "chunk_delay": args.chunk_delay,
+            "bash_backend": args.bash_backend,
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--rounds", type=int, default=3, help="User turns per scenario")
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--bash-backend", choices=["auto", "native", "llm"], default="auto", help="How BashTool runs commands")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    args = parser.parse_args()
+    results = json.dumps(asyncio.run(main_async(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark of the time debug logging adds at an ic() call site.
+
+Compares, per call of the output function ic() is configured with:
+
+    append_per_call  what write_to_file did: open debug_log.json in append mode, write
+                     the text, close it (on the calling thread, so on the event loop)
+    debug_log        DebugLog.write: queue the text for the background writer
+
+Both write the same messages to a temporary directory; the debug_log run uses a small
+max_bytes so the writer also rotates and gzips while the calls are measured. Reported:
+median, p99 and max microseconds per call, and the DebugLog counters afterwards.
+
+Run from the repository root:
+    python -m benchmarks.debug_log --calls 20000 --size 400
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from utils.debug_log import DebugLog
+
+
+def _append_per_call(path: Path) -> Callable[[str], None]:
+    def write(s: str):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(s)
+            f.write("\n" + "-" * 80 + "\n")
+
+    return write
+
+
+def _measure(write: Callable[[str], None], calls: int, size: int) -> Dict[str, float]:
+    message = "ic| loop_live.py:412 in sampling_loop()- " + "x" * size
+    timings: List[float] = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        write(message)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "median_us": round(statistics.median(timings), 2),
+        "p99_us": round(timings[int(len(timings) * 0.99) - 1], 2),
+        "max_us": round(timings[-1], 2),
+        "total_ms": round(sum(timings) / 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000, help="ic() outputs to write")
+    parser.add_argument("--size", type=int, default=400, help="Characters per message")
+    parser.add_argument("--max-bytes", type=int, default=2 * 1024 * 1024, help="Rotation size for the debug_log run")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_debug_log_") as tmp:
+        legacy = _measure(_append_per_call(Path(tmp) / "legacy.json"), args.calls, args.size)
+        log = DebugLog(Path(tmp) / "debug_log.json", max_bytes=args.max_bytes, backups=3)
+        buffered = _measure(log.write, args.calls, args.size)
+        log.close()
+        buffered["stats"] = log.stats()
+    results = json.dumps(
+        {"config": vars(args), "append_per_call": legacy, "debug_log": buffered},
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark of image retention and pre-send image preparation.
+
+Two parts:
+
+    retention  cost per turn of keeping the newest N tool_result images, comparing a
+               full rescan of the history (what _maybe_filter_to_n_most_recent_images
+               did every turn) with ImageIndex, which only scans appended messages
+    pipeline   tokens, bytes and time for ImagePipeline on synthetic screenshots
+               (a mostly blank page and a busy full-screen one)
+
+Run from the repository root:
+    python -m benchmarks.images --turns 200 --keep 2
+"""
+
+import argparse
+import base64
+import io
+import json
+import time
+from typing import Any, Dict, List
+
+from utils.images import ImageIndex, ImagePipeline
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+
+def _tool_result_message(with_image: bool) -> Dict[str, Any]:
+    content: List[Dict[str, Any]] = [{"type": "text", "text": "ok"}]
+    if with_image:
+        content.append({"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": ""}})
+    return {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "toolu_1", "content": content}]}
+
+
+def _rescan(messages: List[Dict[str, Any]], keep: int) -> int:
+    # The per-turn scan the loop used before ImageIndex
+    tool_results = [
+        item
+        for message in messages
+        for item in (message["content"] if isinstance(message["content"], list) else [])
+        if isinstance(item, dict) and item.get("type") == "tool_result"
+    ]
+    total = sum(
+        1
+        for result in tool_results
+        for content in result.get("content", [])
+        if isinstance(content, dict) and content.get("type") == "image"
+    )
+    to_remove = max(0, total - keep)
+    removed = to_remove
+    for result in tool_results:
+        if isinstance(result.get("content"), list):
+            kept = []
+            for content in result["content"]:
+                if isinstance(content, dict) and content.get("type") == "image" and to_remove > 0:
+                    to_remove -= 1
+                    continue
+                kept.append(content)
+            result["content"] = kept
+    return removed
+
+
+def bench_retention(turns: int, keep: int) -> Dict[str, Any]:
+    results = {}
+    for name in ("rescan", "index"):
+        messages: List[Dict[str, Any]] = []
+        index = ImageIndex()
+        seconds = 0.0
+        for turn in range(turns):
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": "step"}]})
+            messages.append(_tool_result_message(with_image=turn % 2 == 0))
+            start = time.perf_counter()
+            if name == "rescan":
+                _rescan(messages, keep)
+            else:
+                index.enforce(messages, keep)
+            seconds += time.perf_counter() - start
+        results[name] = {"total_ms": round(seconds * 1000, 2), "per_turn_us": round(seconds / turns * 1e6, 1)}
+    return results
+
+
+def _screenshot(busy: bool) -> str:
+    image = Image.new("RGB", (1920, 1080), "white")
+    draw = ImageDraw.Draw(image)
+    if busy:
+        for y in range(0, 1080, 18):
+            draw.text((10, y), "lorem ipsum dolor sit amet " * 12, fill=(30, 30, 30))
+    else:
+        draw.rectangle((560, 300, 1360, 780), outline="black", fill=(240, 240, 250))
+        for y in range(320, 760, 20):
+            draw.text((580, y), "settings panel entry", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def bench_pipeline(budget: int) -> Dict[str, Any]:
+    if Image is None:
+        return {"skipped": "Pillow is not installed"}
+    results = {}
+    for name, busy in (("dialog", False), ("full_page", True)):
+        pipeline = ImagePipeline(token_budget=budget)
+        prepared = pipeline.prepare(_screenshot(busy))
+        results[name] = {
+            "media_type": prepared.media_type,
+            "tokens_before": prepared.tokens_before,
+            "tokens_after": prepared.tokens_after,
+            "bytes_before": prepared.bytes_before,
+            "bytes_after": prepared.bytes_after,
+            "ms": round(pipeline.seconds * 1000, 1),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200, help="Turns of history to build up")
+    parser.add_argument("--keep", type=int, default=2, help="Images to keep")
+    parser.add_argument("--budget", type=int, default=1000, help="Token budget per image")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    args = parser.parse_args()
+    results = json.dumps(
+        {
+            "config": vars(args),
+            "retention": bench_retention(args.turns, args.keep),
+            "pipeline": bench_pipeline(args.budget),
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Microbenchmark for per-turn request preparation in ``sampling_loop``.
+
+Simulates a session growing to several hundred messages. Every turn appends an
+assistant tool_use message and a user tool_result message, moves the prompt-cache
+breakpoints with ``CacheBreakpointPlanner``, and then prepares the outgoing
+``truncated_messages`` list, either by truncating the whole history again (the old
+behaviour) or through ``MessageStore``.
+
+Run from the repository root:
+    python -m benchmarks.message_prep --sizes 50 100 200 400 800
+"""
+
+import argparse
+import json
+import time
+
+from utils.message_store import MessageStore, truncate_message_content
+from utils.prompt_caching import CacheBreakpointPlanner
+from utils.token_counter import TokenCounter
+
+TOOL_OUTPUT = "line of tool output that is fairly typical of a bash or file listing\n" * 60
+
+
+def _turn_messages(turn: int):
+    tool_use_id = f"toolu_{turn:06d}"
+    assistant = {
+        "role": "assistant",
+        "content": [
+            {"type": "text", "text": f"Step {turn}: looking at the next file."},
+            {"type": "tool_use", "id": tool_use_id, "name": "str_replace_editor",
+             "input": {"command": "view", "path": f"src/module_{turn}.py"}},
+        ],
+    }
+    user = {
+        "role": "user",
+        "content": [
+            {"type": "tool_result", "tool_use_id": tool_use_id, "is_error": False,
+             "content": [{"type": "text", "text": TOOL_OUTPUT}]},
+        ],
+    }
+    return assistant, user
+
+
+def legacy_prepare(messages):
+    return [{"role": msg["role"], "content": truncate_message_content(msg["content"])} for msg in messages]
+
+
+def run(sizes, repeat: int):
+    results = []
+    max_size = max(sizes)
+    messages = [{"role": "user", "content": "Build the project."}]
+    counter = TokenCounter()
+    store = MessageStore(token_counter=counter)
+    planner = CacheBreakpointPlanner("claude-3-5-sonnet-latest", counter)
+    store.prepare(messages)
+    turn = 0
+    while len(messages) < max_size:
+        turn += 1
+        messages.extend(_turn_messages(turn))
+        planner.apply(messages, planner.plan(messages), store)
+
+        legacy = store_cost = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            legacy_prepare(messages)
+            legacy = min(legacy, time.perf_counter() - start)
+        # Only the first prepare after a turn does real work; that is the per-turn cost
+        start = time.perf_counter()
+        store.prepare(messages)
+        store_cost = time.perf_counter() - start
+
+        if any(len(messages) - 2 < size <= len(messages) for size in sizes):
+            results.append({
+                "messages": len(messages),
+                "legacy_us": round(legacy * 1e6, 1),
+                "message_store_us": round(store_cost * 1e6, 1),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 200, 400, 800])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
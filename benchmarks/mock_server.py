@@ -0,0 +1,289 @@
+"""A local mock of the Anthropic Messages API for benchmarking the agent loop offline.
+
+The server answers ``POST /v1/messages`` with scripted responses, either as a single
+JSON body or as a server-sent event stream when the request sets ``"stream": true``.
+Latency is configurable so time-to-first-token and total turn time can be measured
+without touching the network. It can also enforce a requests-per-window rate limit
+(429 with retry-after, and anthropic-ratelimit-* headers on every response) and
+answer a share of requests with 529 overloaded errors.
+
+Usage:
+    server = MockMessagesServer(first_token_delay=0.5, chunk_delay=0.02)
+    base_url = server.start()
+    os.environ["ANTHROPIC_BASE_URL"] = base_url
+    ...
+    server.stop()
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_RESPONSE = {
+    "content": [
+        {
+            "type": "text",
+            "text": "I have looked at the project and everything is in place. Let me know what you would like to do next.",
+        }
+    ],
+    "stop_reason": "end_turn",
+}
+
+
+@dataclass
+class RequestRecord:
+    """Timing and size information for one request the mock server handled."""
+
+    received_at: float
+    finished_at: float = 0.0
+    body_bytes: int = 0
+    n_messages: int = 0
+    stream: bool = False
+    model: str = ""
+    status: int = 200
+    probe: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class MockMessagesServer:
+    """Serve scripted Messages API responses from a background thread.
+
+    Args:
+        script: Response specs served in order (and cycled once exhausted). Each spec is a
+            dict with a ``content`` list of ``text`` / ``tool_use`` blocks and an optional
+            ``stop_reason``. Defaults to a single text answer.
+        first_token_delay: Seconds before the first byte of the response is sent.
+        chunk_delay: Seconds between streamed text chunks (and, for non-streaming
+            requests, added once per chunk before the body is returned).
+        chunk_size: Characters of text per streamed delta.
+        port: Port to bind, 0 picks a free one.
+        model_scripts: Separate scripts for requests to particular models (for example the
+            summary model), so side requests do not consume the main script.
+        probe: Called when each request arrives; its result is stored on the RequestRecord
+            (for example to sample the client's memory use at request time).
+        requests_per_window: Requests allowed per ``window`` seconds; more are answered
+            with 429 and a retry-after header. 0 disables the limit.
+        window: Length of the rate-limit window in seconds.
+        overload_rate: Share of requests (0-1) answered with 529 overloaded_error.
+        seed: Seed for choosing which requests are overloaded.
+    """
+
+    script: Optional[List[Dict[str, Any]]] = None
+    first_token_delay: float = 0.3
+    chunk_delay: float = 0.02
+    chunk_size: int = 8
+    port: int = 0
+    model_scripts: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    probe: Optional[Callable[[], Dict[str, Any]]] = None
+    requests_per_window: int = 0
+    window: float = 1.0
+    overload_rate: float = 0.0
+    seed: int = 0
+    requests: List[RequestRecord] = field(default_factory=list)
+
+    def __post_init__(self):
+        self._responses = itertools.cycle(self.script or [DEFAULT_RESPONSE])
+        self._model_responses = {model: itertools.cycle(script) for model, script in self.model_scripts.items()}
+        self._lock = threading.Lock()
+        self._random = random.Random(self.seed)
+        self._window_start = 0.0
+        self._window_used = 0
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """Start serving and return the base URL to point the SDK at."""
+        server = self
+
+        class Handler(_MessagesHandler):
+            mock = server
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def next_response(self, model: str = "") -> Dict[str, Any]:
+        with self._lock:
+            return next(self._model_responses.get(model, self._responses))
+
+    def admit(self):
+        """Decide whether to serve a request: (error status or None, extra headers)."""
+        with self._lock:
+            now = time.perf_counter()
+            headers = {}
+            if self.requests_per_window:
+                if now - self._window_start >= self.window:
+                    self._window_start, self._window_used = now, 0
+                reset_in = self._window_start + self.window - now
+                reset_at = datetime.now(timezone.utc) + timedelta(seconds=reset_in)
+                if self._window_used >= self.requests_per_window:
+                    headers["retry-after"] = str(max(1, round(reset_in)))
+                    remaining = 0
+                else:
+                    self._window_used += 1
+                    remaining = self.requests_per_window - self._window_used
+                headers.update({
+                    "anthropic-ratelimit-requests-limit": str(self.requests_per_window),
+                    "anthropic-ratelimit-requests-remaining": str(remaining),
+                    "anthropic-ratelimit-requests-reset": reset_at.isoformat().replace("+00:00", "Z"),
+                })
+                if "retry-after" in headers:
+                    return 429, headers
+            if self.overload_rate and self._random.random() < self.overload_rate:
+                return 529, headers
+            return None, headers
+
+    def record(self, record: RequestRecord):
+        with self._lock:
+            self.requests.append(record)
+
+
+class _MessagesHandler(BaseHTTPRequestHandler):
+    mock: MockMessagesServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        record = RequestRecord(received_at=time.perf_counter())
+        if self.mock.probe:
+            record.probe = self.mock.probe()
+        length = int(self.headers.get("content-length", 0))
+        raw = self.rfile.read(length)
+        record.body_bytes = len(raw)
+        try:
+            body = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            body = {}
+        record.n_messages = len(body.get("messages", []))
+        record.stream = bool(body.get("stream"))
+        record.model = body.get("model", "")
+
+        if not self.path.split("?")[0].endswith("/v1/messages"):
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            record.status = 404
+        else:
+            error, headers = self.mock.admit()
+            if error:
+                kind = "rate_limit_error" if error == 429 else "overloaded_error"
+                self._send_json(error, {"type": "error", "error": {"type": kind, "message": kind}}, headers)
+                record.status = error
+            else:
+                spec = self.mock.next_response(record.model)
+                message = _build_message(spec, body, input_tokens=max(1, record.body_bytes // 4))
+                if record.stream:
+                    self._send_stream(message, headers)
+                else:
+                    n_chunks = sum(len(_chunks(b.get("text", ""), self.mock.chunk_size)) for b in message["content"])
+                    time.sleep(self.mock.first_token_delay + self.mock.chunk_delay * n_chunks)
+                    self._send_json(200, message, headers)
+
+        record.finished_at = time.perf_counter()
+        self.mock.record(record)
+
+    def _send_headers(self, headers: Optional[Dict[str, str]]):
+        self.send_header("request-id", f"req_{uuid.uuid4().hex[:24]}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self._send_headers(headers)
+        self.wfile.write(data)
+
+    def _send_stream(self, message: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self._send_headers(headers)
+
+        time.sleep(self.mock.first_token_delay)
+        start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+        self._event("message_start", {"type": "message_start", "message": start})
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                self._event("content_block_start", {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}})
+                for chunk in _chunks(block["text"], self.mock.chunk_size):
+                    self._event("content_block_delta", {"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": chunk}})
+                    time.sleep(self.mock.chunk_delay)
+            elif block["type"] == "tool_use":
+                self._event("content_block_start", {"type": "content_block_start", "index": index, "content_block": dict(block, input={})})
+                self._event("content_block_delta", {"type": "content_block_delta", "index": index, "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}})
+                time.sleep(self.mock.chunk_delay)
+            self._event("content_block_stop", {"type": "content_block_stop", "index": index})
+        self._event("message_delta", {
+            "type": "message_delta",
+            "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+            "usage": {"output_tokens": message["usage"]["output_tokens"]},
+        })
+        self._event("message_stop", {"type": "message_stop"})
+
+    def _event(self, name: str, payload: Dict[str, Any]):
+        self.wfile.write(f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode())
+        self.wfile.flush()
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _build_message(spec: Dict[str, Any], request: Dict[str, Any], input_tokens: int) -> Dict[str, Any]:
+    content = []
+    for block in spec.get("content", []):
+        if block["type"] == "tool_use":
+            content.append({
+                "type": "tool_use",
+                "id": block.get("id") or f"toolu_{uuid.uuid4().hex[:24]}",
+                "name": block["name"],
+                "input": block.get("input", {}),
+            })
+        else:
+            content.append({"type": "text", "text": block.get("text", "")})
+    has_tool_use = any(b["type"] == "tool_use" for b in content)
+    output_chars = sum(len(json.dumps(b)) for b in content)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": request.get("model", "mock-model"),
+        "content": content,
+        "stop_reason": spec.get("stop_reason") or ("tool_use" if has_tool_use else "end_turn"),
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": max(1, output_chars // 4),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        },
+    }
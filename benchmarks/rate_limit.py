@@ -0,0 +1,156 @@
+"""Benchmark of model calls under a rate limit, with and without the request scheduler.
+
+Several simulated sessions run at once against ``MockMessagesServer`` with a
+requests-per-window limit (and optionally a share of 529 overloaded answers). Each
+session makes streaming main-turn requests and, after every turn, fires a background
+summary request the way BackgroundSummarizer does. Two strategies are compared:
+
+    independent  every call makes its own AsyncAnthropic client with the SDK's default
+                 retries, as the loop, summaries and bash tool did before the scheduler
+    scheduler    every call goes through one RequestScheduler (utils/request_scheduler.py)
+
+For each strategy it reports main-turn latency (median / p95), failed main turns and
+summaries, the 429 / 529 answers the server sent, total time, and the scheduler's
+queue-depth and wait-time metrics.
+
+Run from the repository root:
+    python -m benchmarks.rate_limit --sessions 6 --turns 4 --limit 5 --window 1 --overload 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.mock_server import MockMessagesServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+
+from anthropic import AsyncAnthropic  # noqa: E402
+
+from utils.request_scheduler import PRIORITY_MAIN, PRIORITY_SUMMARY, RequestScheduler  # noqa: E402
+
+MAIN_REQUEST = {
+    "model": "claude-3-5-sonnet-latest",
+    "max_tokens": 1024,
+    "messages": [{"role": "user", "content": "Carry on with the next step."}],
+}
+SUMMARY_REQUEST = {
+    "model": "claude-3-5-haiku-latest",
+    "max_tokens": 256,
+    "messages": [{"role": "user", "content": "Summarise what was done."}],
+}
+
+
+async def _stream(client: AsyncAnthropic):
+    async with client.messages.stream(**MAIN_REQUEST) as stream:
+        return await stream.get_final_message()
+
+
+async def _summary(client: AsyncAnthropic):
+    return await client.messages.create(**SUMMARY_REQUEST)
+
+
+def _independent() -> Dict[str, Callable]:
+    return {
+        "main": lambda: _stream(AsyncAnthropic()),
+        "summary": lambda: _summary(AsyncAnthropic()),
+    }
+
+
+def _scheduled(scheduler: RequestScheduler) -> Dict[str, Callable]:
+    return {
+        "main": lambda: scheduler.submit(_stream, PRIORITY_MAIN),
+        "summary": lambda: scheduler.submit(_summary, PRIORITY_SUMMARY),
+    }
+
+
+async def _session(calls: Dict[str, Callable], turns: int, outcome: Dict[str, List]):
+    summaries = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        try:
+            await calls["main"]()
+            outcome["main_latency"].append(time.perf_counter() - start)
+        except Exception as e:
+            outcome["main_errors"].append(type(e).__name__)
+        summaries.append(asyncio.create_task(calls["summary"]()))
+    for result in await asyncio.gather(*summaries, return_exceptions=True):
+        if isinstance(result, Exception):
+            outcome["summary_errors"].append(type(result).__name__)
+
+
+async def run_strategy(name: str, args) -> Dict[str, Any]:
+    server = MockMessagesServer(
+        first_token_delay=args.first_token_delay,
+        chunk_delay=0.0,
+        requests_per_window=args.limit,
+        window=args.window,
+        overload_rate=args.overload,
+    )
+    os.environ["ANTHROPIC_BASE_URL"] = server.start()
+    scheduler = None
+    if name == "scheduler":
+        scheduler = RequestScheduler(max_concurrency=args.concurrency, backoff_base=args.backoff_base)
+        calls = _scheduled(scheduler)
+    else:
+        calls = _independent()
+
+    outcome = {"main_latency": [], "main_errors": [], "summary_errors": []}
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(_session(calls, args.turns, outcome) for _ in range(args.sessions)))
+    finally:
+        total = time.perf_counter() - start
+        server.stop()
+
+    latency = sorted(outcome["main_latency"])
+    statuses = [r.status for r in server.requests]
+    result = {
+        "total_s": round(total, 2),
+        "main_ok": len(latency),
+        "main_failed": len(outcome["main_errors"]),
+        "summaries_failed": len(outcome["summary_errors"]),
+        "main_median_s": round(statistics.median(latency), 3) if latency else None,
+        "main_p95_s": round(latency[int(0.95 * (len(latency) - 1))], 3) if latency else None,
+        "server_requests": len(statuses),
+        "server_429": statuses.count(429),
+        "server_529": statuses.count(529),
+    }
+    if scheduler:
+        result["scheduler"] = scheduler.stats()
+    return result
+
+
+async def main_async(args) -> Dict[str, Any]:
+    results = {}
+    for name in args.strategies:
+        results[name] = await run_strategy(name, args)
+    return {"config": vars(args), "strategies": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--strategies", nargs="+", choices=["independent", "scheduler"], default=["independent", "scheduler"])
+    parser.add_argument("--sessions", type=int, default=6, help="Sessions running at the same time")
+    parser.add_argument("--turns", type=int, default=4, help="Main-turn requests per session")
+    parser.add_argument("--limit", type=int, default=5, help="Requests the server allows per window")
+    parser.add_argument("--window", type=float, default=1.0, help="Rate-limit window in seconds")
+    parser.add_argument("--overload", type=float, default=0.0, help="Share of requests answered with 529")
+    parser.add_argument("--concurrency", type=int, default=4, help="Scheduler calls in flight")
+    parser.add_argument("--backoff-base", type=float, default=0.5, help="Scheduler backoff base in seconds")
+    parser.add_argument("--first-token-delay", type=float, default=0.1)
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    args = parser.parse_args()
+    results = json.dumps(asyncio.run(main_async(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(results)
+    print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Startup benchmark: import time of loop_live and time to the first API request.
+
+Every measurement runs in a fresh interpreter, so nothing is already imported:
+
+    import_s         time to ``import loop_live``
+    first_request_s  from interpreter start to the first request reaching
+                     ``MockMessagesServer``: imports, tool setup and preparing the prompt
+    heavy_modules    optional heavy dependencies (Playwright, BeautifulSoup, OpenAI, Pillow) and
+                     tool modules that were imported before the first request; tools are
+                     loaded lazily (tools/registry.py), so this should stay empty
+
+The median over --runs is reported. With --budget / --first-request-budget the script
+exits with status 1 when a median is over budget, and --check-schemas also fails when
+the static tool metadata no longer matches the tools, so CI can track both.
+
+Run from the repository root:
+    python -m benchmarks.startup --runs 5 --budget 3.0 --first-request-budget 4.0 --check-schemas
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+START = time.perf_counter()
+
+HEAVY_MODULES = ("playwright", "bs4", "openai", "PIL", "tools.bash", "tools.edit", "tools.expert", "tools.playwright", "tools.venvsetup")
+
+
+def _heavy_modules():
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def child_import():
+    start = time.perf_counter()
+    import loop_live  # noqa: F401
+
+    return {"import_s": time.perf_counter() - start, "heavy_modules": _heavy_modules()}
+
+
+def child_first_request():
+    import asyncio
+    import tempfile
+
+    os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+    from benchmarks.mock_server import MockMessagesServer
+    from config import set_project_dir
+    from loop_live import run_sampling_loop
+    from utils.agent_display import NullDisplay
+
+    server = MockMessagesServer(first_token_delay=0.0, chunk_delay=0.0)
+    os.environ["ANTHROPIC_BASE_URL"] = server.start()
+    set_project_dir(tempfile.mkdtemp(prefix="bench_startup_"))
+    try:
+        asyncio.run(run_sampling_loop("Say hello.", NullDisplay(), pacing_mode="throughput", ask_user=lambda: None, max_turns=1))
+    finally:
+        server.stop()
+    return {"first_request_s": server.requests[0].received_at - START, "heavy_modules": _heavy_modules()}
+
+
+def _run_child(mode: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.startup", "--child", mode],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # The result is the last line; anything before it is the program's own output
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--budget", type=float, help="Fail if the median import time is over this many seconds")
+    parser.add_argument("--first-request-budget", type=float, help="Fail if the median time to the first request is over this")
+    parser.add_argument("--check-schemas", action="store_true", help="Fail if tools/tool_schemas.json is out of date")
+    parser.add_argument("--output", help="Write the JSON results to this file as well as stdout")
+    parser.add_argument("--child", choices=["import", "first_request"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = child_import() if args.child == "import" else child_first_request()
+        print(json.dumps(result))
+        return
+
+    imports = [_run_child("import") for _ in range(args.runs)]
+    first_requests = [_run_child("first_request") for _ in range(args.runs)]
+    results = {
+        "runs": args.runs,
+        "import_s": round(statistics.median(r["import_s"] for r in imports), 3),
+        "first_request_s": round(statistics.median(r["first_request_s"] for r in first_requests), 3),
+        "heavy_modules": sorted({name for r in first_requests for name in r["heavy_modules"]}),
+    }
+    failures = []
+    if args.budget is not None and results["import_s"] > args.budget:
+        failures.append(f"import took {results['import_s']}s, budget {args.budget}s")
+    if args.first_request_budget is not None and results["first_request_s"] > args.first_request_budget:
+        failures.append(f"first request after {results['first_request_s']}s, budget {args.first_request_budget}s")
+    if args.check_schemas:
+        from tools.registry import check_schemas
+
+        stale = check_schemas()
+        results["stale_schemas"] = stale
+        if stale:
+            failures.append(f"tool metadata out of date for {', '.join(stale)} (python -m tools.registry --write)")
+    results["failures"] = failures
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Turn-latency benchmark for the model request path in ``sampling_loop``.
+
+Compares the old blocking request (``Anthropic().beta.messages.create`` called from
+inside the event loop) with the streaming ``AsyncAnthropic`` path (through the request scheduler), against a local
+mock Messages API. For each variant it reports time-to-first-token (when the first
+assistant text reaches ``AgentDisplay``), total turn time, and the worst event-loop
+stall seen by a heartbeat task while the request was in flight.
+
+Run from the repository root:
+    python -m benchmarks.turn_latency --turns 5 --first-token-delay 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from benchmarks.mock_server import MockMessagesServer
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+
+from anthropic import Anthropic  # noqa: E402
+
+from loop_live import _stream_model_response  # noqa: E402
+from utils.agent_display import AgentDisplay  # noqa: E402
+from utils.request_scheduler import get_scheduler  # noqa: E402
+
+LONG_ANSWER = " ".join(["The project is set up and the tests pass."] * 20)
+REQUEST = {
+    "model": "claude-3-5-sonnet-latest",
+    "max_tokens": 1024,
+    "messages": [{"role": "user", "content": "Summarise the project status."}],
+}
+
+
+class TimedDisplay(AgentDisplay):
+    """AgentDisplay that remembers when the first assistant text arrived."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_text_at = None
+
+    def add_message(self, msg_type, content):
+        if self.first_text_at is None and msg_type.startswith("assistant") and content:
+            self.first_text_at = time.perf_counter()
+        super().add_message(msg_type, content)
+
+
+async def _heartbeat(stalls: list, interval: float = 0.01):
+    """Record how late each tick of the event loop is."""
+    while True:
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        stalls.append(max(0.0, time.perf_counter() - expected))
+
+
+async def blocking_turn(display: TimedDisplay) -> None:
+    # The request path sampling_loop used before it moved to AsyncAnthropic
+    client = Anthropic()
+    response = client.beta.messages.create(**REQUEST)
+    for block in response.content:
+        if hasattr(block, "text"):
+            display.add_message("assistant", block.text)
+
+
+async def streaming_turn(display: TimedDisplay) -> None:
+    await _stream_model_response(get_scheduler(), display, **REQUEST)
+
+
+async def measure(turn, turns: int) -> dict:
+    ttft, total, worst_stall = [], [], []
+    for _ in range(turns):
+        display = TimedDisplay()
+        stalls = []
+        heartbeat = asyncio.create_task(_heartbeat(stalls))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await turn(display)
+        end = time.perf_counter()
+        heartbeat.cancel()
+        ttft.append((display.first_text_at or end) - start)
+        total.append(end - start)
+        worst_stall.append(max(stalls, default=end - start))
+    return {
+        "ttft_ms": round(statistics.median(ttft) * 1000, 1),
+        "turn_ms": round(statistics.median(total) * 1000, 1),
+        "max_loop_stall_ms": round(max(worst_stall) * 1000, 1),
+    }
+
+
+async def main_async(args) -> dict:
+    server = MockMessagesServer(
+        script=[{"content": [{"type": "text", "text": LONG_ANSWER}]}],
+        first_token_delay=args.first_token_delay,
+        chunk_delay=args.chunk_delay,
+    )
+    os.environ["ANTHROPIC_BASE_URL"] = server.start()
+    try:
+        return {
+            "before (sync create)": await measure(blocking_turn, args.turns),
+            "after (async stream)": await measure(streaming_turn, args.turns),
+        }
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
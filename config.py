@@ -1,6 +1,9 @@
-from os import mkdir
 from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
 import json
+import os
+import threading
 
 global PROJECT_DIR
 PROJECT_DIR = None
@@ -25,7 +28,6 @@ SCRIPTS_DIR = TOP_LEVEL_DIR / 'scripts'
 TESTS_DIR = TOP_LEVEL_DIR / 'tests'
 LOGS_DIR = TOP_LEVEL_DIR / 'logs'  # Ensure LOGS_DIR is based on PROJECT_DIR
 PROMPTS_DIR = TOP_LEVEL_DIR / 'prompts'
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
 JOURNAL_MODEL = "claude-3-5-haiku-latest"
 SUMMARY_MODEL = "claude-3-5-haiku-latest"
 MAIN_MODEL = "claude-3-5-sonnet-latest"
@@ -35,14 +37,89 @@ PROMPT_CACHING_BETA_FLAG = "prompt-caching-2024-07-31"
 JOURNAL_MAX_TOKENS = 1500
 MAX_SUMMARY_MESSAGES = 40
 MAX_SUMMARY_TOKENS = 8000
+# "interactive" waits for the display to catch up between steps, "throughput" never waits
+PACING_MODE = "interactive"
+# Context compaction: summarize the oldest messages once the history passes
+# COMPACTION_TRIGGER_RATIO of CONTEXT_TOKEN_BUDGET estimated tokens
+CONTEXT_TOKEN_BUDGET = 150000
+COMPACTION_TRIGGER_RATIO = 0.75
+COMPACTION_KEEP_RECENT = 8
+# Record/replay of model calls (utils/cassette.py): "off", "record" or "replay".
+# CASSETTE_MATCH is "request" (exact request only) or "sequence" (fall back to the
+# next response recorded at the same call site)
+CASSETTE_MODE = "off"
+CASSETTE_NAME = "default"
+CASSETTE_MATCH = "request"
+# Request scheduler (utils/request_scheduler.py) shared by all model calls: calls in
+# flight at once, retries of 429/529/5xx responses with jittered exponential backoff
+# (seconds), and the share of each rate limit kept free of background calls
+SCHEDULER_MAX_CONCURRENCY = 4
+SCHEDULER_MAX_RETRIES = 6
+SCHEDULER_BACKOFF_BASE = 1.0
+SCHEDULER_BACKOFF_MAX = 60.0
+SCHEDULER_BACKGROUND_RESERVE = 0.1
+# Metrics (utils/metrics.py) in the OpenMetrics text format: METRICS_FILE is rewritten
+# every METRICS_INTERVAL seconds, and served over HTTP when METRICS_PORT is not 0
+METRICS_FILE = LOGS_DIR / 'metrics.prom'
+METRICS_INTERVAL = 5.0
+METRICS_PORT = 0
+# Tracing spans (utils/tracing.py), appended to TRACE_FILE as JSONL; at most
+# TRACE_BUFFER_SPANS wait in memory (the oldest are dropped), and past TRACE_MAX_BYTES the
+# file is rotated and gzipped like the debug log, keeping TRACE_BACKUPS old files
+TRACE_ENABLED = True
+TRACE_FILE = LOGS_DIR / 'trace.jsonl'
+TRACE_MAX_BYTES = 50 * 1024 * 1024
+TRACE_BACKUPS = 3
+TRACE_BUFFER_SPANS = 50000
+# Debug output of ic() (utils/debug_log.py): buffered in memory (at most
+# DEBUG_LOG_BUFFER_LINES records, oldest dropped first) and appended to DEBUG_LOG_FILE as
+# JSONL by a background thread; past DEBUG_LOG_MAX_BYTES the file is rotated and gzipped,
+# keeping DEBUG_LOG_BACKUPS old files
+DEBUG_LOG_FILE = LOGS_DIR / 'debug_log.json'
+DEBUG_LOG_MAX_BYTES = 10 * 1024 * 1024
+DEBUG_LOG_BACKUPS = 5
+DEBUG_LOG_BUFFER_LINES = 10000
+DEBUG_LOG_FLUSH_INTERVAL = 0.5
+# Read-only tool calls that allow it (file views, web reads) start as soon as their
+# tool_use block has streamed instead of after the whole response (tools/scheduler.py)
+EARLY_TOOL_DISPATCH = True
+# Tool images (utils/images.py) are cropped and scaled to at most IMAGE_TOKEN_BUDGET
+# tokens and encoded as IMAGE_FORMAT ("auto" picks the smaller of PNG and JPEG)
+IMAGE_TOKEN_BUDGET = 1000
+IMAGE_AUTO_CROP = True
+IMAGE_FORMAT = "auto"
+IMAGE_JPEG_QUALITY = 80
+# Model routing (utils/model_router.py): when enabled, turns that follow small,
+# successful tool results go to ROUTER_LIGHT_MODEL if recent answers were short and it
+# is expected to cost less; failures and cut-off answers escalate back to MAIN_MODEL
+ROUTER_ENABLED = False
+ROUTER_LIGHT_MODEL = SUMMARY_MODEL
+ROUTER_MAX_RESULT_TOKENS = 2000
+ROUTER_MAX_OUTPUT_TOKENS = 600
+ROUTER_ERROR_COOLDOWN = 2
+ROUTER_MAIN_ONLY_TOOLS = ["opinion"]
+# USD per million input and output tokens, for routing and cost reports
+MODEL_PRICES = {
+    "claude-3-5-sonnet-latest": (3.0, 15.0),
+    "claude-3-5-haiku-latest": (0.8, 4.0),
+}
 
-# create a cache directory if it does not exist
+# The cache and logs directories are created by whatever first writes to them, not at import
 CACHE_DIR = TOP_LEVEL_DIR / 'cache'  # Changed from TOP_LEVEL_DIR / 'cache'
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
+# Scripts BashTool generated for a command (tools/script_cache.py) are reused for the
+# same command, bash.md and project directory; at most BASH_SCRIPT_CACHE_SIZE are kept
+BASH_SCRIPT_CACHE_ENABLED = True
+BASH_SCRIPT_CACHE_FILE = CACHE_DIR / 'bash_scripts.json'
+BASH_SCRIPT_CACHE_SIZE = 500
+# How BashTool runs a command: "native" hands it to the shell in PROJECT_DIR
+# (tools/run.py), "llm" has a model turn it into a Python or PowerShell script first, and
+# "auto" is native on POSIX hosts and llm elsewhere. Native commands time out after
+# BASH_TIMEOUT seconds
+BASH_BACKEND = "auto"
+BASH_TIMEOUT = 120.0
 
-# function to write the constants to a file
-def write_constants_to_file():
+# function to build the constants from the module globals
+def _default_constants():
     constants = {
         'TOP_LEVEL_DIR': str(TOP_LEVEL_DIR),
         'REPO_DIR': str(REPO_DIR),
@@ -66,65 +143,166 @@ def write_constants_to_file():
         'JOURNAL_MAX_TOKENS': JOURNAL_MAX_TOKENS,
         'MAX_SUMMARY_MESSAGES': MAX_SUMMARY_MESSAGES,
         'MAX_SUMMARY_TOKENS': MAX_SUMMARY_TOKENS,
+        'PACING_MODE': PACING_MODE,
+        'CONTEXT_TOKEN_BUDGET': CONTEXT_TOKEN_BUDGET,
+        'COMPACTION_TRIGGER_RATIO': COMPACTION_TRIGGER_RATIO,
+        'COMPACTION_KEEP_RECENT': COMPACTION_KEEP_RECENT,
+        'CASSETTE_MODE': CASSETTE_MODE,
+        'CASSETTE_NAME': CASSETTE_NAME,
+        'CASSETTE_MATCH': CASSETTE_MATCH,
+        'SCHEDULER_MAX_CONCURRENCY': SCHEDULER_MAX_CONCURRENCY,
+        'SCHEDULER_MAX_RETRIES': SCHEDULER_MAX_RETRIES,
+        'SCHEDULER_BACKOFF_BASE': SCHEDULER_BACKOFF_BASE,
+        'SCHEDULER_BACKOFF_MAX': SCHEDULER_BACKOFF_MAX,
+        'SCHEDULER_BACKGROUND_RESERVE': SCHEDULER_BACKGROUND_RESERVE,
+        'METRICS_FILE': str(METRICS_FILE),
+        'METRICS_INTERVAL': METRICS_INTERVAL,
+        'METRICS_PORT': METRICS_PORT,
+        'TRACE_ENABLED': TRACE_ENABLED,
+        'TRACE_FILE': str(TRACE_FILE),
+        'TRACE_MAX_BYTES': TRACE_MAX_BYTES,
+        'TRACE_BACKUPS': TRACE_BACKUPS,
+        'TRACE_BUFFER_SPANS': TRACE_BUFFER_SPANS,
+        'DEBUG_LOG_FILE': str(DEBUG_LOG_FILE),
+        'DEBUG_LOG_MAX_BYTES': DEBUG_LOG_MAX_BYTES,
+        'DEBUG_LOG_BACKUPS': DEBUG_LOG_BACKUPS,
+        'DEBUG_LOG_BUFFER_LINES': DEBUG_LOG_BUFFER_LINES,
+        'DEBUG_LOG_FLUSH_INTERVAL': DEBUG_LOG_FLUSH_INTERVAL,
+        'BASH_SCRIPT_CACHE_ENABLED': BASH_SCRIPT_CACHE_ENABLED,
+        'BASH_SCRIPT_CACHE_FILE': str(BASH_SCRIPT_CACHE_FILE),
+        'BASH_SCRIPT_CACHE_SIZE': BASH_SCRIPT_CACHE_SIZE,
+        'BASH_BACKEND': BASH_BACKEND,
+        'BASH_TIMEOUT': BASH_TIMEOUT,
+        'EARLY_TOOL_DISPATCH': EARLY_TOOL_DISPATCH,
+        'IMAGE_TOKEN_BUDGET': IMAGE_TOKEN_BUDGET,
+        'IMAGE_AUTO_CROP': IMAGE_AUTO_CROP,
+        'IMAGE_FORMAT': IMAGE_FORMAT,
+        'IMAGE_JPEG_QUALITY': IMAGE_JPEG_QUALITY,
+        'ROUTER_ENABLED': ROUTER_ENABLED,
+        'ROUTER_LIGHT_MODEL': ROUTER_LIGHT_MODEL,
+        'ROUTER_MAX_RESULT_TOKENS': ROUTER_MAX_RESULT_TOKENS,
+        'ROUTER_MAX_OUTPUT_TOKENS': ROUTER_MAX_OUTPUT_TOKENS,
+        'ROUTER_ERROR_COOLDOWN': ROUTER_ERROR_COOLDOWN,
+        'ROUTER_MAIN_ONLY_TOOLS': ROUTER_MAIN_ONLY_TOOLS,
         'LOGS_DIR': str(LOGS_DIR),
         'PROJECT_DIR': str(PROJECT_DIR) if PROJECT_DIR else "",
         'PROMPTS_DIR': str(PROMPTS_DIR),
     }
-    with open(CACHE_DIR / 'constants.json', 'w') as f:
-        json.dump(constants, f, indent=4)
+    return constants
+
+
+# Constants live in memory: loaded once, then changed by set_constant(), which is the
+# only thing that rewrites constants.json. A session scope (constants_scope) overlays
+# its own values, so several projects can run in one process without sharing PROJECT_DIR.
+_store = None
+_store_lock = threading.RLock()
+_session_constants: ContextVar = ContextVar("session_constants", default=None)
+PATH_SUFFIXES = ('_DIR', '_FILE', '_PATH')
+
+
+def _constants():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = {}
+                try:
+                    with open(CACHE_DIR / 'constants.json', 'r') as f:
+                        store.update(json.load(f))
+                except (FileNotFoundError, json.JSONDecodeError):
+                    pass
+                # The module globals win, as they did when every lookup rewrote the file
+                store.update(_default_constants())
+                _store = store
+    return _store
+
+
+def _persist():
+    """Atomically replace constants.json with the process-wide constants."""
+    path = CACHE_DIR / 'constants.json'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".constants.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(_constants(), f, indent=4)
+    os.replace(tmp, path)
+
+
+# function to write the constants to a file
+def write_constants_to_file():
+    with _store_lock:
+        _constants().update(_default_constants())
+        _persist()
 
 def get_constants():
-    with open(CACHE_DIR / 'constants.json', 'r') as f:
-        constants = json.load(f)
+    constants = dict(_constants())
+    constants.update(_session_constants.get() or {})
     return constants
 
-# function to load the constants from a file
+# function to load the constants (from memory; constants.json is only read once)
 def load_constants():
-    try:
-        with open(CACHE_DIR / 'constants.json', 'r') as f:
-            constants = json.load(f)
-        return constants
-    except FileNotFoundError:
-        return None
+    return get_constants()
 
 # get a constant by name
 def get_constant(name):
-    write_constants_to_file()
-    constants = load_constants()
-    if constants:
-        return_constant = constants.get(name)
-        # if return_constant contains PATH, DIR or FILE then return as Path
-        if return_constant and ('PATH' in return_constant or 'DIR' in return_constant or 'FILE' in return_constant):
-            return Path(return_constant)
-        else:
-            return(return_constant)
+    session = _session_constants.get()
+    if session and name in session:
+        return_constant = session[name]
     else:
-        return None
+        return_constant = _constants().get(name)
+    # _DIR, _FILE and _PATH constants are returned as Path
+    if return_constant and isinstance(return_constant, str) and name.endswith(PATH_SUFFIXES):
+        return Path(return_constant)
+    return return_constant
 
-# function to set a constant
+# function to set a constant; inside constants_scope() it only changes that session
 def set_constant(name, value):
-    constants = load_constants()
-    if constants:
-        # Convert Path objects to strings for JSON serialization
-        if isinstance(value, Path):
-            constants[name] = str(value)
-        else:
-            constants[name] = value
-        with open(CACHE_DIR / 'constants.json', 'w') as f:
-            json.dump(constants, f, indent=4)
-            return True
-    else:
-        return False
+    # Convert Path objects to strings for JSON serialization
+    if isinstance(value, Path):
+        value = str(value)
+    session = _session_constants.get()
+    if session is not None:
+        session[name] = value
+        return True
+    with _store_lock:
+        _constants()[name] = value
+        _persist()
+    return True
+
+@contextmanager
+def constants_scope(**overrides):
+    """Give the current task (and the tasks and threads it starts) its own constants.
+
+    Values set with set_constant() or set_project_dir() inside the scope are seen only
+    by code running in it and are not written to constants.json. Each asyncio task has
+    its own copy of the context, so concurrent sessions can each open a scope:
+
+        async def run_session(...):
+            with constants_scope():
+                set_project_dir(name)
+                await sampling_loop(...)
+    """
+    session = dict(_session_constants.get() or {})
+    session.update({name: str(value) if isinstance(value, Path) else value for name, value in overrides.items()})
+    token = _session_constants.set(session)
+    try:
+        yield session
+    finally:
+        _session_constants.reset(token)
 
 # function to set the project directory
 def set_project_dir(new_dir):
     global PROJECT_DIR, LLM_GEN_CODE_DIR
-    PROJECT_DIR = REPO_DIR / new_dir
-    LLM_GEN_CODE_DIR = PROJECT_DIR / 'llm_gen_code'
-    set_constant('PROJECT_DIR', str(PROJECT_DIR))
-    set_constant('LLM_GEN_CODE_DIR', str(LLM_GEN_CODE_DIR))
-    return PROJECT_DIR
+    project_dir = REPO_DIR / new_dir
+    llm_gen_code_dir = project_dir / 'llm_gen_code'
+    if _session_constants.get() is None:
+        PROJECT_DIR = project_dir
+        LLM_GEN_CODE_DIR = llm_gen_code_dir
+    set_constant('PROJECT_DIR', str(project_dir))
+    set_constant('LLM_GEN_CODE_DIR', str(llm_gen_code_dir))
+    return project_dir
 
 # function to get the project directory
 def get_project_dir():
+    if _session_constants.get() is not None:
+        return get_constant('PROJECT_DIR') or None
     return PROJECT_DIR
@@ -6,7 +6,8 @@ from datetime import datetime
 import json
 
 # Remove the following line to prevent circular import
-from config import TOP_LEVEL_DIR, REPO_DIR, JOURNAL_DIR, JOURNAL_FILE, JOURNAL_ARCHIVE_FILE, JOURNAL_SYSTEM_PROMPT_FILE, SYSTEM_PROMPT_DIR, SYSTEM_PROMPT_FILE, SCRIPTS_DIR, LOGS_DIR, TESTS_DIR
+from config import TOP_LEVEL_DIR, REPO_DIR, JOURNAL_DIR, JOURNAL_FILE, JOURNAL_ARCHIVE_FILE, JOURNAL_SYSTEM_PROMPT_FILE, SYSTEM_PROMPT_DIR, SYSTEM_PROMPT_FILE, SCRIPTS_DIR, LOGS_DIR, TESTS_DIR, DEBUG_LOG_FILE
+from utils.debug_log import install_debug_log
 
 # Get the directory where this script is located
 
@@ -20,7 +21,7 @@ except Exception as e:
 MAX_SUMMARY_MESSAGES = 20
 MAX_SUMMARY_TOKENS = 6000
 WORKER_DIR = TOP_LEVEL_DIR
-ICECREAM_OUTPUT_FILE =  WORKER_DIR / "debug_log.json"
+ICECREAM_OUTPUT_FILE = DEBUG_LOG_FILE
 COMPUTER_USE_BETA_FLAG = "computer-use-2024-10-22"
 PROMPT_CACHING_BETA_FLAG = "prompt-caching-2024-07-31"
 JOURNAL_MODEL = "claude-3-5-haiku-latest"
@@ -42,75 +43,38 @@ def update_project_dir(new_dir):
 # Create necessary directories
 JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
 
-# Load journal system prompt
-try:
-    with open(JOURNAL_SYSTEM_PROMPT_FILE, 'r', encoding="utf-8") as f:
-        JOURNAL_SYSTEM_PROMPT = f.read()
-except FileNotFoundError:
-    JOURNAL_SYSTEM_PROMPT = ""
-    print(f"Warning: Journal system prompt file not found at {JOURNAL_SYSTEM_PROMPT_FILE}")
+def _read_prompt(name, label):
+    # Imported here: utils imports tools, which import this module
+    from utils.prompt_registry import get_prompts
 
-# Load system prompt
-try:
-    with open(SYSTEM_PROMPT_FILE, 'r', encoding="utf-8") as f:
-        SYSTEM_PROMPT = f.read()
-except FileNotFoundError:
-    SYSTEM_PROMPT = ""
-    print(f"Warning: System prompt file not found at {SYSTEM_PROMPT_FILE}")
+    try:
+        return get_prompts().get(name).text
+    except FileNotFoundError as e:
+        print(f"Warning: {label} file not found: {e}")
+        raise
+
+# SYSTEM_PROMPT and JOURNAL_SYSTEM_PROMPT come from the prompt registry, which re-reads
+# the files only when they change
+def __getattr__(name):
+    if name == "SYSTEM_PROMPT":
+        return _read_prompt("system", "System prompt")
+    if name == "JOURNAL_SYSTEM_PROMPT":
+        return _read_prompt("journal", "Journal system prompt")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def reload_prompts():
-    global SYSTEM_PROMPT
-    global JOURNAL_SYSTEM_PROMPT
-    try:
-        with open(SYSTEM_PROMPT_FILE, 'r', encoding="utf-8") as f:
-            SYSTEM_PROMPT = f.read()
-    except FileNotFoundError:
-        print(f"Warning: System prompt file not found at {SYSTEM_PROMPT_FILE}")
-    try:
-        with open(JOURNAL_SYSTEM_PROMPT_FILE, 'r', encoding="utf-8") as f:
-            JOURNAL_SYSTEM_PROMPT = f.read()
-    except FileNotFoundError:
-        print(f"Warning: Journal system prompt file not found at {JOURNAL_SYSTEM_PROMPT_FILE}")
-
-
-def write_to_file(s: str, file_path: str = ICECREAM_OUTPUT_FILE):
-    """Write debug output to a file, formatting JSON content in a pretty way."""
-    lines = s.split('\n')
-    formatted_lines = []
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-
-    for line in lines:
-        if "tool_input:" in line:
-            try:
-                ic(line)
-                # Extract JSON part from the line
-                json_part = line.split("tool_input: ")[1]
-                # Check if it looks like a JSON object
-                if json_part.strip().startswith('{') and json_part.strip().endswith('}'):
-                    # Parse and pretty-print the JSON
-                    json_obj = json.loads(json_part)
-                    pretty_json = json.dumps(json_obj, indent=4)
-                    formatted_lines.append(f" tool_input: " + pretty_json)
-                else:
-                   formatted_lines.append(line)
-            except (IndexError, json.JSONDecodeError):
-                # If parsing fails, just append the original line
-                formatted_lines.append(line)
-        else:
-            formatted_lines.append(line)
-    with open(file_path, 'a', encoding="utf-8") as f:
-        f.write(f"{timestamp} ")
-        f.write('\n'.join(formatted_lines))
-        f.write('\n' + '-' * 80 + '\n')
-
-ic.configureOutput(includeContext=True, outputFunction=write_to_file)
+    return _read_prompt("system", "System prompt"), _read_prompt("journal", "Journal system prompt")
+
+
+# ic() output is buffered and written to DEBUG_LOG_FILE by a background thread
+install_debug_log()
 
 def update_paths(new_prompt_name):
     logs_dir = LOGS_DIR
     global PROMPT_NAME
     PROMPT_NAME = new_prompt_name
     return {
-        'ICECREAM_OUTPUT_FILE': logs_dir / "debug_log.json",
+        'ICECREAM_OUTPUT_FILE': DEBUG_LOG_FILE,
         'JOURNAL_FILE': logs_dir / "journal/journal.log",
         'JOURNAL_ARCHIVE_FILE': logs_dir / "journal/journal.log.archive", 
         'SUMMARY_FILE': logs_dir / "summaries/summary.md",
@@ -120,15 +84,7 @@ def update_paths(new_prompt_name):
     }
 
 def load_system_prompts():
-    paths = update_paths()
-    try:
-        with open(paths['SYSTEM_PROMPT_FILE'], 'r', encoding="utf-8") as f:
-            SYSTEM_PROMPT = f.read()
-        with open(paths['JOURNAL_SYSTEM_PROMPT_FILE'], 'r', encoding="utf-8") as f:
-            JOURNAL_SYSTEM_PROMPT = f.read()
-        return SYSTEM_PROMPT, JOURNAL_SYSTEM_PROMPT
-    except FileNotFoundError as e:
-        raise Exception(f"Failed to load system prompts: {e}")
+    return reload_prompts()
 
 # def write_constants_to_file():
 #     constants = {
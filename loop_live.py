@@ -1,85 +1,94 @@
+import argparse
 import asyncio
-import base64
 import hashlib
 import json
 import os
-from datetime import datetime
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from re import U
-from typing import Any, Callable, Dict, List, Optional, cast
-from config import *
-write_constants_to_file()
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import ftfy
-from anthropic import Anthropic, APIResponse
+from anthropic import AsyncAnthropic
+from anthropic.types import Message
 from anthropic.types.beta import (
-    BetaCacheControlEphemeralParam,
-    BetaContentBlock,
+    BetaMessage,
     BetaMessageParam,
-    BetaTextBlockParam,
     BetaToolResultBlockParam,
+    BetaUsage,
 )
 from dotenv import load_dotenv
 from icecream import ic, install
 from rich import print as rr
-from rich.prompt import Prompt, Confirm
+from rich.prompt import Prompt
 # from load_constants import SYSTEM_PROMPT, BASH_PROMPT_FILE
+from config import (
+    COMPUTER_USE_BETA_FLAG,
+    JOURNAL_FILE,
+    MAIN_MODEL,
+    MAX_SUMMARY_TOKENS,
+    METRICS_PORT,
+    PACING_MODE,
+    PROMPT_CACHING_BETA_FLAG,
+    PROMPTS_DIR,
+    ROUTER_ENABLED,
+    SUMMARY_MODEL,
+    set_constant,
+    set_project_dir,
+)
 from tools import (
-    BashTool,
-    EditTool,
-    GetExpertOpinionTool,
     ToolCollection,
     ToolResult,
-    ToolError,
-    WebNavigatorTool,
-    ProjectSetupTool
+    default_tools,
 )
+from tools.script_cache import get_script_cache
 
-# Assume AgentDisplay is defined in the same file or imported
 from rich.live import Live
-from rich.layout import Layout
-from rich.panel import Panel
 from rich.console import Console
-from rich.text import Text
-from rich import box
-from rich.table import Table
-from queue import Queue
 from utils.agent_display import AgentDisplay
 from utils.output_manager import OutputManager
+from utils.pacing import TurnPacer
+from utils.message_store import MessageStore
+from utils.compaction import ContextCompactor
+from utils.token_counter import BLOCK_OVERHEAD_TOKENS, TokenCounter
+from utils.prompt_caching import CacheBreakpointPlanner
+from utils.cassette import get_cassette
+from utils.debug_log import install_debug_log
+from utils.session_log import SessionLog
+from utils.metrics import API_FIRST_TOKEN, IDLE_SECONDS, TOKENS, TURN_SECONDS, TURNS, USER_WAIT_SECONDS, MetricsExporter
+from utils.tracing import span
+from utils.images import ImageIndex, ImagePipeline
+from utils.model_router import ModelRouter
+from utils.prompt_registry import get_prompts
+from utils.request_scheduler import PRIORITY_MAIN, PRIORITY_SUMMARY, RequestScheduler, get_scheduler
 load_dotenv()
 install()
 
-ICECREAM_OUTPUT_FILE = Path.cwd() / "debug_log.json"
-
-with open(SYSTEM_PROMPT_FILE, 'r', encoding="utf-8") as f:
-    SYSTEM_PROMPT = f.read()
+SYSTEM_PROMPT = get_prompts().text("system")
 
 filename = ""
 
-def write_to_file(s: str, file_path: str = ICECREAM_OUTPUT_FILE):
-    lines = s.split('\n')
-    formatted_lines = []
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-
-    for line in lines:
-        if "tool_input:" in line:
-            try:
-                ic(line)
-                json_part = line.split("tool_input: ")[1]
-                if json_part.strip().startswith('{') and json_part.strip().endswith('}'):
-                    json_obj = json.loads(json_part)
-                    pretty_json = json.dumps(json_obj, indent=4)
-                    formatted_lines.append("tool_input: " + pretty_json)
-                else:
-                   formatted_lines.append(line)
-            except (IndexError, json.JSONDecodeError):
-                formatted_lines.append(line)
-        else:
-            formatted_lines.append(line)
-    with open(file_path, 'a', encoding="utf-8") as f:
-        f.write('\n'.join(formatted_lines))
-        f.write('\n' + '-' * 80 + '\n')
-ic.configureOutput(includeContext=True, outputFunction=write_to_file)
+# ic() output goes to the buffered debug log (utils/debug_log.py)
+install_debug_log()
+
+
+def _prepare_tool_images(pipeline: ImagePipeline, results: List[ToolResult]) -> List[ToolResult]:
+    """Crop, scale and recompress the screenshots in ``results`` before they are sent."""
+    prepared = []
+    for result in results:
+        if isinstance(result, ToolResult) and result.base64_image:
+            image = pipeline.prepare(result.base64_image, result.media_type or "image/png")
+            result = result.replace(base64_image=image.data, media_type=image.media_type)
+        prepared.append(result)
+    return prepared
+
+def _legacy_echo_tokens(token_counter: TokenCounter, tool_use: Dict, tool_result: Dict) -> int:
+    """Tokens the old encoding spent repeating a call and its output in a text block."""
+    echo = {
+        "type": "text",
+        "text": f"Tool '{tool_use['name']}' was called with input: {json.dumps(tool_use['input'])}.\nResult: {_extract_text_from_content([tool_result])}",
+    }
+    return token_counter.count_block(echo)
 
 
 def _make_api_tool_result(result: ToolResult, tool_use_id: str) -> Dict:
@@ -99,17 +108,24 @@ def _make_api_tool_result(result: ToolResult, tool_use_id: str) -> Dict:
             "type": "text", 
             "text": result
         })
-    elif hasattr(result, 'output') and result.output:
-        tool_result_content.append({
-            "type": "text", 
-            "text": result.output
-        })
-        if hasattr(result, 'base64_image') and result.base64_image:
+    else:
+        if getattr(result, 'output', None):
+            tool_result_content.append({
+                "type": "text", 
+                "text": result.output
+            })
+        if getattr(result, 'error', None):
+            is_error = True
+            tool_result_content.append({
+                "type": "text",
+                "text": result.error
+            })
+        if getattr(result, 'base64_image', None):
             tool_result_content.append({
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/png",
+                    "media_type": getattr(result, "media_type", None) or "image/png",
                     "data": result.base64_image,
                 }
             })
@@ -123,8 +139,32 @@ def _make_api_tool_result(result: ToolResult, tool_use_id: str) -> Dict:
 
 
 
+@dataclass
+class SessionStats:
+    """What one sampling_loop session did; filled in when the loop ends."""
+
+    turns: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_tokens: int = 0
+    cache_read_tokens: int = 0
+    image_tokens_saved: int = 0
+    exit_reason: str = ""
+    # Per-model turns, tokens, latency and cost when model routing is on
+    models: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    def record(self, tracker: "TokenTracker", exit_reason: str):
+        # Includes the turns of a resumed session's earlier runs, like the token totals
+        self.turns = tracker.turns
+        self.input_tokens = tracker.total_input
+        self.output_tokens = tracker.total_output
+        self.cache_creation_tokens = tracker.total_cache_creation
+        self.cache_read_tokens = tracker.total_cache_retrieval
+        self.exit_reason = exit_reason
+
+
 class TokenTracker:
-    def __init__(self, display: AgentDisplay):
+    def __init__(self, display: AgentDisplay, token_counter: Optional[TokenCounter] = None):
         self.total_cache_creation = 0
         self.total_cache_retrieval = 0
         self.total_input = 0
@@ -134,17 +174,87 @@ class TokenTracker:
         self.recent_input = 0
         self.recent_output = 0
         self.displayA = display
-
-    def update(self, response):
-        self.recent_cache_creation = response.usage.cache_creation_input_tokens
-        self.recent_cache_retrieval = response.usage.cache_read_input_tokens
-        self.recent_input = response.usage.input_tokens
-        self.recent_output = response.usage.output_tokens
+        self.token_counter = token_counter
+        self.estimated_prompt = 0
+        self.turns = 0
+        # Tokens the compact tool-result encoding keeps out of every request
+        self._dedup_savings: List[tuple] = []
+        self.dedup_saved_per_request = 0
+        self.total_dedup_saved = 0
+        self._dedup_since_update = 0
+
+    @staticmethod
+    def _hit_ratio(read: int, creation: int, uncached: int) -> float:
+        """Share of the prompt that was read from the cache."""
+        prompt = read + creation + uncached
+        return read / prompt if prompt else 0.0
+
+    @property
+    def recent_cache_hit_ratio(self) -> float:
+        return self._hit_ratio(self.recent_cache_retrieval, self.recent_cache_creation, self.recent_input)
+
+    @property
+    def total_cache_hit_ratio(self) -> float:
+        return self._hit_ratio(self.total_cache_retrieval, self.total_cache_creation, self.total_input)
+
+    def record_dedup_saving(self, message: BetaMessageParam, tokens: int):
+        """Note that ``message`` is ``tokens`` smaller than the old duplicated encoding."""
+        self._dedup_savings.append((message, tokens))
+        self.dedup_saved_per_request += tokens
+        self._dedup_since_update += tokens
+
+    def prune_dedup_savings(self, messages: List[BetaMessageParam]):
+        """Stop counting savings for messages that were compacted out of the history."""
+        live = {id(message) for message in messages}
+        self._dedup_savings = [(m, t) for m, t in self._dedup_savings if id(m) in live]
+        self.dedup_saved_per_request = sum(t for _, t in self._dedup_savings)
+
+    def _add_usage(self, usage):
+        self.recent_cache_creation = usage.cache_creation_input_tokens or 0
+        self.recent_cache_retrieval = usage.cache_read_input_tokens or 0
+        self.recent_input = usage.input_tokens
+        self.recent_output = usage.output_tokens
         
         self.total_cache_creation += self.recent_cache_creation
         self.total_cache_retrieval += self.recent_cache_retrieval
         self.total_input += self.recent_input
         self.total_output += self.recent_output
+        self.turns += 1
+
+    def restore(self, usages: List[Dict]):
+        """Rebuild the totals from usage records saved by a session log."""
+        for usage in usages:
+            self._add_usage(BetaUsage.model_validate(usage))
+
+    def record_discarded(self, response):
+        """Add the usage of a response that was thrown away (an escalated light-model
+        turn) to the totals, without counting it as a turn."""
+        usage = response.usage
+        self.total_cache_creation += usage.cache_creation_input_tokens or 0
+        self.total_cache_retrieval += usage.cache_read_input_tokens or 0
+        self.total_input += usage.input_tokens
+        self.total_output += usage.output_tokens
+        TOKENS.inc(usage.input_tokens, kind="input")
+        TOKENS.inc(usage.output_tokens, kind="output")
+        TOKENS.inc(usage.cache_creation_input_tokens or 0, kind="cache_creation")
+        TOKENS.inc(usage.cache_read_input_tokens or 0, kind="cache_read")
+
+    def update(self, response):
+        self._add_usage(response.usage)
+        TURNS.inc()
+        TOKENS.inc(self.recent_input, kind="input")
+        TOKENS.inc(self.recent_output, kind="output")
+        TOKENS.inc(self.recent_cache_creation, kind="cache_creation")
+        TOKENS.inc(self.recent_cache_retrieval, kind="cache_read")
+        # Results recorded during this turn were not part of the request that produced it
+        self.total_dedup_saved += self.dedup_saved_per_request - self._dedup_since_update
+        self._dedup_since_update = 0
+        ic(f"Cache hit ratio: turn {self.recent_cache_hit_ratio:.1%}, session {self.total_cache_hit_ratio:.1%}")
+
+        # Feed the real numbers back into the local estimator
+        if self.token_counter:
+            self.estimated_prompt = self.token_counter.last_prompt_estimate
+            self.token_counter.calibrate(response.usage)
 
     def display(self):
         """Display token usage with Rich formatting."""
@@ -155,6 +265,8 @@ class TokenTracker:
             f"[yellow]Recent Cache Retrieval:[/yellow] {self.recent_cache_retrieval:,}",
             f"[yellow]Recent Input:[/yellow] {self.recent_input:,}",
             f"[yellow]Recent Output:[/yellow] {self.recent_output:,}",
+            f"[yellow]Recent Estimated Prompt:[/yellow] {self.estimated_prompt:,}",
+            f"[yellow]Recent Cache Hit Ratio:[/yellow] {self.recent_cache_hit_ratio:.1%}",
             f"[bold yellow]Recent Total:[/bold yellow] {self.recent_cache_creation + self.recent_cache_retrieval + self.recent_input + self.recent_output:,}",
         ]
 
@@ -165,6 +277,8 @@ class TokenTracker:
             f"[yellow]Total Cache Retrieval:[/yellow] {self.total_cache_retrieval:,}",
             f"[yellow]Total Input:[/yellow] {self.total_input:,}",
             f"[yellow]Total Output:[/yellow] {self.total_output:,}",
+            f"[yellow]Session Cache Hit Ratio:[/yellow] {self.total_cache_hit_ratio:.1%} over {self.turns} turns",
+            f"[yellow]Saved By Compact Tool Results:[/yellow] ~{self.total_dedup_saved:,}",
             f"[bold yellow]Total Tokens:[/bold yellow] {self.total_cache_creation + self.total_cache_retrieval + self.total_input + self.total_output:,}",
         ]
 
@@ -174,8 +288,7 @@ class TokenTracker:
         # Send to display using system message type
         self.displayA.add_message("system", token_display)
 
-with open(JOURNAL_SYSTEM_PROMPT_FILE, 'r', encoding="utf-8") as f:
-    JOURNAL_SYSTEM_PROMPT = f.read()
+JOURNAL_SYSTEM_PROMPT = get_prompts().text("journal")
 
 
 def _extract_text_from_content(content: Any) -> str:
@@ -202,72 +315,149 @@ def get_journal_contents() -> str:
     except FileNotFoundError:
         return "No journal entries yet."
 
-def truncate_message_content(content: Any, max_length: int = 20000) -> Any:
-    if isinstance(content, str):
-        return content[:max_length]
-    elif isinstance(content, list):
-        return [truncate_message_content(item, max_length) for item in content]
-    elif isinstance(content, dict):
-        return {k: truncate_message_content(v, max_length) if k != 'source' else v
-                for k, v in content.items()}
-    return content
-
-async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key: str, max_tokens: int = 8000, display: AgentDisplay) -> List[BetaMessageParam]:
-    """Main loop for agentic sampling."""
+async def _stream_model_response(scheduler: RequestScheduler, display: AgentDisplay, estimated_tokens: int = 0, on_tool_use: Optional[Callable[[Dict], Any]] = None, **request_params) -> BetaMessage:
+    """Stream a model response, forwarding text to the display as it is generated.
+
+    The request goes through the scheduler ahead of any queued background call;
+    estimated_tokens is checked against the remaining input token budget.
+    on_tool_use is called with each tool_use block as soon as it has streamed.
+
+    Returns the final accumulated message, which has the same shape as the result of
+    a non-streaming ``beta.messages.create`` call.
+    """
+    timing: Dict[str, float] = {}
+
+    async def stream_once(client: AsyncAnthropic) -> BetaMessage:
+        started = time.perf_counter()
+        timing.pop("first_token", None)
+        async with client.beta.messages.stream(**request_params) as stream:
+            async for event in stream:
+                if "first_token" not in timing:
+                    timing["first_token"] = time.perf_counter()
+                    API_FIRST_TOKEN.observe(timing["first_token"] - started)
+                if event.type == "content_block_start" and event.content_block.type == "text":
+                    display.add_message("assistant_stream", "")
+                elif event.type == "text":
+                    display.add_message("assistant_delta", event.text)
+                elif event.type == "content_block_stop" and on_tool_use and event.content_block.type == "tool_use":
+                    block = event.content_block
+                    on_tool_use({"type": "tool_use", "name": block.name, "id": block.id, "input": block.input})
+            return await stream.get_final_message()
+
+    async def fetch() -> BetaMessage:
+        return await scheduler.submit(stream_once, PRIORITY_MAIN, tokens=estimated_tokens)
+
+    def show_replayed(message: BetaMessage):
+        for block in message.content:
+            if block.type == "text":
+                display.add_message("assistant_stream", "")
+                display.add_message("assistant_delta", block.text)
+
+    with span("llm.main", model=request_params.get("model"), tokens=estimated_tokens):
+        return await get_cassette().call(
+            "main", request_params, fetch, BetaMessage, on_replay=show_replayed, timing=timing
+        )
+
+async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key: str, max_tokens: int = 8000, display: AgentDisplay, pacing_mode: str = PACING_MODE, ask_user: Optional[Callable[[], Optional[str]]] = None, max_turns: Optional[int] = None, stats: Optional[SessionStats] = None, session_log: Optional[SessionLog] = None, routing: bool = ROUTER_ENABLED) -> List[BetaMessageParam]:
+    """Main loop for agentic sampling.
+
+    pacing_mode is "interactive" (wait for the display between steps) or "throughput"
+    (no artificial delay); see utils.pacing.TurnPacer.
+    ask_user replaces the interactive prompt when the model stops calling tools; it
+    returns the next user message, or None to end the loop.
+    max_turns ends the loop after that many model requests. If stats is given it is
+    filled in with the turn count, token totals and exit reason when the loop ends.
+    session_log (utils.session_log.SessionLog) records the session as it runs; if it
+    was resumed, the token totals and cache breakpoints of the old process are restored.
+    routing sends light follow-up turns to a cheaper model (utils.model_router.ModelRouter).
+    """
     # ic(messages)
     try:
-        tool_collection = ToolCollection(
-            BashTool(display=display),
-            EditTool(),
-            GetExpertOpinionTool(),
-            WebNavigatorTool(),
-            ProjectSetupTool()
-        )
+        # Each tool's module is imported the first time the model calls it
+        tool_collection = ToolCollection(*default_tools(display))
         # ic(tool_collection)
         display.add_message("system", tool_collection.get_tool_names_as_string())
-        system = BetaTextBlockParam(type="text", text=SYSTEM_PROMPT_FILE)
+        # The system prompt is pinned for the session: editing the file mid-session
+        # would change the cached prefix of every request that follows
+        prompts = get_prompts()
+        system_prompt = prompts.get("system")
+        system = [{"type": "text", "text": system_prompt.text}]
         output_manager = OutputManager(display)
-        client = Anthropic(api_key=api_key)
+        scheduler = get_scheduler(api_key)
         i = 0
         running = True
-        token_tracker = TokenTracker(display)
+        exit_reason = "user_exit"
+        token_counter = TokenCounter()
+        token_tracker = TokenTracker(display, token_counter)
+        pacer = TurnPacer(display, mode=pacing_mode)
+        summarizer = BackgroundSummarizer(display, scheduler)
+        message_store = MessageStore(token_counter=token_counter)
+        compactor = ContextCompactor(scheduler, display, token_counter=token_counter)
+        cache_planner = CacheBreakpointPlanner(MAIN_MODEL, token_counter)
+        router = ModelRouter(enabled=routing, token_counter=token_counter)
+        if session_log and session_log.restored:
+            # Same breakpoints as before the restart, so the first request reads the old cache
+            token_tracker.restore(session_log.restored.usage)
+            cache_planner.restore(messages, session_log.restored.cache_breakpoints, message_store)
         enable_prompt_caching = True
         betas = [COMPUTER_USE_BETA_FLAG, PROMPT_CACHING_BETA_FLAG]
         image_truncation_threshold = 1
         only_n_most_recent_images = 2
+        image_index = ImageIndex()
+        image_pipeline = ImagePipeline()
         while running:
-            await asyncio.sleep(0.1)  # Smal
-
-
+            pacer.begin_turn()
             i+=1
-            if enable_prompt_caching:
-                _inject_prompt_caching(messages)
-                image_truncation_threshold = 1
-                system=[
-                            {
-                                "type": "text",
-                                "text": SYSTEM_PROMPT,
-                                "cache_control": {"type": "ephemeral"}
-                            },
-                        ]
-
-            if only_n_most_recent_images:
-                _maybe_filter_to_n_most_recent_images(
-                    messages,
-                    only_n_most_recent_images,
-                    min_removal_threshold=image_truncation_threshold,
-                )
-
+            # Finished in the finally below (whatever fails in the turn); every span of
+            # this turn nests under it
+            turn_span = span("turn", turn=i, messages=len(messages)).start()
+            dispatch = None
             try:
-                tool_collection.to_params()
+                # Applies a finished background summary and starts the next one ahead of the budget
+                with span("compaction.check"):
+                    if compactor.maybe_compact(messages, message_store):
+                        token_tracker.prune_dedup_savings(messages)
+                if session_log:
+                    with span("session_log.sync"):
+                        session_log.sync(messages)
+                tools = tool_collection.to_params(cache=False)
+                if enable_prompt_caching:
+                    # Breakpoints go where they maximize reuse of the previous turn's cache
+                    prompts.check_pinned(system_prompt)
+                    system = [{"type": "text", "text": system_prompt.text}]
+                    with span("prepare.cache_plan"):
+                        cache_plan = cache_planner.plan(messages, system=system, tools=tools)
+                        cache_planner.apply(messages, cache_plan, message_store)
+                    if session_log:
+                        session_log.cache_plan(cache_planner.applied)
+                    ic(str(cache_plan))
+                    image_truncation_threshold = 1
+                    if cache_plan.system:
+                        system[0]["cache_control"] = {"type": "ephemeral"}
+                    if cache_plan.tools:
+                        tools = tool_collection.to_params(cache=True)
+
+                if only_n_most_recent_images:
+                    with span("prepare.images"):
+                        # Only messages appended since the last turn are scanned for images
+                        image_index.enforce(
+                            messages,
+                            only_n_most_recent_images,
+                            min_removal_threshold=image_truncation_threshold,
+                            store=message_store,
+                        )
 
                 # ic(messages)
 
-                truncated_messages = [
-                    {"role": msg["role"], "content": truncate_message_content(msg["content"])}
-                    for msg in messages
-                ]
-                await asyncio.sleep(0.2)
+                # Only messages appended or changed since the last turn are truncated again
+                with span("prepare.messages"):
+                    truncated_messages = message_store.prepare(messages)
+                with span("prepare.count_tokens") as count_span:
+                    # Sized on what is sent: calibrate() compares this with the billed input,
+                    # so counting the untruncated history would skew the scale
+                    prompt_tokens = token_counter.prompt_size(truncated_messages, system=system, tools=tools)
+                    count_span.set(tokens=prompt_tokens)
+                ic(f"Estimated prompt size: {prompt_tokens:,} tokens")
                 # display.live.stop()  # Stop the live display
                 # # Ask user if they are done reviewing the info using rich's Confirm.ask
                 # while Confirm.ask("Do you need more time?", default=True):
@@ -318,18 +508,49 @@ async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key
 
                     
                     display.add_message("user", display_output)
-                    await asyncio.sleep(delay=0.5)
-                quick_summary = await summarize_recent_messages(messages[-4:], display)
-                display.add_message("assistant", f"Here is a quick summary of what I did:\n {quick_summary}")
-                await asyncio.sleep(0.2)
-                response = client.beta.messages.create(
+                    await pacer.settle_display()
+                summarizer.schedule(messages)
+                with span("route") as route_span:
+                    decision = router.choose(
+                        messages, prompt_tokens, cache_prefix=cache_plan.cached_prefix if enable_prompt_caching else 0
+                    )
+                    route_span.set(model=decision.model, reason=decision.reason)
+                request_params = dict(
                     max_tokens=MAX_SUMMARY_TOKENS,
                     messages=truncated_messages,
-                    model=MAIN_MODEL,
                     system=system,
-                    tools=tool_collection.to_params(),
+                    tools=tools,
                     betas=betas,
                 )
+                # Safe tool calls start while the rest of the response is still streaming
+                dispatch = tool_collection.dispatch()
+                requested_at = time.perf_counter()
+                try:
+                    response = await _stream_model_response(
+                        scheduler, display, estimated_tokens=prompt_tokens, on_tool_use=dispatch.add, model=decision.model,
+                        **router.request_for(decision, request_params)
+                    )
+                    escalation = router.check(decision, response)
+                except Exception as e:
+                    if not decision.light:
+                        raise
+                    ic(f"Light model request failed: {e}")
+                    escalation = "error"
+                if escalation:
+                    if escalation != "error":
+                        router.record(decision, response, time.perf_counter() - requested_at)
+                        # The discarded answer was still billed
+                        token_tracker.record_discarded(response)
+                    decision = router.escalate(decision, escalation)
+                    display.add_message("system", f"Re-running this turn on {decision.model} ({escalation})")
+                    # Calls started early from the discarded answer belong to it, not to the re-run
+                    dispatch.cancel()
+                    dispatch = tool_collection.dispatch()
+                    requested_at = time.perf_counter()
+                    response = await _stream_model_response(
+                        scheduler, display, estimated_tokens=prompt_tokens, on_tool_use=dispatch.add, model=decision.model, **request_params
+                    )
+                router.record(decision, response, time.perf_counter() - requested_at)
                 if len(messages) < 2:
                     display.clear_messages("all")
 
@@ -343,8 +564,8 @@ async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key
                 for block in response.content:
                     if hasattr(block, 'text'):
                         # output_manager.format_api_response(response)
+                        # Text was already streamed to the display by _stream_model_response
                         response_params.append({"type": "text", "text": block.text})
-                        display.add_message("assistant", block.text) # Update display
                     elif getattr(block, 'type', None) == "tool_use":
                         response_params.append({
                             "type": "tool_use",
@@ -355,75 +576,62 @@ async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key
                 messages.append({"role": "assistant", "content": response_params})
 
                 tool_result_content: List[BetaToolResultBlockParam] = []
+                tool_uses = []
                 for content_block in response_params:
                     output_manager.format_content_block(content_block)
                     if content_block["type"] == "tool_use":
                         display.add_message("tool", f"Calling tool: {content_block['name']}")
-                        display.live.stop()
-                        await asyncio.sleep(0.5)
-                        try:
-                            ic(content_block['name'])
-                            ic(content_block["input"])
-                            result = await tool_collection.run(
-                                name=content_block["name"],
-                                tool_input=content_block["input"],
-                            )
-                            # Ensure we have a valid result
-                            if result is None:
-                                result = ToolResult(output="Tool execution failed with no result")
-                            
-                            tool_result = _make_api_tool_result(result, content_block["id"])
-                            ic(tool_result)
-                            tool_result_content.append(tool_result)
-                            
-                            tool_output = result.output if hasattr(result, 'output') else str(result)
-                            # ...existing code...
-                        except Exception as e:
-                            error_result = ToolResult(output=f"Tool execution failed: {str(e)}")
-                            tool_result = _make_api_tool_result(error_result, content_block["id"])
-                            tool_result_content.append(tool_result)
-                        display.live.start()
-                        await asyncio.sleep(10.5)
-
-                        # output_manager.format_tool_output(result, content_block["name"])
-                        tool_result = _make_api_tool_result(result, content_block["id"])
-                        ic(tool_result)
-                        tool_result_content.append(tool_result)
-                        tool_output = result.output if hasattr(result, 'output') else str(result)
-                        # display.add_message("tool", (content_block["name"], _extract_text_from_content(tool_output)))
-                        
-                        # Create a combined content list with both text and tool result
-                        combined_content = [{
-                            "type": "tool_result",
-                            "content": tool_result["content"],
-                            "tool_use_id": tool_result["tool_use_id"],
-                            "is_error": tool_result["is_error"]
-                        }]
-                        
-                        # Add descriptive text about the tool usage
-                        combined_content.append({
-                            "type": "text",
-                            "text": f"Tool '{content_block['name']}' was called with input: {json.dumps(content_block['input'])}.\nResult: {_extract_text_from_content(tool_output)}"
-                        })
-                        
-                        # Add a single message with the combined content
-                        messages.append({
-                            "role": "user",
-                            "content": combined_content
-                        })
+                        ic(content_block['name'])
+                        ic(content_block["input"])
+                        tool_uses.append(content_block)
+
+                results = []
+                if tool_uses:
+                    # Independent calls run concurrently; results come back in tool_use order
+                    async with pacer.pause_live():
+                        with span("tools", calls=len(tool_uses), started_early=dispatch.started_early):
+                            results = await tool_collection.run_many(tool_uses, dispatch=dispatch)
+                    if any(getattr(result, "base64_image", None) for result in results):
+                        with span("prepare.tool_images"):
+                            results = await asyncio.to_thread(_prepare_tool_images, image_pipeline, results)
+
+                dedup_saved = 0
+                for content_block, result in zip(tool_uses, results):
+                    # output_manager.format_tool_output(result, content_block["name"])
+                    tool_result = _make_api_tool_result(result, content_block["id"])
+                    ic(tool_result)
+                    tool_result_content.append(tool_result)
+                    dedup_saved += _legacy_echo_tokens(token_counter, content_block, tool_result)
+
+                if tool_result_content:
+                    # The old encoding also sent one user message per result
+                    dedup_saved += BLOCK_OVERHEAD_TOKENS * (len(tool_result_content) - 1)
+                    # Each output is sent once, and all results of this turn share one message
+                    tool_message: BetaMessageParam = {"role": "user", "content": tool_result_content}
+                    messages.append(tool_message)
+                    token_tracker.record_dedup_saving(tool_message, dedup_saved)
+                    if session_log:
+                        session_log.tool_calls(tool_uses, tool_result_content)
 
                 if not tool_result_content:
-                    display.live.stop()  # Stop the live display
-                    # add a small delay
-                    await asyncio.sleep(0.2)
-                    rr("\nAwaiting User Input ⌨️")
-                    task = Prompt.ask("What would you like to do next? Enter 'no' to exit")
-                    display.live.start()  # Restart the live display
-                    if task.lower() in ["no", "n"]:
+                    await pacer.settle_display()
+                    asked_at = time.perf_counter()
+                    with span("user_input"):
+                        if ask_user is not None:
+                            task = ask_user()
+                        else:
+                            async with pacer.pause_live():
+                                rr("\nAwaiting User Input ⌨️")
+                                task = Prompt.ask("What would you like to do next? Enter 'no' to exit")
+                    USER_WAIT_SECONDS.inc(time.perf_counter() - asked_at)
+                    if task is None:
                         running = False
-                    messages.append({"role": "user", "content": task})
+                        exit_reason = "completed"
+                    else:
+                        if task.lower() in ["no", "n"]:
+                            running = False
+                        messages.append({"role": "user", "content": task})
                 # display.clear_messages("user")
-                await asyncio.sleep(0.2)
                 messages_to_display = messages[-2:] if len(messages) > 1 else messages[-1:]
                 for message in messages_to_display:
                     display.add_message("tool", message["content"][0]) # Update display
@@ -442,6 +650,20 @@ async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key
                 # display.live.start()  # Restart the live display
                 # asyncio.sleep(delay=0.5)
                 token_tracker.update(response)
+                if session_log:
+                    session_log.sync(messages)
+                    session_log.usage(response.usage)
+                    with span("session_log.fsync"):
+                        session_log.end_turn()
+                turn_timing = pacer.end_turn()
+                ic(str(turn_timing))
+                TURN_SECONDS.observe(turn_timing.wall)
+                for reason, seconds in turn_timing.idle_by_reason.items():
+                    IDLE_SECONDS.inc(seconds, reason=reason)
+                ic(f"Request scheduler: {scheduler}")
+                if running and max_turns and i >= max_turns:
+                    running = False
+                    exit_reason = "max_turns"
 
 
 
@@ -455,8 +677,30 @@ async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key
                 ic(f"The error occurred at the following message: {messages[-1]} and line: {e.__traceback__.tb_lineno}")
                 ic(e.__traceback__.tb_frame.f_locals)
                 display.add_message("tool", ("Error", str(e))) # Update display with error
+                if dispatch is not None:
+                    dispatch.cancel()
+                if stats is not None:
+                    stats.record(token_tracker, f"error: {e}")
+                await summarizer.aclose()
+                await compactor.aclose()
                 raise
+            finally:
+                turn_span.finish()
+        await summarizer.aclose()
+        await compactor.aclose()
+        if stats is not None:
+            stats.record(token_tracker, exit_reason)
+            stats.image_tokens_saved = image_pipeline.tokens_saved
+            stats.models = router.stats()
         token_tracker.display()
+        display.add_message("system", pacer.report())
+        if image_pipeline.images:
+            display.add_message("system", image_pipeline.report())
+        if router.enabled:
+            display.add_message("system", router.report())
+        script_cache = get_script_cache()
+        if script_cache.lookups:
+            display.add_message("system", script_cache.report())
         return messages
 
     except Exception as e:
@@ -468,64 +712,9 @@ async def sampling_loop(*, model: str, messages: List[BetaMessageParam], api_key
         ic(f"Error initializing sampling loop: {str(e)}")
         raise
 
-def _inject_prompt_caching(messages: List[BetaMessageParam]):
-    breakpoints_remaining = 2
-    for message in reversed(messages):
-        if message["role"] == "user" and isinstance(content := message["content"], list):
-            if breakpoints_remaining:
-                breakpoints_remaining -= 1
-                content[-1]["cache_control"] = BetaCacheControlEphemeralParam(
-                    {"type": "ephemeral"}
-                )
-            else:
-                content[-1].pop("cache_control", None)
-                break
+async def summarize_recent_messages(messages: List[BetaMessageParam], display: AgentDisplay, scheduler: Optional[RequestScheduler] = None) -> str:
 
-def _maybe_filter_to_n_most_recent_images(
-    messages: List[BetaMessageParam],
-    images_to_keep: int,
-    min_removal_threshold: int
-    ):
-    if images_to_keep is None:
-        return messages
-
-    tool_result_blocks = cast(
-        List[BetaToolResultBlockParam],
-        [
-            item
-            for message in messages
-            for item in (
-                message["content"] if isinstance(message["content"], list) else []
-            )
-            if isinstance(item, dict) and item.get("type") == "tool_result"
-        ],
-    )
-
-    images_to_remove = 0
-    images_found = 0
-    for tool_result in reversed(tool_result_blocks):
-        if isinstance(tool_result.get("content"), list):
-            for content in reversed(tool_result.get("content", [])):
-                if isinstance(content, dict) and content.get("type") == "image":
-                    images_found += 1
-
-    images_to_remove = max(0, images_found - images_to_keep)
-
-    removed = 0
-    for tool_result in tool_result_blocks:
-        if isinstance(tool_result.get("content"), list):
-            new_content = []
-            for content in tool_result.get("content", []):
-                if isinstance(content, dict) and content.get("type") == "image":
-                    if removed < images_to_remove:
-                        removed += 1
-                        continue
-                new_content.append(content)
-            tool_result["content"] = new_content
-
-async def summarize_recent_messages(messages: List[BetaMessageParam], display: AgentDisplay) -> str:
-
-    sum_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    scheduler = scheduler or get_scheduler()
 
     conversation_text = ""
     for msg in messages:
@@ -564,13 +753,19 @@ async def summarize_recent_messages(messages: List[BetaMessageParam], display: A
 
     Messages to summarize:
     {conversation_text}"""
-    response = sum_client.messages.create(
-        model=SUMMARY_MODEL,
-        max_tokens=MAX_SUMMARY_TOKENS,
-        messages=[{
+    request = {
+        "model": SUMMARY_MODEL,
+        "max_tokens": MAX_SUMMARY_TOKENS,
+        "messages": [{
             "role": "user",
             "content": summary_prompt
         }]
+    }
+    response = await get_cassette().call(
+        "summary",
+        request,
+        lambda: scheduler.submit(lambda client: client.messages.create(**request), PRIORITY_SUMMARY),
+        Message,
     )
     summary = response.content[0].text
     # filter out everything from the summary that is not enclosed in the XML style tags
@@ -584,30 +779,143 @@ async def summarize_recent_messages(messages: List[BetaMessageParam], display: A
 
     return summary
 
-async def run_sampling_loop(task: str, display: AgentDisplay) -> List[BetaMessageParam]:
-    """Run the sampling loop with clean output handling."""
+def _fingerprint_messages(messages: List[BetaMessageParam]) -> str:
+    """Hash messages while ignoring cache_control markers, which move every turn."""
+    def _strip(value):
+        if isinstance(value, dict):
+            return {k: _strip(v) for k, v in value.items() if k != "cache_control"}
+        if isinstance(value, list):
+            return [_strip(v) for v in value]
+        return value
+    payload = json.dumps(_strip(messages), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class BackgroundSummarizer:
+    """Produces the quick "what I did" summary without holding up the next model request.
+
+    schedule() returns immediately. The summary request runs in a background task after a
+    short debounce, so a burst of turns only produces one request, and it is skipped when
+    the recent messages hash the same as the last summary. The result is delivered to
+    the display whenever it arrives.
+    """
+
+    def __init__(self, display: AgentDisplay, scheduler: RequestScheduler, window: int = 4, debounce: float = 1.0):
+        self.display = display
+        self.scheduler = scheduler
+        self.window = window
+        self.debounce = debounce
+        self._last_fingerprint = None
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, messages: List[BetaMessageParam]):
+        recent = list(messages[-self.window:])
+        fingerprint = _fingerprint_messages(recent)
+        if fingerprint == self._last_fingerprint:
+            return
+        self._last_fingerprint = fingerprint
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self._task = asyncio.create_task(self._summarize(recent))
+
+    async def _summarize(self, recent: List[BetaMessageParam]):
+        try:
+            await asyncio.sleep(self.debounce)
+            with span("summary", messages=len(recent)):
+                quick_summary = await summarize_recent_messages(recent, self.display, scheduler=self.scheduler)
+            self.display.add_message("assistant", f"Here is a quick summary of what I did:\n {quick_summary}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Summaries are cosmetic, never let them break the loop
+            ic(f"Background summary failed: {e}")
+
+    async def aclose(self):
+        """Cancel any summary that has not been delivered yet."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+async def run_sampling_loop(task: Optional[str], display: AgentDisplay, history: Optional[List[BetaMessageParam]] = None, **loop_options) -> List[BetaMessageParam]:
+    """Run the sampling loop with clean output handling.
+
+    history continues an earlier conversation (e.g. a resumed session); task is appended
+    to it as the next user message unless it is None.
+    loop_options (pacing_mode, ask_user, max_turns, stats, session_log) are passed on to
+    sampling_loop.
+    """
     api_key = os.getenv("ANTHROPIC_API_KEY")
-    messages = []
+    messages = history if history is not None else []
     # ic(messages)
     if not api_key:
         raise ValueError("API key not found. Please set the ANTHROPIC_API_KEY environment variable.")
-    messages.append({"role": "user","content": task})
-    display.add_message("user", task)
+    if task is not None:
+        messages.append({"role": "user","content": task})
+        display.add_message("user", task)
  
 
     messages = await sampling_loop(
         model=MAIN_MODEL,  # Use MAIN_MODEL from config.py
         messages=messages,
         api_key=api_key,
-        display=display
+        display=display,
+        **loop_options,
     )
     return messages
 
 
-async def main_async():
+def with_project_dir(task: str, project_dir: Path) -> str:
+    """Append the project directory instructions to a task prompt."""
+    return task + f"Your project directory is {project_dir}. You need to make sure that all files you create and work you do is done in that directory. \n"
+
+
+def _close_interrupted_turn(messages: List[BetaMessageParam]):
+    """If the process died while tools were running, answer the pending tool_use blocks
+    so the history is a valid request again."""
+    if not messages or messages[-1]["role"] != "assistant" or not isinstance(messages[-1]["content"], list):
+        return
+    pending = [block for block in messages[-1]["content"] if block.get("type") == "tool_use"]
+    if pending:
+        messages.append({"role": "user", "content": [{
+            "type": "tool_result",
+            "tool_use_id": block["id"],
+            "is_error": True,
+            "content": [{"type": "text", "text": "The session was interrupted before this tool finished; its result is unknown."}],
+        } for block in pending]})
+
+
+def resume_session(session: str) -> Tuple[SessionLog, List[BetaMessageParam], Optional[str]]:
+    """Load a logged session: returns its log, the rebuilt history and the next user task
+    (asked for when the model was waiting on the user), without calling the API."""
+    session_log, state = SessionLog.resume(session)
+    messages = state.messages
+    if not messages:
+        raise ValueError(f"Session {session} has no messages to resume")
+    project_dir = state.meta.get("project_dir")
+    if project_dir:
+        set_project_dir(Path(project_dir))
+    _close_interrupted_turn(messages)
+    logged_hash = state.meta.get("system_prompt_sha256")
+    if logged_hash and logged_hash != get_prompts().hash("system"):
+        rr("[yellow]The system prompt changed since this session was logged; the first request will not read the old cache.[/yellow]")
+    task = None
+    if messages[-1]["role"] == "assistant":
+        task = Prompt.ask("Resuming; what would you like to do next?")
+    rr(f"Resumed session {session_log.session_id}: {len(messages)} messages, {len(state.usage)} turns")
+    return session_log, messages, task
+
+
+async def main_async(resume: Optional[str] = None, metrics_port: int = METRICS_PORT):
     """Async main function with proper error handling."""
+    if resume:
+        session_log, history, task = resume_session(resume)
+        await _run_with_display(task, session_log, history, metrics_port=metrics_port)
+        return
+
     prompts_dir =PROMPTS_DIR
-    prompt_files = list(prompts_dir.glob("*.md"))
+    prompt_files = get_prompts().task_prompts()
     rr("\nAvailablePrompts:")
     for i, file in enumerate(prompt_files, 1):
         rr(f"{i}. {file.name}")
@@ -634,11 +942,18 @@ async def main_async():
             f.write(prompt_text)
         task = prompt_text
     else:
-        with open(prompt_path, 'r', encoding='utf-8') as f:
-            task = f.read()
+        task = get_prompts().read(prompt_path).text
     project_dir = set_project_dir(filename)
     set_constant("PROJECT_DIR", str(project_dir))
-    task += f"Your project directory is {project_dir}. You need to make sure that all files you create and work you do is done in that directory. \n"
+    task = with_project_dir(task, project_dir)
+    session_log = SessionLog.create(
+        filename, task=task, project_dir=str(project_dir), model=MAIN_MODEL, system_prompt_sha256=get_prompts().hash("system")
+    )
+    rr(f"Session log: {session_log.path} (resume with --resume {session_log.session_id})")
+    await _run_with_display(task, session_log, metrics_port=metrics_port)
+
+
+async def _run_with_display(task: Optional[str], session_log: SessionLog, history: Optional[List[BetaMessageParam]] = None, metrics_port: int = METRICS_PORT):
     # Create the display instance and setup the layout
     display = AgentDisplay()  # Create instance of AgentDisplay
     layout = display.create_layout()  # Create initial layout
@@ -647,25 +962,35 @@ async def main_async():
         # Create console for Live display
         console = Console()
         
-        # Start Live display with the layout
-        with Live(display.create_layout(), refresh_per_second=4, auto_refresh=True) as live:
-            display.live = live  # Set the live attribute
-            update_task = asyncio.create_task(display.update_display(live))
-            # Run the main sampling loop
-            messages = await run_sampling_loop(task, display)
+        # Start Live display with the layout; metrics are published while the session runs
+        async with MetricsExporter(port=metrics_port):
+            with Live(display.create_layout(), refresh_per_second=4, auto_refresh=True) as live:
+                display.live = live  # Set the live attribute
+                stop_event = asyncio.Event()
+                update_task = asyncio.create_task(display.update_display(live, stop_event))
+                # Run the main sampling loop
+                messages = await run_sampling_loop(task, display, history=history, session_log=session_log)
             
-            # Wait for any pending updates
-            await update_task
+                # Draw what is still queued, then let the display task finish
+                await display.wait_until_drained()
+                stop_event.set()
+                await update_task
             
         rr("\nTask Completed Successfully")
 
     except Exception as e:
         rr(f"Error during execution: {e}")
         raise  # Re-raise the exception for debugging
+    finally:
+        session_log.close()
 
 def main():
     """Main entry point with proper async handling."""
-    asyncio.run(main_async())
+    parser = argparse.ArgumentParser(description="Run the coding agent.")
+    parser.add_argument("--resume", metavar="SESSION", help="Continue a logged session (id or path to its log)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve OpenMetrics at http://127.0.0.1:PORT/metrics")
+    args = parser.parse_args()
+    asyncio.run(main_async(resume=args.resume, metrics_port=args.metrics_port))
 
 if __name__ == "__main__":
     main()
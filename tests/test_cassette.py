@@ -0,0 +1,97 @@
+import asyncio
+import gzip
+
+import pytest
+from anthropic.types import Message, TextBlock, Usage
+
+from utils.cassette import Cassette, CassetteMiss, request_key
+
+
+def _request(text: str, cached: bool = False):
+    block = {"type": "text", "text": text}
+    if cached:
+        block["cache_control"] = {"type": "ephemeral"}
+    return {"model": "m", "max_tokens": 10, "messages": [{"role": "user", "content": [block]}]}
+
+
+def _response(text: str) -> Message:
+    return Message(
+        id="msg_1", type="message", role="assistant", model="m", stop_reason="end_turn",
+        content=[TextBlock(type="text", text=text)], usage=Usage(input_tokens=1, output_tokens=1),
+    )
+
+
+def _record(tmp_path, calls):
+    cassette = Cassette(name="test", mode="record", directory=tmp_path)
+
+    async def run():
+        for site, text, answer in calls:
+            async def fetch(answer=answer):
+                return _response(answer)
+            await cassette.call(site, _request(text), fetch, Message)
+
+    asyncio.run(run())
+    return cassette
+
+
+def _replay(tmp_path, site, request, match="request"):
+    cassette = Cassette(name="test", mode="replay", match=match, speed=0, directory=tmp_path)
+
+    async def fetch():
+        raise AssertionError("replay must not call the model")
+
+    return cassette, asyncio.run(cassette.call(site, request, fetch, Message))
+
+
+def test_key_ignores_cache_control_but_not_site():
+    assert request_key("main", _request("a")) == request_key("main", _request("a", cached=True))
+    assert request_key("main", _request("a")) != request_key("summary", _request("a"))
+    assert request_key("main", _request("a")) != request_key("main", _request("b"))
+
+
+def test_record_then_replay(tmp_path):
+    recorder = _record(tmp_path, [("main", "hello", "hi"), ("summary", "long", "short")])
+    assert recorder.recorded == 2
+
+    cassette, response = _replay(tmp_path, "main", _request("hello", cached=True))
+    assert response.content[0].text == "hi"
+    assert cassette.hits == 1
+
+
+def test_unrecorded_request_misses_or_follows_sequence(tmp_path):
+    _record(tmp_path, [("main", "first", "one"), ("main", "second", "two")])
+    with pytest.raises(CassetteMiss):
+        _replay(tmp_path, "main", _request("changed"))
+
+    cassette = Cassette(name="test", mode="replay", match="sequence", speed=0, directory=tmp_path)
+
+    async def run():
+        async def fetch():
+            raise AssertionError("replay must not call the model")
+        # An exact match is used once; an unknown request gets the next unused one
+        exact = await cassette.call("main", _request("second"), fetch, Message)
+        other = await cassette.call("main", _request("changed"), fetch, Message)
+        return exact, other
+
+    exact, other = asyncio.run(run())
+    assert (exact.content[0].text, other.content[0].text) == ("two", "one")
+
+
+def test_torn_last_line_is_skipped(tmp_path):
+    recorder = _record(tmp_path, [("main", "hello", "hi")])
+    with gzip.open(recorder.path, "at", encoding="utf-8") as f:
+        f.write('{"key": "abc", "site": "ma')
+    _, response = _replay(tmp_path, "main", _request("hello"))
+    assert response.content[0].text == "hi"
+
+
+def test_off_mode_always_fetches(tmp_path):
+    cassette = Cassette(name="test", mode="off", directory=tmp_path)
+
+    async def fetch():
+        return "live"
+
+    assert asyncio.run(cassette.call("main", _request("a"), fetch, Message)) == "live"
+    assert not cassette.path.exists()
+    with pytest.raises(ValueError):
+        Cassette(mode="rewind", directory=tmp_path)
@@ -0,0 +1,97 @@
+import asyncio
+
+from utils.compaction import SUMMARY_MARKER, ContextCompactor
+from utils.message_store import MessageStore
+
+
+class FakeCompactor(ContextCompactor):
+    """Summarizes without a model call."""
+
+    def __init__(self, summary="summary", **kwargs):
+        super().__init__(scheduler=None, **kwargs)
+        self.summary = summary
+
+    async def _summarize(self, first, span):
+        if isinstance(self.summary, Exception):
+            raise self.summary
+        return self.summary
+
+
+def _history(turns: int, text: str = "x" * 400):
+    messages = [{"role": "user", "content": "the task"}]
+    for i in range(turns):
+        messages.append({"role": "assistant", "content": [{"type": "tool_use", "id": f"t{i}", "name": "bash", "input": {"command": text}}]})
+        messages.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"t{i}", "content": [{"type": "text", "text": text}]}]})
+    return messages
+
+
+def test_span_keeps_task_recent_tail_and_pairs():
+    compactor = FakeCompactor(keep_recent=3)
+    messages = _history(5)
+    start, end = compactor._select_span(messages)
+    assert start == 1
+    # The kept tail starts with an assistant message at or before the last keep_recent
+    assert messages[end]["role"] == "assistant"
+    assert len(messages) - end >= 3
+    assert compactor._select_span(_history(1)) is None
+
+
+def test_span_stops_at_a_cache_breakpoint():
+    compactor = FakeCompactor(keep_recent=2)
+    messages = _history(6)
+    messages[5]["content"][0]["cache_control"] = {"type": "ephemeral"}
+    start, end = compactor._select_span(messages)
+    assert end <= 5
+    assert messages[end]["role"] == "assistant"
+
+
+def _compact(compactor, messages, store=None):
+    async def run():
+        assert not compactor.maybe_compact(messages, store)
+        await asyncio.sleep(0)
+        return compactor.maybe_compact(messages, store)
+
+    return asyncio.run(run())
+
+
+def test_summary_replaces_the_span():
+    compactor = FakeCompactor(token_budget=1000, trigger_ratio=0.5, keep_recent=2)
+    messages = _history(6)
+    first, tail = messages[0], messages[-2:]
+    before = compactor.estimate(messages)
+    store = MessageStore(token_counter=compactor.token_counter)
+    store.prepare(messages)
+
+    assert _compact(compactor, messages, store)
+    assert messages[0] is first
+    assert messages[1]["content"][0]["text"].startswith(SUMMARY_MARKER)
+    assert messages[-2:] == tail and messages[2]["role"] == "assistant"
+    assert compactor.compactions == 1
+    assert 0 < compactor.tokens_removed < before
+    assert len(store.prepare(messages)) == len(messages)
+
+
+def test_changed_history_discards_the_summary():
+    compactor = FakeCompactor(token_budget=1000, trigger_ratio=0.5, keep_recent=2)
+    messages = _history(6)
+
+    async def run():
+        compactor.maybe_compact(messages)
+        await asyncio.sleep(0)
+        # Something else rewrote the history meanwhile
+        messages[1:3] = [{"role": "user", "content": "replaced"}]
+        return compactor.maybe_compact(messages)
+
+    length = len(messages) - 1
+    assert not asyncio.run(run())
+    assert len(messages) == length
+    assert compactor.compactions == 0
+
+
+def test_failed_summary_waits_for_more_history():
+    compactor = FakeCompactor(summary=RuntimeError("overloaded"), token_budget=1000, trigger_ratio=0.5, keep_recent=2)
+    messages = _history(6)
+    assert not _compact(compactor, messages)
+    assert compactor.compactions == 0
+    assert compactor._retry_above > compactor.estimate(messages)
+    assert compactor._task is None
@@ -0,0 +1,45 @@
+import asyncio
+from pathlib import Path
+
+from config import CACHE_DIR, REPO_DIR, constants_scope, get_constant, get_constants, get_project_dir, set_constant, set_project_dir
+
+
+def _constants_file() -> bytes:
+    path = CACHE_DIR / "constants.json"
+    return path.read_bytes() if path.exists() else b""
+
+
+def test_scope_overrides_and_restores():
+    outside = get_constant("BASH_TIMEOUT")
+    before = _constants_file()
+    with constants_scope(BASH_TIMEOUT=1, EXTRA_DIR=Path("/tmp/extra")):
+        assert get_constant("BASH_TIMEOUT") == 1
+        assert get_constant("EXTRA_DIR") == Path("/tmp/extra")
+        set_constant("SCOPED_ONLY", "yes")
+        assert get_constants()["SCOPED_ONLY"] == "yes"
+        with constants_scope(BASH_TIMEOUT=2):
+            assert get_constant("BASH_TIMEOUT") == 2
+            assert get_constant("SCOPED_ONLY") == "yes"
+        assert get_constant("BASH_TIMEOUT") == 1
+    assert get_constant("BASH_TIMEOUT") == outside
+    assert get_constant("SCOPED_ONLY") is None
+    # Nothing set inside a scope is written to constants.json
+    assert _constants_file() == before
+
+
+def test_concurrent_sessions_keep_their_project_dir():
+    async def session(name: str):
+        with constants_scope():
+            set_project_dir(name)
+            await asyncio.sleep(0.01)
+            in_thread = await asyncio.to_thread(get_constant, "PROJECT_DIR")
+            return get_project_dir(), in_thread
+
+    async def run():
+        return await asyncio.gather(session("alpha"), session("beta"))
+
+    global_dir = get_project_dir()
+    (alpha, alpha_thread), (beta, beta_thread) = asyncio.run(run())
+    assert Path(alpha) == alpha_thread == REPO_DIR / "alpha"
+    assert Path(beta) == beta_thread == REPO_DIR / "beta"
+    assert get_project_dir() == global_dir
@@ -0,0 +1,51 @@
+import base64
+import io
+
+import pytest
+
+from utils.images import ImagePipeline, image_tokens
+
+Image = pytest.importorskip("PIL.Image")
+ImageDraw = pytest.importorskip("PIL.ImageDraw")
+
+
+def _screenshot(busy: bool) -> str:
+    image = Image.new("RGB", (1920, 1080), "white")
+    draw = ImageDraw.Draw(image)
+    if busy:
+        for y in range(0, 1080, 18):
+            draw.text((10, y), "lorem ipsum dolor sit amet " * 12, fill=(30, 30, 30))
+    else:
+        draw.rectangle((560, 300, 1360, 780), outline="black", fill=(240, 240, 250))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def test_image_tokens_follow_the_api_downscaling():
+    assert image_tokens(0, 10) == 0
+    assert image_tokens(750, 1) == 1
+    assert image_tokens(1920, 1080) == image_tokens(3840, 2160)
+
+
+def test_sparse_screenshot_is_cropped_and_shrunk():
+    pipeline = ImagePipeline(token_budget=1000)
+    prepared = pipeline.prepare(_screenshot(busy=False))
+    assert prepared.tokens_after < prepared.tokens_before
+    assert prepared.bytes_after < prepared.bytes_before
+    assert pipeline.tokens_saved == prepared.tokens_saved
+
+
+@pytest.mark.parametrize("image_format", ["auto", "png", "jpeg"])
+def test_result_is_never_larger_than_the_original(image_format):
+    data = _screenshot(busy=True)
+    prepared = ImagePipeline(token_budget=1000, image_format=image_format).prepare(data)
+    assert prepared.bytes_after <= prepared.bytes_before
+    assert len(base64.b64decode(prepared.data)) == prepared.bytes_after
+    if prepared.data == data:
+        assert prepared.tokens_after == prepared.tokens_before
+
+
+def test_undecodable_data_passes_through():
+    prepared = ImagePipeline().prepare("not an image")
+    assert prepared.data == "not an image"
@@ -0,0 +1,74 @@
+from utils.message_store import MessageStore
+from utils.token_counter import TokenCounter
+
+
+def _message(role: str, text: str):
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+
+def test_prepare_truncates_and_reuses_entries():
+    store = MessageStore(max_length=5)
+    messages = [_message("user", "hello world"), _message("assistant", "hi")]
+    first = store.prepare(messages)
+    assert first[0]["content"][0]["text"] == "hello"
+    assert messages[0]["content"][0]["text"] == "hello world"
+    assert store.truncations == 2
+
+    prepared_first = first[0]
+    messages.append(_message("user", "again and again"))
+    second = store.prepare(messages)
+    assert store.truncations == 3
+    assert second[0] is prepared_first
+    assert second[2]["content"][0]["text"] == "again"
+
+
+def test_invalidate_rebuilds_only_that_message():
+    store = MessageStore(max_length=100)
+    messages = [_message("user", "one"), _message("assistant", "two")]
+    store.prepare(messages)
+    kept = store.prepare(messages)[1]
+
+    messages[0]["content"][0]["cache_control"] = {"type": "ephemeral"}
+    store.invalidate(0)
+    prepared = store.prepare(messages)
+    assert prepared[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert prepared[1] is kept
+    assert store.truncations == 3
+
+
+def test_negative_index_and_unknown_index():
+    store = MessageStore()
+    messages = [_message("user", "one"), _message("assistant", "two")]
+    store.prepare(messages)
+    messages[-1]["content"][0]["text"] = "changed"
+    store.invalidate(-1)
+    store.invalidate(10)
+    assert store.prepare(messages)[1]["content"][0]["text"] == "changed"
+
+
+def test_rewritten_history_is_rebuilt():
+    store = MessageStore()
+    messages = [_message("user", "one"), _message("assistant", "two"), _message("user", "three")]
+    store.prepare(messages)
+    shortened = [_message("user", "summary")]
+    prepared = store.prepare(shortened)
+    assert len(prepared) == len(store) == 1
+    assert prepared[0]["content"][0]["text"] == "summary"
+
+    replaced = [_message("user", "other"), _message("assistant", "history")]
+    assert store.prepare(replaced)[0]["content"][0]["text"] == "other"
+
+
+def test_invalidation_reaches_the_token_counter():
+    counter = TokenCounter()
+    store = MessageStore(token_counter=counter)
+    messages = [_message("user", "short")]
+    prepared = list(store.prepare(messages))
+    before = counter.prompt_size(prepared)
+
+    messages[0]["content"][0]["text"] = "a much longer message than before " * 20
+    store.invalidate(0)
+    after = counter.prompt_size(store.prepare(messages))
+    assert after > before
+    # The count of the replaced prepared message was dropped, not left behind
+    assert id(prepared[0]) not in counter._messages
@@ -0,0 +1,142 @@
+from anthropic.types.beta import BetaMessage, BetaTextBlock, BetaUsage
+
+from config import COMPUTER_USE_BETA_FLAG
+from utils.model_router import ModelRouter
+
+MAIN = "claude-3-5-sonnet-latest"
+LIGHT = "claude-3-5-haiku-latest"
+
+
+def _router(**kwargs) -> ModelRouter:
+    options = dict(main_model=MAIN, light_model=LIGHT, enabled=True, error_cooldown=2, main_only_tools=["opinion"])
+    options.update(kwargs)
+    return ModelRouter(**options)
+
+
+def _turn(tool: str = "bash", is_error: bool = False, result: str = "ok"):
+    """An assistant tool call followed by its result."""
+    return [
+        {"role": "assistant", "content": [{"type": "tool_use", "id": "t1", "name": tool, "input": {}}]},
+        {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "t1", "content": result, "is_error": is_error}]},
+    ]
+
+
+def _response(output_tokens: int = 10, cache_read: int = 0, stop_reason: str = "end_turn", text: str = "done"):
+    return BetaMessage(
+        id="msg_1",
+        type="message",
+        role="assistant",
+        model=MAIN,
+        content=[BetaTextBlock(type="text", text=text)],
+        stop_reason=stop_reason,
+        usage=BetaUsage(input_tokens=100, output_tokens=output_tokens, cache_read_input_tokens=cache_read),
+    )
+
+
+def test_disabled_router_always_uses_main():
+    router = _router(enabled=False)
+    assert router.choose(_turn(), 100).reason == "disabled"
+    assert _router(light_model=MAIN).choose(_turn(), 100).reason == "disabled"
+
+
+def test_user_message_goes_to_main():
+    decision = _router().choose([{"role": "user", "content": "do something"}], 100)
+    assert (decision.model, decision.reason, decision.follow_up) == (MAIN, "user_message", False)
+
+
+def test_successful_tool_result_goes_to_light():
+    decision = _router().choose(_turn(), 100)
+    assert (decision.model, decision.reason, decision.light) == (LIGHT, "light_turn", True)
+
+
+def test_tool_error_starts_a_cooldown():
+    router = _router()
+    assert router.choose(_turn(is_error=True), 100).reason == "tool_error"
+    assert router.choose(_turn(), 100).reason == "error_streak"
+    assert router.choose(_turn(), 100).reason == "error_streak"
+    assert router.choose(_turn(), 100).reason == "light_turn"
+
+
+def test_main_only_tool_and_large_result():
+    router = _router(max_result_tokens=50)
+    assert router.choose(_turn(tool="opinion"), 100).reason == "tool:opinion"
+    assert router.choose(_turn(result="x" * 2000), 100).reason == "large_result"
+
+
+def test_long_answers_stay_on_main():
+    router = _router(max_output_tokens=100)
+    decision = router.choose(_turn(), 100)
+    router.record(decision, _response(output_tokens=1000), 1.0)
+    assert router.choose(_turn(), 100).reason == "long_output"
+
+
+def test_cached_main_prompt_is_kept():
+    router = _router()
+    # The main model has the whole prompt cached; a short light run cannot pay for
+    # writing the light model's own cache
+    warm = router.choose([{"role": "user", "content": "start"}], 10000)
+    router.record(warm, _response(cache_read=10000), 1.0)
+    decision = router.choose(_turn(), 10000, cache_prefix=10000)
+    assert (decision.model, decision.reason) == (MAIN, "main_cached")
+    # With nothing cached yet both models pay for the write, and the cheaper one wins
+    assert _router().choose(_turn(), 10000, cache_prefix=10000).reason == "light_turn"
+
+
+def test_light_run_length_is_tracked():
+    router = _router()
+    for _ in range(4):
+        assert router.choose(_turn(), 100).reason == "light_turn"
+    assert router._run == 4
+    router.choose([{"role": "user", "content": "next"}], 100)
+    assert router._run == 0
+    assert router._light_run == 3.0
+
+
+def test_check_and_escalate():
+    router = _router()
+    decision = router.choose(_turn(), 100)
+    assert router.check(decision, _response()) is None
+    assert router.check(decision, _response(stop_reason="max_tokens")) == "max_tokens"
+    assert router.check(decision, _response(text="  ")) == "empty"
+
+    escalated = router.escalate(decision, "max_tokens")
+    assert (escalated.model, escalated.reason, escalated.follow_up) == (MAIN, "escalated:max_tokens", True)
+    assert router.check(escalated, _response(stop_reason="max_tokens")) is None
+    assert router.models[LIGHT].escalated == 1
+    # The following turns stay on the main model
+    assert router.choose(_turn(), 100).reason == "error_streak"
+
+
+def test_request_for_light_swaps_tools_and_betas():
+    router = _router()
+    request = {
+        "max_tokens": 100,
+        "tools": [
+            {"name": "bash", "type": "bash_20241022"},
+            {"name": "str_replace_editor", "type": "text_editor_20241022", "cache_control": {"type": "ephemeral"}},
+            {"name": "opinion", "description": "Ask for an opinion", "input_schema": {"type": "object"}},
+        ],
+        "betas": [COMPUTER_USE_BETA_FLAG, "prompt-caching-2024-07-31"],
+    }
+    main = router.choose([{"role": "user", "content": "start"}], 100)
+    assert router.request_for(main, request) is request
+
+    light = router.request_for(router.choose(_turn(), 100), request)
+    bash, editor, opinion = light["tools"]
+    assert (bash["name"], bash["type"]) == ("bash", "custom")
+    assert "command" in bash["input_schema"]["properties"]
+    assert editor["cache_control"] == {"type": "ephemeral"}
+    assert opinion is request["tools"][2]
+    assert light["betas"] == ["prompt-caching-2024-07-31"]
+    assert request["tools"][0] == {"name": "bash", "type": "bash_20241022"}
+
+
+def test_record_accounts_per_model():
+    router = _router()
+    decision = router.choose(_turn(), 100)
+    router.record(decision, _response(output_tokens=20, cache_read=50), 2.0)
+    stats = router.stats()[LIGHT]
+    assert stats["requests"] == 1
+    assert (stats["input_tokens"], stats["output_tokens"], stats["cache_read_tokens"]) == (100, 20, 50)
+    assert stats["reasons"] == {"light_turn": 1}
+    assert stats["cost_usd"] > 0
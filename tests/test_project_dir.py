@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+import tools.edit
+import tools.venvsetup
+from config import constants_scope
+from tools.edit import EditTool
+from tools.venvsetup import ProjectSetupTool
+
+
+def test_edit_paths_follow_the_session_project_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(tools.edit, "LOG_FILE", tmp_path / "file_creation_log.json")
+    tool = EditTool()
+
+    async def session(name: str):
+        with constants_scope(PROJECT_DIR=tmp_path / name):
+            await asyncio.sleep(0.01)
+            return tool.normalize_path("src/app.py"), tool.normalize_path(tmp_path / name / "x.py")
+
+    async def run():
+        return await asyncio.gather(session("alpha"), session("beta"))
+
+    (alpha, alpha_abs), (beta, beta_abs) = asyncio.run(run())
+    assert alpha == tmp_path / "alpha" / "src" / "app.py"
+    assert beta == tmp_path / "beta" / "src" / "app.py"
+    assert (alpha_abs, beta_abs) == (tmp_path / "alpha" / "x.py", tmp_path / "beta" / "x.py")
+
+
+def test_project_setup_runs_in_the_project_without_chdir(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append((cmd, kwargs.get("cwd")))
+        return tools.venvsetup.subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+    monkeypatch.setattr(tools.venvsetup.subprocess, "run", fake_run)
+    tool = ProjectSetupTool()
+    cwd = os.getcwd()
+
+    async def run():
+        results = []
+        for name in ("alpha", "beta"):
+            with constants_scope(PROJECT_DIR=tmp_path / name):
+                results.append(await tool(command="setup_project", project_path=name, packages=["rich"]))
+                results.append(await tool(command="run_app", project_path=name, python_filename="app.py"))
+        return results
+
+    results = asyncio.run(run())
+    assert all(not result.error for result in results)
+    assert os.getcwd() == cwd
+    assert {cwd for _cmd, cwd in calls} == {tmp_path / "alpha", tmp_path / "beta"}
+    assert (["uv", "run", "app.py"], tmp_path / "beta") in calls
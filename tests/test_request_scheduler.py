@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from anthropic import APIStatusError
+
+from utils.request_scheduler import PRIORITY_MAIN, PRIORITY_SUMMARY, RateLimits, RequestScheduler, retry_after
+
+
+def _status_error(status: int, headers=None) -> APIStatusError:
+    # Only the attributes APIStatusError and the scheduler read
+    response = SimpleNamespace(request=None, status_code=status, headers=headers or {})
+    return APIStatusError(f"status {status}", response=response, body=None)
+
+
+def _scheduler(**kwargs) -> RequestScheduler:
+    options = dict(client=object(), max_retries=3, backoff_base=0.01, backoff_max=0.05)
+    options.update(kwargs)
+    return RequestScheduler(**options)
+
+
+def test_retry_after_headers():
+    assert retry_after(None) is None
+    assert retry_after({"retry-after": "2"}) == 2.0
+    assert retry_after({"retry-after-ms": "1500", "retry-after": "9"}) == 1.5
+    assert retry_after({"retry-after": "soon"}) is None
+
+
+def test_backoff_grows_and_respects_server_wait():
+    scheduler = _scheduler(backoff_base=1.0, backoff_max=8.0)
+    for attempt, ceiling in [(0, 1.0), (1, 2.0), (2, 4.0), (5, 8.0)]:
+        assert ceiling / 2 <= scheduler.backoff(attempt) <= ceiling
+    assert scheduler.backoff(0, server_wait=30.0) == 30.0
+
+
+def test_rate_limit_headers_set_the_budget():
+    limits = RateLimits()
+    reset = (datetime.now(timezone.utc) + timedelta(seconds=10)).isoformat()
+    limits.update({
+        "anthropic-ratelimit-requests-limit": "50",
+        "anthropic-ratelimit-requests-remaining": "1",
+        "anthropic-ratelimit-requests-reset": reset,
+        "anthropic-ratelimit-input-tokens-limit": "1000",
+        "anthropic-ratelimit-input-tokens-remaining": "500",
+        "anthropic-ratelimit-input-tokens-reset": reset,
+    })
+    assert limits.as_dict() == {"requests_limit": 50, "requests_remaining": 1, "tokens_limit": 1000, "tokens_remaining": 500}
+    now = time.monotonic()
+    assert limits.wait(100, 0.0, now) == 0.0
+    # Too many tokens, or the background reserve, means waiting for the reset
+    assert 9 < limits.wait(600, 0.0, now) <= 10
+    assert 9 < limits.wait(100, 0.5, now) <= 10
+    limits.consume(100)
+    assert (limits.requests_remaining, limits.tokens_remaining) == (0, 400)
+    assert limits.wait(1, 0.0, now) > 9
+    # Once the reset has passed the budget is unknown and nothing waits
+    assert limits.wait(10_000, 0.0, now + 11) == 0.0
+
+
+def test_rate_limited_call_is_retried_after_backoff():
+    scheduler = _scheduler()
+    attempts = []
+
+    async def call(client):
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise _status_error(429, {"retry-after-ms": "20"})
+        return "ok"
+
+    assert asyncio.run(scheduler.submit(call, PRIORITY_MAIN)) == "ok"
+    assert (scheduler.requests, scheduler.retries, scheduler.rate_limited, scheduler.failures) == (3, 2, 2, 0)
+    assert all(later - earlier >= 0.019 for earlier, later in zip(attempts, attempts[1:]))
+
+
+def test_errors_that_cannot_be_retried_are_raised():
+    scheduler = _scheduler(max_retries=1)
+
+    async def bad_request(client):
+        raise _status_error(400)
+
+    async def overloaded(client):
+        raise _status_error(529)
+
+    with pytest.raises(APIStatusError):
+        asyncio.run(scheduler.submit(bad_request))
+    assert (scheduler.requests, scheduler.retries) == (1, 0)
+    with pytest.raises(APIStatusError):
+        asyncio.run(_scheduler(max_retries=1).submit(overloaded))
+
+
+def test_waiting_calls_start_in_priority_order():
+    scheduler = _scheduler(max_concurrency=1)
+    order = []
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def first(client):
+            await gate.wait()
+            order.append("first")
+
+        def call(name):
+            async def make(client):
+                order.append(name)
+            return make
+
+        running = asyncio.create_task(scheduler.submit(first, PRIORITY_MAIN))
+        await asyncio.sleep(0.01)
+        queued = [
+            asyncio.create_task(scheduler.submit(call("summary"), PRIORITY_SUMMARY)),
+            asyncio.create_task(scheduler.submit(call("main"), PRIORITY_MAIN)),
+        ]
+        await asyncio.sleep(0.01)
+        assert scheduler.queue_depth == 2
+        gate.set()
+        await asyncio.gather(running, *queued)
+
+    asyncio.run(run())
+    assert order == ["first", "main", "summary"]
+    assert scheduler.max_queue_depth == 2
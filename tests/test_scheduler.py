@@ -0,0 +1,78 @@
+import asyncio
+
+from tools.base import ToolResult
+from tools.scheduler import ToolScheduler, classify, conflicts
+
+
+class FakeCollection:
+    """Runs tool calls by sleeping for input["delay"] and records start/finish order."""
+
+    def __init__(self):
+        self.events = []
+
+    async def run(self, *, name, tool_input):
+        self.events.append(("start", tool_input["id"]))
+        await asyncio.sleep(tool_input.get("delay", 0))
+        self.events.append(("end", tool_input["id"]))
+        if tool_input.get("raise"):
+            raise RuntimeError("boom")
+        if tool_input.get("none"):
+            return None
+        return ToolResult(output=tool_input["id"])
+
+
+def _view(id, path="/p/a.py", delay=0.0):
+    return {"name": "str_replace_editor", "input": {"id": id, "command": "view", "path": path, "delay": delay}}
+
+
+def _edit(id, path="/p/a.py", delay=0.0):
+    return {"name": "str_replace_editor", "input": {"id": id, "command": "str_replace", "path": path, "delay": delay}}
+
+
+def _bash(id, delay=0.0):
+    return {"name": "bash", "input": {"id": id, "delay": delay}}
+
+
+def test_classify_and_conflicts():
+    view = classify("str_replace_editor", {"command": "view", "path": "/p/a.py"})
+    edit = classify("str_replace_editor", {"command": "create", "path": "/p/a.py"})
+    other = classify("str_replace_editor", {"command": "create", "path": "/p/b.py"})
+    bash = classify("bash", {"command": "ls"})
+    assert view.read_only and view.early_start
+    assert not edit.read_only
+    assert bash.exclusive
+    assert not conflicts(view, view)
+    assert conflicts(view, edit) and conflicts(edit, view)
+    assert not conflicts(edit, other)
+    assert conflicts(bash, view) and conflicts(view, bash)
+    # Paths are compared loosely: same file name or a parent directory overlaps
+    assert conflicts(edit, classify("str_replace_editor", {"command": "view", "path": "a.py"}))
+    assert conflicts(edit, classify("str_replace_editor", {"command": "view", "path": "/p"}))
+
+
+def test_results_come_back_in_call_order():
+    collection = FakeCollection()
+    calls = [_view("slow", "/p/a.py", 0.05), _view("fast", "/p/b.py", 0.0)]
+    results = asyncio.run(ToolScheduler(collection).run_all(calls))
+    assert [r.output for r in results] == ["slow", "fast"]
+    # Reads ran concurrently: the fast one finished first
+    assert collection.events.index(("end", "fast")) < collection.events.index(("end", "slow"))
+
+
+def test_conflicting_calls_keep_their_order():
+    collection = FakeCollection()
+    calls = [_edit("write", delay=0.05), _view("read"), _bash("shell")]
+    asyncio.run(ToolScheduler(collection).run_all(calls))
+    assert collection.events == [
+        ("start", "write"), ("end", "write"),
+        ("start", "read"), ("end", "read"),
+        ("start", "shell"), ("end", "shell"),
+    ]
+
+
+def test_failures_are_errors():
+    collection = FakeCollection()
+    calls = [{"name": "bash", "input": {"id": "raises", "raise": True}}, {"name": "bash", "input": {"id": "none", "none": True}}]
+    raised, empty = asyncio.run(ToolScheduler(collection).run_all(calls))
+    assert raised.output is None and raised.error == "Tool execution failed: boom"
+    assert empty.output is None and empty.error == "Tool execution failed with no result"
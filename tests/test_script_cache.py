@@ -0,0 +1,83 @@
+from tools.script_cache import ScriptCache, cache_key, normalize_command
+
+PROMPT = "a" * 64
+PROJECT = "/work/project"
+
+
+def _cache(tmp_path, **kwargs) -> ScriptCache:
+    return ScriptCache(tmp_path / "bash_scripts.json", **kwargs)
+
+
+def test_quoting_changes_the_key():
+    for plain, quoted in [
+        ("echo $HOME", "echo '$HOME'"),
+        ("ls *.py", "ls '*.py'"),
+        ("a | b", "a '|' b"),
+        ("echo a b", 'echo "a b"'),
+        ("echo \\$HOME", "echo $HOME"),
+    ]:
+        assert cache_key(plain, PROMPT, PROJECT) != cache_key(quoted, PROMPT, PROJECT), (plain, quoted)
+
+
+def test_unquoted_whitespace_is_collapsed():
+    assert normalize_command("  ls   -la\t src  ") == "ls -la src"
+    assert cache_key("ls  -la", PROMPT, PROJECT) == cache_key("ls -la", PROMPT, PROJECT)
+
+
+def test_quoted_whitespace_is_kept():
+    assert normalize_command("echo 'a   b'  c") == "echo 'a   b' c"
+    assert normalize_command('echo "it\'s   here"') == 'echo "it\'s   here"'
+    assert normalize_command("echo a\\  b") == "echo a\\  b"
+
+
+def test_key_includes_prompt_and_project():
+    key = cache_key("ls", PROMPT, PROJECT)
+    assert key != cache_key("ls", "b" * 64, PROJECT)
+    assert key != cache_key("ls", PROMPT, "/work/other")
+
+
+def test_hit_after_put_and_persisted(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get("ls -la", PROMPT, PROJECT) is None
+    cache.put("ls -la", PROMPT, PROJECT, "python", "print('hi')", 1.5)
+    assert cache.get("ls   -la", PROMPT, PROJECT) == ("python", "print('hi')")
+    assert (cache.hits, cache.misses, cache.saved_seconds) == (1, 1, 1.5)
+
+    reloaded = _cache(tmp_path)
+    assert reloaded.get("ls -la", PROMPT, PROJECT) == ("python", "print('hi')")
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.put("one", PROMPT, PROJECT, "python", "1", 0.1)
+    cache.put("two", PROMPT, PROJECT, "python", "2", 0.1)
+    assert cache.get("one", PROMPT, PROJECT) is not None
+    cache.put("three", PROMPT, PROJECT, "python", "3", 0.1)
+    assert cache.get("two", PROMPT, PROJECT) is None
+    assert cache.get("one", PROMPT, PROJECT) is not None
+    assert cache.get("three", PROMPT, PROJECT) is not None
+    assert cache.evictions == 1
+
+
+def test_new_prompt_drops_old_entries(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("ls", PROMPT, PROJECT, "python", "old", 0.1)
+    assert cache.get("ls", PROMPT, PROJECT) is not None
+    assert cache.get("ls", "b" * 64, PROJECT) is None
+    assert cache.invalidated == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_failed_script_is_evicted(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put("ls", PROMPT, PROJECT, "python", "broken", 0.1)
+    cache.evict("ls", PROMPT, PROJECT)
+    assert cache.get("ls", PROMPT, PROJECT) is None
+    assert cache.evictions == 1
+
+
+def test_disabled_cache_never_stores(tmp_path):
+    cache = _cache(tmp_path, enabled=False)
+    cache.put("ls", PROMPT, PROJECT, "python", "code", 0.1)
+    assert cache.get("ls", PROMPT, PROJECT) is None
+    assert not (tmp_path / "bash_scripts.json").exists()
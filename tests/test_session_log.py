@@ -0,0 +1,78 @@
+from utils.session_log import SessionLog, read_session_log
+
+
+def _message(role: str, text: str, cached: bool = False):
+    block = {"type": "text", "text": text}
+    if cached:
+        block["cache_control"] = {"type": "ephemeral"}
+    return {"role": role, "content": [block]}
+
+
+def _session(tmp_path):
+    log = SessionLog.create("task", directory=tmp_path, task="do it")
+    messages = [_message("user", "hello", cached=True), _message("assistant", "hi")]
+    log.sync(messages)
+    log.usage({"input_tokens": 10, "output_tokens": 2})
+    log.cache_plan([0])
+    log.end_turn()
+    return log, messages
+
+
+def test_round_trip(tmp_path):
+    log, messages = _session(tmp_path)
+    messages.append(_message("user", "more"))
+    log.sync(messages)
+    log.close()
+
+    resumed, state = SessionLog.resume(log.session_id, directory=tmp_path)
+    resumed.close()
+    assert state.meta["task"] == "do it"
+    assert [m["content"][0]["text"] for m in state.messages] == ["hello", "hi", "more"]
+    # Stored as sent, without the cache_control markers
+    assert "cache_control" not in state.messages[0]["content"][0]
+    assert state.usage == [{"input_tokens": 10, "output_tokens": 2}]
+    assert state.cache_breakpoints == [0]
+    assert state.discarded_bytes == 0
+
+
+def test_sync_writes_only_changes_and_truncates(tmp_path):
+    log, messages = _session(tmp_path)
+    records = read_session_log(log.path).records
+    log.sync(messages)
+    assert read_session_log(log.path).records == records
+
+    # Compaction replaced the history
+    compacted = [_message("user", "summary")]
+    log.sync(compacted)
+    log.close()
+    assert [m["content"][0]["text"] for m in read_session_log(log.path).messages] == ["summary"]
+
+
+def test_torn_last_line_is_discarded(tmp_path):
+    log, messages = _session(tmp_path)
+    log.close()
+    good = log.path.stat().st_size
+    with open(log.path, "ab") as f:
+        f.write(b'0badc0de {"type": "message", "data": {"role": "user", "con')
+
+    state = read_session_log(log.path)
+    assert len(state.messages) == 2
+    assert state.discarded_bytes > 0
+    assert log.path.stat().st_size == good
+
+    # New records append cleanly after the cut
+    resumed, _ = SessionLog.resume(str(log.path))
+    resumed.sync(messages + [_message("user", "after crash")])
+    resumed.close()
+    assert [m["content"][0]["text"] for m in read_session_log(log.path).messages] == ["hello", "hi", "after crash"]
+
+
+def test_corrupt_line_stops_reading(tmp_path):
+    log, _ = _session(tmp_path)
+    log.close()
+    lines = log.path.read_bytes().splitlines(keepends=True)
+    lines[1] = lines[1].replace(b"hello", b"jello")
+    log.path.write_bytes(b"".join(lines))
+    state = read_session_log(log.path)
+    assert state.records == 1
+    assert state.messages == []
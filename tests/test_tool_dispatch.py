@@ -0,0 +1,73 @@
+import asyncio
+
+from tools.scheduler import ToolDispatch, ToolScheduler
+
+from test_scheduler import FakeCollection
+
+
+def _call(id, command="view", path="/p/a.py", delay=0.0):
+    return {"id": id, "name": "str_replace_editor", "input": {"id": id, "command": command, "path": path, "delay": delay}}
+
+
+def test_reads_start_early_and_run_once():
+    async def run():
+        collection = FakeCollection()
+        dispatch = ToolDispatch(ToolScheduler(collection))
+        first, second = _call("a"), _call("b", path="/p/b.py")
+        assert dispatch.add(first)
+        assert dispatch.add(second)
+        await asyncio.sleep(0)
+        assert ("start", "a") in collection.events
+        results = await dispatch.results([first, second])
+        return collection, dispatch, results
+
+    collection, dispatch, results = asyncio.run(run())
+    assert [r.output for r in results] == ["a", "b"]
+    assert dispatch.started_early == 2
+    assert collection.events.count(("start", "a")) == 1
+
+
+def test_writes_and_reads_behind_them_wait():
+    async def run():
+        collection = FakeCollection()
+        dispatch = ToolDispatch(ToolScheduler(collection))
+        edit = _call("edit", command="str_replace")
+        behind = _call("behind")
+        elsewhere = _call("elsewhere", path="/q/other.py")
+        shell = {"id": "shell", "name": "bash", "input": {"id": "shell"}}
+        started = [dispatch.add(edit), dispatch.add(behind), dispatch.add(elsewhere), dispatch.add(shell)]
+        await dispatch.results([edit, behind, elsewhere, shell])
+        return collection, started
+
+    collection, started = asyncio.run(run())
+    # The read of the file being edited waits; a read of another file does not
+    assert started == [False, False, True, False]
+    assert collection.events.index(("end", "edit")) < collection.events.index(("start", "behind"))
+
+
+def test_no_early_start_when_disabled_or_without_id():
+    async def run():
+        dispatch = ToolDispatch(ToolScheduler(FakeCollection()), early=False)
+        no_id = ToolDispatch(ToolScheduler(FakeCollection()))
+        call = _call("a")
+        return dispatch.add(call), no_id.add({k: v for k, v in call.items() if k != "id"})
+
+    assert asyncio.run(run()) == (False, False)
+
+
+def test_unclaimed_early_calls_are_cancelled():
+    async def run():
+        collection = FakeCollection()
+        dispatch = ToolDispatch(ToolScheduler(collection))
+        orphan = _call("orphan", delay=10)
+        dispatch.add(orphan)
+        await asyncio.sleep(0)
+        task = dispatch._early["orphan"][1]
+        results = await dispatch.results([_call("final")])
+        await asyncio.sleep(0)
+        return collection, task, results
+
+    collection, task, results = asyncio.run(run())
+    assert [r.output for r in results] == ["final"]
+    assert task.cancelled()
+    assert ("end", "orphan") not in collection.events
@@ -1,15 +1,32 @@
+import importlib
+
 from .base import BaseAnthropicTool, ToolError, ToolResult
-from .bash import BashTool
-from .edit import EditTool
 from .collection import ToolCollection
-from .expert import GetExpertOpinionTool
-from .playwright import WebNavigatorTool
-from .venvsetup import ProjectSetupTool
+from .scheduler import ToolDispatch, ToolScheduler
+from .registry import LazyTool, default_tools
 #from .gotourl_reports import GoToURLReportsTool
 # from .get_serp import GoogleSearchTool
 # from .windows_navigation import WindowsNavigationTool
 # from .test_navigation_tool import windows_navigate
 
+# The tool classes are imported on first use (see tools/registry.py)
+_LAZY_TOOLS = {
+    "BashTool": ".bash",
+    "EditTool": ".edit",
+    "GetExpertOpinionTool": ".expert",
+    "WebNavigatorTool": ".playwright",
+    "ProjectSetupTool": ".venvsetup",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_TOOLS:
+        value = getattr(importlib.import_module(_LAZY_TOOLS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "BaseAnthropicTool",
     "ToolError",
@@ -17,6 +34,10 @@ __all__ = [
     "BashTool",
     "EditTool",
     "ToolCollection",
+    "ToolScheduler",
+    "ToolDispatch",
+    "LazyTool",
+    "default_tools",
     "GetExpertOpinionTool",
     "WebNavigatorTool",
     "ProjectSetupTool",
@@ -54,6 +54,8 @@ class ToolResult:
     base64_image: Optional[str] = None
     system: Optional[str] = None
     message: Optional[str] = None
+    # Media type of base64_image; PNG when not set
+    media_type: Optional[str] = None
     def __bool__(self):
         return any(getattr(self, field.name) for field in fields(self))
 
@@ -72,6 +74,7 @@ class ToolResult:
             error=combine_fields(self.error, other.error),
             base64_image=combine_fields(self.base64_image, other.base64_image, False),
             system=combine_fields(self.system, other.system),
+            media_type=self.media_type or other.media_type,
         )
 
     def replace(self, **kwargs):
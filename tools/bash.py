@@ -7,45 +7,55 @@ import os
 import subprocess
 import sys
 import io
+import time
 import traceback
 from datetime import datetime
-from anthropic import Anthropic
+from anthropic.types import Message
 
 from .base import BaseAnthropicTool, ToolError, ToolResult
+from .run import run
+from .script_cache import get_script_cache
 from utils.agent_display import AgentDisplay  # Add this line
-from load_constants import WORKER_DIR, write_to_file
+from utils.cassette import get_cassette
+from utils.prompt_registry import get_prompts
+from utils.request_scheduler import PRIORITY_TOOL, get_scheduler
+from utils.tracing import span
+from load_constants import WORKER_DIR
 from icecream import ic
-from config import get_constant
+from config import BASH_PROMPT_FILE, get_constant
 
-ic.configureOutput(includeContext=True, outputFunction=write_to_file)
 
 
 
 def read_prompt_from_file(file_path: str, bash_command: str) -> str:
     """Read the prompt template from a file and format it with the given bash command."""
     project_dir = Path(get_constant("PROJECT_DIR"))
-    with open(file_path, "r") as file:
-        prompt_string = file.read()
+    # Read once and cached; re-read only when the template changes on disk
+    prompt_string = get_prompts().read(file_path).text
     prompt_string += f"Your project directory is {project_dir}. You need to make sure that all files you create and work you do is done in that directory. \n"
     prompt_string += f"Your bash command is: {bash_command}\n"
-    temp= input(f" The prompt is: {prompt_string}")
     return prompt_string
 
 async def generate_script_with_llm(prompt: str) -> str:
     """Send a prompt to the LLM and return its response."""
     try:
-        api_key = os.getenv("ANTHROPIC_API_KEY")
         ic(prompt)
-        client = Anthropic(api_key=api_key)
-        response = client.messages.create(
-            model="claude-3-5-haiku-latest",
-            max_tokens=4000,
-            messages=[
+        scheduler = get_scheduler()
+        request = {
+            "model": "claude-3-5-haiku-latest",
+            "max_tokens": 4000,
+            "messages": [
                 {
                     "role": "user",
                     "content": prompt,
                 }
             ],
+        }
+        response = await get_cassette().call(
+            "bash_script",
+            request,
+            lambda: scheduler.submit(lambda client: client.messages.create(**request), PRIORITY_TOOL),
+            Message,
         )
         ic(response.content[0].text)
         return response.content[0].text
@@ -157,9 +167,16 @@ def execute_script(script_type: str, script_code: str, display: AgentDisplay = N
         raise ValueError(error_msg)
 
 
+BASH_BACKENDS = ("auto", "native", "llm")
+
+
 class BashTool(BaseAnthropicTool):
-    def __init__(self, display: AgentDisplay = None):
+    def __init__(self, display: AgentDisplay = None, backend: str | None = None):
+        if backend is not None and backend not in BASH_BACKENDS:
+            raise ValueError(f"Unknown bash backend {backend!r}; expected one of {BASH_BACKENDS}")
         self.display = display
+        # None follows the BASH_BACKEND constant, which can change between sessions
+        self.backend = backend
         super().__init__()
         
     description = """
@@ -170,24 +187,74 @@ class BashTool(BaseAnthropicTool):
     name: ClassVar[Literal["bash"]] = "bash"
     api_type: ClassVar[Literal["bash_20241022"]] = "bash_20241022"
 
+    def resolve_backend(self) -> str:
+        """"native" or "llm": how the next command will be run."""
+        backend = self.backend or get_constant("BASH_BACKEND")
+        if backend not in BASH_BACKENDS:
+            raise ToolError(f"Unknown bash backend {backend!r}; expected one of {BASH_BACKENDS}")
+        if backend == "auto":
+            return "native" if os.name == "posix" else "llm"
+        return backend
+
     async def __call__(self, command: str | None = None, **kwargs):
         if command is not None:
+            if self.resolve_backend() == "native":
+                return await self._run_native(command)
             return await self._run_command(command)
         raise ToolError("no command provided.")
 
+    async def _run_native(self, command: str) -> ToolResult:
+        """Run the command with the system shell, in the project directory."""
+        if self.display:
+            self.display.add_message("user", f"Running command: {command}")
+        project_dir = get_constant("PROJECT_DIR")
+        cwd = project_dir if project_dir and Path(project_dir).is_dir() else None
+        try:
+            with span("bash.native"):
+                returncode, stdout, stderr = await run(command, timeout=get_constant("BASH_TIMEOUT"), translate=False, cwd=cwd)
+        except TimeoutError as e:
+            raise ToolError(str(e)) from e
+        if self.display:
+            if stdout:
+                self.display.add_message("user", f"\n{stdout}")
+            if stderr:
+                self.display.add_message("user", f"Error\n{stderr}")
+        if returncode:
+            # Reported as an error so the model, the router and the token tracker see it failed
+            return ToolResult(output=stdout or None, error=f"{stderr}\nexit code: {returncode}".lstrip())
+        return ToolResult(output=f"output: {stdout}\nerror: {stderr}")
+
     async def _run_command(self, command: str):
-        """Execute a command in the shell."""
+        """Have a model turn the command into a Python or PowerShell script, and run that."""
         output = ""
         try:
             if self.display:
                 self.display.add_message("user", f"Processing command: {command}")
 
-            prompt = read_prompt_from_file(BASH_PROMPT_FILE, command)
-            response = await generate_script_with_llm(prompt)
-            script_type, script_code = parse_llm_response(response)
+            # A command seen before with the same bash.md and project reuses its script.
+            # Not while a cassette records or replays, which expects every model call
+            cache = get_script_cache()
+            prompt_sha256 = get_prompts().read(BASH_PROMPT_FILE).sha256
+            project_dir = str(get_constant("PROJECT_DIR"))
+            cached = None if get_cassette().active else cache.get(command, prompt_sha256, project_dir)
+            if cached:
+                script_type, script_code = cached
+            else:
+                prompt = read_prompt_from_file(BASH_PROMPT_FILE, command)
+                started = time.perf_counter()
+                with span("bash.generate_script"):
+                    response = await generate_script_with_llm(prompt)
+                script_type, script_code = parse_llm_response(response)
+                generate_seconds = time.perf_counter() - started
 
             # Pass the display to execute_script
-            result = execute_script(script_type, script_code, self.display)
+            with span("bash.execute", script_type=script_type, chars=len(script_code), cached=bool(cached)):
+                result = execute_script(script_type, script_code, self.display)
+            if isinstance(result, dict) and not get_cassette().active:
+                if not result["success"] and cached:
+                    cache.evict(command, prompt_sha256, project_dir)
+                elif result["success"] and not cached:
+                    cache.put(command, prompt_sha256, project_dir, script_type, script_code, generate_seconds)
 
             if isinstance(result, dict):
                 output = f"output: {result['output']}\nerror: {result['error']}"
@@ -3,6 +3,7 @@
 
 from typing import Any
 import json
+import time
 from anthropic.types.beta import BetaToolUnionParam
 from icecream import ic
 from .base import (
@@ -12,37 +13,65 @@ from .base import (
     ToolResult,
 )
 
-from load_constants import write_to_file
+from .scheduler import ToolDispatch, ToolScheduler
+from config import EARLY_TOOL_DISPATCH
+from utils.metrics import TOOL_LATENCY, TOOL_OUTPUT_BYTES
+from utils.tracing import span
+
+
+def _result_bytes(result: ToolResult) -> int:
+    return sum(len(part.encode("utf-8")) for part in (result.output, result.error, result.base64_image) if part)
 
 
 class ToolCollection:
     """A collection of anthropic-defined tools."""
 
-    def __init__(self, *tools: BaseAnthropicTool):
+    def __init__(self, *tools: BaseAnthropicTool, concurrency_limits: dict[str, int] | None = None):
         self.tools = tools
         ic(self.tools)
         self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
         ic(self.tool_map)
+        self.scheduler = ToolScheduler(self, limits=concurrency_limits)
     def to_params(
         self,
+        cache: bool = True,
     ) -> list[BetaToolUnionParam]:
         
         params = [tool.to_params() for tool in self.tools]
-        if params:
+        if params and cache:
             params[-1]["cache_control"] = {"type": "ephemeral"}
         return params
 
     async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
-        ic.configureOutput(includeContext=True, outputFunction=write_to_file)
-
         tool = self.tool_map.get(name)
     
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
-        try:
-            # ic(tool_input)
-            return await tool(**tool_input)
-        except ToolError as e:
-            return ToolFailure(error=e.message)
+        started = time.perf_counter()
+        with span("tool", tool=name) as tool_span:
+            try:
+                # ic(tool_input)
+                result = await tool(**tool_input)
+            except ToolError as e:
+                result = ToolFailure(error=e.message)
+            tool_span.set(error=bool(result.error))
+        TOOL_LATENCY.observe(time.perf_counter() - started, tool=name, outcome="error" if result.error else "ok")
+        TOOL_OUTPUT_BYTES.observe(_result_bytes(result), tool=name)
+        return result
+
+    def dispatch(self, early: bool = EARLY_TOOL_DISPATCH) -> ToolDispatch:
+        """Start collecting the tool_use blocks of a response as they stream in."""
+        return ToolDispatch(self.scheduler, early=early)
+
+    async def run_many(self, calls: list[dict[str, Any]], dispatch: ToolDispatch | None = None) -> list[ToolResult]:
+        """Run the tool_use blocks of one response concurrently where it is safe.
+
+        ``calls`` are tool_use blocks (dicts with "id", "name" and "input"); the results
+        come back in the same order. See ToolScheduler for the rules. With ``dispatch``,
+        calls it already started while the response streamed are not run again.
+        """
+        if dispatch is not None:
+            return await dispatch.results(calls)
+        return await self.scheduler.run_all(calls)
     def get_tool_names_as_string(self) -> str:
         return ", ".join(self.tool_map.keys())
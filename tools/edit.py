@@ -14,14 +14,11 @@ import sys
 from rich import print as rr
 import datetime
 import json
-from load_constants import  write_to_file, ICECREAM_OUTPUT_FILE
-from config import get_constant, set_constant, REPO_DIR, PROJECT_DIR, LOGS_DIR  # Updated import
+import load_constants  # noqa: F401  (sends ic() output to the debug log)
+from config import get_constant, set_constant, REPO_DIR, LOGS_DIR  # Updated import
 
 # Reconfigure stdout to use UTF-8 encoding
 sys.stdout.reconfigure(encoding='utf-8')
-# include the context for the icecream debugger
-# ic.configureOutput(includeContext=True)
-ic.configureOutput(includeContext=True, outputFunction=write_to_file)
 
 # Reconfigure stdout to use UTF-8 encoding
 Command = Literal[
@@ -35,8 +32,8 @@ SNIPPET_LINES: int = 4
 logs_dir = Path(get_constant('LOGS_DIR'))
 logs_dir = Path.cwd() / logs_dir
 LOG_FILE = logs_dir / "file_creation_log.json"
-PROJECT_DIR = Path(get_constant('PROJECT_DIR'))
-PROJECT_DIR = Path.cwd() / PROJECT_DIR
+# PROJECT_DIR is read with get_constant() on each call (normalize_path), never at import:
+# sessions in a constants_scope each have their own
 
 
 # set_constant('LOG_FILE', str(LOG_FILE))  # Ensure LOG_FILE is a string path
@@ -54,6 +51,7 @@ class EditTool(BaseAnthropicTool):
     def __init__(self):
         self._file_history = defaultdict(list)
         if not LOG_FILE.exists():
+            LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
             LOG_FILE.write_text('[]', encoding='utf-8')
         super().__init__()
 
@@ -1,10 +1,14 @@
 #expert.py
+import asyncio
+
 from openai import OpenAI
+from openai.types.chat import ChatCompletion
 # load the API key from the environment
 from dotenv import load_dotenv
 from icecream import ic
 from typing import Optional, Literal
 from .base import ToolError, ToolResult, BaseAnthropicTool, ToolFailure
+from utils.cassette import get_cassette
 load_dotenv()
 from rich import print as rr
 
@@ -138,8 +142,6 @@ Begin your detailed task breakdown below:
         """
         try:
             
-            client = OpenAI()
-            ic(client)
             prompt = f"""
             You are an expert in the field of computer science.
             You will be asked to provide an expert opinion on a computer science problem.
@@ -163,9 +165,9 @@ Begin your detailed task breakdown below:
            {problem_description}
             """
             rr(problem_description)
-            response = client.chat.completions.create(
-                model="o1-preview",
-                messages=[
+            request = {
+                "model": "o1-preview",
+                "messages": [
                     {
                         "role": "user",
                         "content": [
@@ -176,6 +178,14 @@ Begin your detailed task breakdown below:
                         ],
                     }
                 ]
+            }
+            # The OpenAI client is synchronous; keep it off the event loop. It is created
+            # only when a request is really sent, so replays need no API key
+            response = await get_cassette().call(
+                "opinion",
+                request,
+                lambda: asyncio.to_thread(OpenAI().chat.completions.create, **request),
+                ChatCompletion,
             )
             ic(response)
             ex_opinion = response.choices[0].message.content
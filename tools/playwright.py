@@ -1,5 +1,6 @@
 #playwright.py
 import os
+import asyncio
 import logging
 from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from typing import Literal, Optional, Dict, Any, List
@@ -7,6 +8,7 @@ import requests
 from bs4 import BeautifulSoup, Comment  # Add Comment to the import
 import re
 from .base import ToolResult
+from utils.tracing import span, traced
 # Configure logging for user feedback and debugging
 logging.basicConfig(level=logging.CRITICAL, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -36,10 +38,16 @@ class WebNavigatorTool:
         self.browser = None
         self.context = None
         self.page = None
+        self._browser_lock = asyncio.Lock()
         logging.info("WebNavigatorTool initialized with download directory at '%s'.", self.download_dir)
 
+    @traced("web.init_browser")
     async def init_browser(self):
         """Initialize browser if not already running"""
+        async with self._browser_lock:
+            await self._init_browser()
+
+    async def _init_browser(self):
         if not self.browser:
             p = await async_playwright().start()
             
@@ -147,7 +155,13 @@ class WebNavigatorTool:
             result = None
             
             if action == "read":
-                result = await self.read_info(self.page, url)
+                # Reads get their own page so several can run concurrently without
+                # fighting over the shared page used by the other actions
+                page = await self.browser.new_page()
+                try:
+                    result = await self.read_info(page, url)
+                finally:
+                    await page.close()
             elif action == "navigate":
                 result = await self.navigate_website(self.page, url)
             elif action == "download":
@@ -184,6 +198,7 @@ class WebNavigatorTool:
             error_msg = f"An error occurred while performing action '{action}' on {url}: {str(e)}"
             return ToolResult(error=error_msg)
 
+    @traced("web.read_info")
     async def read_info(
             self, 
             page, 
@@ -212,8 +227,9 @@ class WebNavigatorTool:
                 preserve_links: Whether to preserve href attributes in the output
                 max_length: Maximum length of returned content
             """
-            await page.goto(url)
-            raw_html = await page.content()
+            with span("web.goto", url=url):
+                await page.goto(url)
+                raw_html = await page.content()
             self.session_history.append(f"read_info: {url}")
             
             # Create BeautifulSoup object for parsing
@@ -333,6 +349,7 @@ class WebNavigatorTool:
             structure.append("\nLinks:\n" + "\n".join(links))
 
         return "\n\n".join(structure)
+    @traced("web.navigate")
     async def navigate_website(self, page, url: str) -> str:
         """
         Navigates to the specified URL and returns the page title.
@@ -343,6 +360,7 @@ class WebNavigatorTool:
         logging.info("Navigated to '%s' with title '%s'.", url, title)
         return f"Navigated to {url}. Page title: {title}"
 
+    @traced("web.download")
     async def download_file(self, page, url: str, file_path: str) -> str:
         """
         Downloads a file from the specified URL and saves it to the given file path.
@@ -357,6 +375,7 @@ class WebNavigatorTool:
         logging.info("Downloaded file from '%s' to '%s'.", url, save_path)
         return f"File downloaded and saved to {save_path}"
 
+    @traced("web.fill_form")
     async def fill_form(self, page, url: str, form_selector: str, form_data: Dict[str, str]) -> str:
         """
         Fills out a form identified by form_selector with the provided form_data.
@@ -369,6 +388,7 @@ class WebNavigatorTool:
         logging.info("Filled form on '%s' with data '%s'.", url, form_data)
         return f"Form on {url} filled with provided data and submitted."
 
+    @traced("web.extract_data")
     async def extract_data(self, page, url: str, data_selector: str) -> str:
         """
         Extracts and returns data from the specified selector on the webpage.
@@ -379,6 +399,7 @@ class WebNavigatorTool:
         logging.info("Extracted data from '%s' using selector '%s'.", url, data_selector)
         return data
 
+    @traced("web.click_element")
     async def click_element(self, page, url: str, element_selector: str) -> str:
         """
         Clicks an element identified by the selector on the webpage.
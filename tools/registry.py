@@ -0,0 +1,139 @@
+"""Lazy registry of the agent's tools.
+
+Tool modules pull in heavy dependencies (Playwright, BeautifulSoup, the OpenAI client)
+that most sessions never use. The registry gives ToolCollection the tool schemas from
+static metadata (tool_schemas.json, generated from the tool classes) and imports a
+tool's module only when the model first calls it.
+
+After changing a tool's to_params(), regenerate the metadata with:
+    python -m tools.registry --write
+and check it is current (as CI does) with:
+    python -m tools.registry --check
+"""
+
+import argparse
+import asyncio
+import copy
+import importlib
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from icecream import ic
+
+from .base import ToolResult
+
+SCHEMA_FILE = Path(__file__).with_name("tool_schemas.json")
+
+# Tool name -> (module, class), in the order the tools are offered to the model
+TOOL_CLASSES: Dict[str, Tuple[str, str]] = {
+    "bash": ("tools.bash", "BashTool"),
+    "str_replace_editor": ("tools.edit", "EditTool"),
+    "opinion": ("tools.expert", "GetExpertOpinionTool"),
+    "web_navigator": ("tools.playwright", "WebNavigatorTool"),
+    "project_setup": ("tools.venvsetup", "ProjectSetupTool"),
+}
+
+_schemas: Optional[Dict[str, Dict[str, Any]]] = None
+
+
+def tool_schemas() -> Dict[str, Dict[str, Any]]:
+    """The to_params() of every registered tool, read once from SCHEMA_FILE."""
+    global _schemas
+    if _schemas is None:
+        with open(SCHEMA_FILE, "r", encoding="utf-8") as f:
+            _schemas = json.load(f)
+    return _schemas
+
+
+def tool_class(name: str):
+    """Import the module of tool ``name`` and return its class."""
+    module, class_name = TOOL_CLASSES[name]
+    return getattr(importlib.import_module(module), class_name)
+
+
+class LazyTool:
+    """Stands in for a tool in ToolCollection until the model first calls it.
+
+    to_params() comes from the static metadata. The first call imports the tool's module
+    in a worker thread, so the event loop keeps running, then builds the tool with the
+    keyword arguments given here; later calls go straight to it.
+
+    Usage:
+        collection = ToolCollection(LazyTool("bash", display=display), LazyTool("str_replace_editor"))
+    """
+
+    def __init__(self, name: str, **kwargs):
+        if name not in TOOL_CLASSES:
+            raise ValueError(f"Unknown tool {name!r}. Expected one of: {', '.join(TOOL_CLASSES)}")
+        self.name = name
+        self.kwargs = kwargs
+        self.tool = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def __repr__(self):
+        return f"LazyTool({self.name!r}, loaded={self.tool is not None})"
+
+    def to_params(self) -> Dict[str, Any]:
+        return copy.deepcopy(tool_schemas()[self.name])
+
+    async def load(self):
+        """Import and build the tool if that has not happened yet, and return it."""
+        if self.tool is None:
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self.tool is None:
+                    cls = await asyncio.to_thread(tool_class, self.name)
+                    self.tool = cls(**self.kwargs)
+                    ic(f"Loaded tool {self.name}")
+        return self.tool
+
+    async def __call__(self, **kwargs) -> ToolResult:
+        tool = await self.load()
+        return await tool(**kwargs)
+
+
+def default_tools(display=None) -> List[LazyTool]:
+    """The tools sampling_loop offers the model, none of them imported yet."""
+    return [LazyTool(name, display=display) if name == "bash" else LazyTool(name) for name in TOOL_CLASSES]
+
+
+def _generate() -> Dict[str, Dict[str, Any]]:
+    schemas = {}
+    for name in TOOL_CLASSES:
+        cls = tool_class(name)
+        # to_params() only reads class attributes; skip the constructors' side effects
+        schemas[name] = cls.to_params(cls.__new__(cls))
+    return schemas
+
+
+def check_schemas() -> List[str]:
+    """Names of tools whose metadata differs from their to_params() (imports every tool)."""
+    generated = _generate()
+    stored = tool_schemas()
+    return [name for name in TOOL_CLASSES if generated.get(name) != stored.get(name)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or check the static tool metadata.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--write", action="store_true", help=f"Regenerate {SCHEMA_FILE.name} from the tool classes")
+    group.add_argument("--check", action="store_true", help=f"Exit with 1 if {SCHEMA_FILE.name} is out of date")
+    args = parser.parse_args()
+    if args.write:
+        with open(SCHEMA_FILE, "w", encoding="utf-8") as f:
+            json.dump(_generate(), f, indent=4)
+            f.write("\n")
+        print(f"Wrote {SCHEMA_FILE}")
+        return
+    stale = check_schemas()
+    if stale:
+        print(f"{SCHEMA_FILE.name} is out of date for: {', '.join(stale)}; run python -m tools.registry --write")
+        sys.exit(1)
+    print(f"{SCHEMA_FILE.name} is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,14 @@
 """Utility to run shell commands asynchronously with a timeout."""
 
 import asyncio
+import os
 import re
 import shlex
+from pathlib import Path
 from typing import List, Tuple
 import subprocess
-# from config import *
-TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file the line numbers of what you are looking for. Remember to use you are working in Windows.</NOTE>"
+from config import get_constant
+TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file the line numbers of what you are looking for.</NOTE>"
 MAX_RESPONSE_LEN: int = 16000
 
 class CommandError(Exception):
@@ -77,7 +79,7 @@ def convert_bash_to_powershell(bash_command: str) -> str:
 
     def translate_path(path: str) -> str:
         """Translate Unix-style paths to Windows-style paths."""
-        PROJECT_DIR = get_constant('PROJECT_DIR')
+        PROJECT_DIR = Path(get_constant('PROJECT_DIR'))
         if path.startswith('~'):
             path = path.replace('~', '$env:USERPROFILE')
         path = re.sub(r'\$(?!env:)(\w+)', r'$env:\1', path)  # Avoid double $env:
@@ -225,27 +227,33 @@ async def run(
     cmd: str,
     timeout: float | None = 120.0,  # seconds
     truncate_after: int | None = MAX_RESPONSE_LEN,
+    translate: bool = os.name == "nt",
+    cwd: str | Path | None = None,
 ):
-    """Run a shell command asynchronously with a timeout."""
-    ic()
-    cmd = convert_bash_to_powershell(cmd)
-    ic()
+    """Run a shell command asynchronously with a timeout.
+
+    Returns (returncode, stdout, stderr). With ``translate`` the command is first
+    converted from Bash to PowerShell; on POSIX hosts it goes to /bin/sh unchanged.
+    """
+    if translate:
+        cmd = convert_bash_to_powershell(cmd)
     process = await asyncio.create_subprocess_shell(
-        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd
     )
 
     try:
         stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
         return (
             process.returncode or 0,
-            maybe_truncate(stdout.decode(), truncate_after=truncate_after),
-            maybe_truncate(stderr.decode(), truncate_after=truncate_after),
+            maybe_truncate(stdout.decode(errors="replace"), truncate_after=truncate_after),
+            maybe_truncate(stderr.decode(errors="replace"), truncate_after=truncate_after),
         )
     except asyncio.TimeoutError as exc:
         try:
             process.kill()
         except ProcessLookupError:
             pass
+        await process.wait()
         raise TimeoutError(
             f"Command '{cmd}' timed out after {timeout} seconds"
         ) from exc
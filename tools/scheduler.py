@@ -0,0 +1,222 @@
+"""Concurrent scheduling for the tool_use blocks of a single assistant response."""
+
+import asyncio
+from dataclasses import dataclass
+from pathlib import PurePath
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from icecream import ic
+
+from .base import ToolResult
+
+
+@dataclass(frozen=True)
+class AccessRule:
+    """Describes which calls of a tool only read state, and what they touch.
+
+    Args:
+        selector: Input field that names the operation (e.g. "command" or "action").
+        read_only: Operations that do not change any state.
+        resource: Input field that names the resource the call works on.
+        always_read_only: Every call of the tool is free of side effects.
+        early_start: Read-only calls may start as soon as their tool_use block has
+            streamed, before the rest of the response arrives (see ToolDispatch).
+    """
+
+    selector: Optional[str] = None
+    read_only: FrozenSet[str] = frozenset()
+    resource: Optional[str] = None
+    always_read_only: bool = False
+    early_start: bool = False
+
+
+# Tools that are not listed here (bash, project_setup) can touch anything, including
+# the working directory, so each of their calls runs on its own.
+ACCESS_RULES: Dict[str, AccessRule] = {
+    "str_replace_editor": AccessRule(selector="command", read_only=frozenset({"view"}), resource="path", early_start=True),
+    "web_navigator": AccessRule(selector="action", read_only=frozenset({"read"}), resource="url", early_start=True),
+    "opinion": AccessRule(always_read_only=True),
+}
+
+DEFAULT_CONCURRENCY_LIMITS: Dict[str, int] = {
+    "str_replace_editor": 4,
+    "web_navigator": 2,
+    "opinion": 2,
+}
+
+
+@dataclass(frozen=True)
+class ToolAccess:
+    """How a single tool call accesses state."""
+
+    tool: str
+    read_only: bool
+    resource: Optional[str] = None
+    exclusive: bool = False
+    early_start: bool = False
+
+
+def classify(name: str, tool_input: Dict[str, Any]) -> ToolAccess:
+    """Work out how a tool call accesses state from its name and input."""
+    rule = ACCESS_RULES.get(name)
+    if rule is None:
+        return ToolAccess(tool=name, read_only=False, exclusive=True)
+    if rule.always_read_only:
+        return ToolAccess(tool=name, read_only=True)
+    operation = tool_input.get(rule.selector) if rule.selector else None
+    resource = tool_input.get(rule.resource) if rule.resource else None
+    read_only = operation in rule.read_only
+    return ToolAccess(
+        tool=name,
+        read_only=read_only,
+        resource=str(resource) if resource is not None else None,
+        early_start=read_only and rule.early_start,
+    )
+
+
+def _resources_overlap(a: Optional[str], b: Optional[str]) -> bool:
+    """Conservatively decide whether two resources could be the same thing.
+
+    Paths are compared loosely because tools normalize them differently (relative vs
+    absolute, inside vs outside the project directory): two paths overlap when they share
+    a file name or one is a parent of the other.
+    """
+    if a is None or b is None:
+        return True
+    if a == b:
+        return True
+    pa, pb = PurePath(a.replace("\\", "/")), PurePath(b.replace("\\", "/"))
+    if pa.name == pb.name:
+        return True
+    return _is_parent(pa, pb) or _is_parent(pb, pa)
+
+
+def _is_parent(parent: PurePath, child: PurePath) -> bool:
+    """True if ``parent``'s parts appear inside ``child`` before its last part."""
+    n = len(parent.parts)
+    return n < len(child.parts) and any(
+        child.parts[i:i + n] == parent.parts for i in range(len(child.parts) - n)
+    )
+
+
+def conflicts(earlier: ToolAccess, later: ToolAccess) -> bool:
+    """True if ``later`` has to wait for ``earlier`` to finish."""
+    if earlier.exclusive or later.exclusive:
+        return True
+    if earlier.read_only and later.read_only:
+        return False
+    if earlier.tool != later.tool:
+        return False
+    return _resources_overlap(earlier.resource, later.resource)
+
+
+class ToolScheduler:
+    """Runs the tool calls of one assistant response as concurrently as is safe.
+
+    Each call waits only for earlier calls it conflicts with: reads run in parallel, writes
+    to the same resource keep their original order, and tools without an access rule run
+    alone. Per-tool semaphores cap how many calls of one tool run at once. Results are
+    returned in the order the calls were given, i.e. in tool_use_id order.
+    """
+
+    def __init__(self, collection, limits: Optional[Dict[str, int]] = None):
+        self.collection = collection
+        self.limits = {**DEFAULT_CONCURRENCY_LIMITS, **(limits or {})}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        if name not in self._semaphores:
+            self._semaphores[name] = asyncio.Semaphore(max(1, self.limits.get(name, 1)))
+        return self._semaphores[name]
+
+    async def run_all(self, calls: List[Dict[str, Any]]) -> List[ToolResult]:
+        """Run ``calls`` (dicts with "name" and "input") and return their results in order."""
+        return await ToolDispatch(self, early=False).results(calls)
+
+    async def _run_one(self, call: Dict[str, Any], waits_for: List[asyncio.Task]) -> ToolResult:
+        if waits_for:
+            await asyncio.wait(waits_for)
+        async with self._semaphore(call["name"]):
+            try:
+                result = await self.collection.run(name=call["name"], tool_input=call.get("input") or {})
+            except Exception as e:
+                ic(f"Tool {call['name']} raised: {e}")
+                return ToolResult(error=f"Tool execution failed: {str(e)}")
+        if result is None:
+            return ToolResult(error="Tool execution failed with no result")
+        return result
+
+
+
+class ToolDispatch:
+    """The tool calls of one assistant response, started while the response streams.
+
+    add() is called with each tool_use block as soon as the stream has completed it. A
+    call starts right away when its tool marks the operation as safe for an early start
+    (AccessRule.early_start: ``view``, web reads) and no call before it in the response
+    that has not started yet conflicts with it. Everything else waits for results(),
+    which is given the tool_use blocks of the final message, starts the remaining calls
+    with the usual ToolScheduler ordering and returns all results in tool_use order.
+
+    Early calls are matched to the final message by tool_use id. Calls the final message
+    does not contain (a retried or re-routed request) are cancelled; being read-only,
+    they left nothing behind.
+
+    Usage:
+        dispatch = ToolDispatch(tool_collection.scheduler)
+        response = await stream(on_tool_use=dispatch.add)
+        results = await dispatch.results(tool_uses)
+    """
+
+    def __init__(self, scheduler: ToolScheduler, early: bool = True):
+        self.scheduler = scheduler
+        self.early = early
+        self.started_early = 0
+        # Every tool_use block seen so far, and whether it was started early
+        self._seen: List[tuple] = []
+        self._early: Dict[str, tuple] = {}
+
+    def add(self, call: Dict[str, Any]) -> bool:
+        """Note a completed tool_use block; returns True if it was started."""
+        access = classify(call["name"], call.get("input") or {})
+        start = bool(
+            self.early
+            and access.early_start
+            and call.get("id")
+            and call["id"] not in self._early
+            and not any(conflicts(prev, access) for prev, started in self._seen if not started)
+        )
+        self._seen.append((access, start))
+        if not start:
+            return False
+        waits_for = [task for prev, task in self._early.values() if conflicts(prev, access)]
+        task = asyncio.create_task(self.scheduler._run_one(call, waits_for))
+        self._early[call["id"]] = (access, task)
+        self.started_early += 1
+        ic(f"Started {call['name']} before the response finished")
+        return True
+
+    async def results(self, calls: List[Dict[str, Any]]) -> List[ToolResult]:
+        """Run the calls of the final message that have not started and return all results in order."""
+        accesses: List[ToolAccess] = []
+        tasks: List[asyncio.Task] = []
+        try:
+            for call in calls:
+                access = classify(call["name"], call.get("input") or {})
+                early = self._early.pop(call.get("id"), None)
+                if early is not None:
+                    task = early[1]
+                else:
+                    waits_for = [task for prev, task in zip(accesses, tasks) if conflicts(prev, access)]
+                    task = asyncio.create_task(self.scheduler._run_one(call, waits_for))
+                accesses.append(access)
+                tasks.append(task)
+        finally:
+            self.cancel()
+        return list(await asyncio.gather(*tasks))
+
+    def cancel(self):
+        """Cancel early calls that no final message has claimed."""
+        for _access, task in self._early.values():
+            task.cancel()
+        self._early.clear()
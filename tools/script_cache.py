@@ -0,0 +1,243 @@
+"""Persistent cache of the scripts BashTool generates for its commands.
+
+BashTool sends bash.md and the command to a model, which answers with a Python or
+PowerShell script that is then run. The script depends only on the command, the
+prompt template and the project directory (which the prompt names), so a command seen
+before can skip the model round trip. Entries are keyed on all three; editing bash.md
+changes its hash, and entries made with an older template are dropped the first time
+the new one is used.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from icecream import ic
+
+from config import BASH_SCRIPT_CACHE_ENABLED, BASH_SCRIPT_CACHE_FILE, BASH_SCRIPT_CACHE_SIZE
+from utils.metrics import REGISTRY
+
+SCRIPT_CACHE = REGISTRY.counter("agent_bash_script_cache", "BashTool script cache lookups and evictions.", ("outcome",))
+
+
+def normalize_command(command: str) -> str:
+    """The raw command text with runs of unquoted whitespace collapsed to one space.
+
+    Quotes, escapes and everything inside quotes are kept exactly, since they change
+    what the shell does (``echo $HOME`` and ``echo '$HOME'`` are different commands).
+    """
+    out = []
+    quote = None
+    escaped = False
+    pending_space = False
+    for char in command.strip():
+        if escaped:
+            out.append(char)
+            escaped = False
+            continue
+        if quote is None and char.isspace():
+            pending_space = True
+            continue
+        if pending_space:
+            out.append(" ")
+            pending_space = False
+        out.append(char)
+        if char == "\\" and quote != "'":
+            escaped = True
+        elif quote is None and char in "'\"":
+            quote = char
+        elif char == quote:
+            quote = None
+    return "".join(out)
+
+
+def cache_key(command: str, prompt_sha256: str, project_dir: str) -> str:
+    payload = json.dumps([normalize_command(command), prompt_sha256, str(project_dir)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScriptCache:
+    """LRU cache from (command, bash.md hash, project dir) to a parsed script, kept on disk.
+
+    A hit returns the ``(script_type, script_code)`` the model produced for the same
+    command earlier, and adds the model latency it saved to ``saved_seconds``. Only
+    scripts that ran without error are stored (put()), and a cached script that fails
+    is evicted (evict()), so the next call asks the model again. Past ``max_entries``
+    the least recently used entry is dropped.
+
+    The file is loaded on first use and rewritten (atomically) when an entry is added
+    or removed; the recency order changed by hits is saved with the next write or at exit.
+
+    Usage:
+        cache = get_script_cache()
+        script = cache.get(command, prompt.sha256, project_dir)
+        if script is None:
+            ...  # ask the model, run the script
+            cache.put(command, prompt.sha256, project_dir, script_type, script_code, seconds)
+    """
+
+    def __init__(
+        self,
+        path: Path = BASH_SCRIPT_CACHE_FILE,
+        max_entries: int = BASH_SCRIPT_CACHE_SIZE,
+        enabled: bool = BASH_SCRIPT_CACHE_ENABLED,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loaded = False
+        self._dirty = False
+        self._prompt_sha256: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.saved_seconds = 0.0
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = []
+        except (OSError, json.JSONDecodeError) as e:
+            ic(f"Ignoring unreadable script cache {self.path}: {e}")
+            entries = []
+        # Stored least recently used first
+        for entry in entries:
+            self._entries[entry["key"]] = entry
+        atexit.register(self.save)
+
+    def _invalidate(self, prompt_sha256: str):
+        # bash.md changed: scripts generated from the old template can never match again
+        if prompt_sha256 == self._prompt_sha256:
+            return
+        self._prompt_sha256 = prompt_sha256
+        stale = [key for key, entry in self._entries.items() if entry["prompt_sha256"] != prompt_sha256]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.invalidated += len(stale)
+            SCRIPT_CACHE.inc(len(stale), outcome="invalidated")
+            ic(f"Dropped {len(stale)} cached bash scripts made with an older bash.md")
+            self.save(force=True)
+
+    def get(self, command: str, prompt_sha256: str, project_dir: str) -> Optional[Tuple[str, str]]:
+        """The cached ``(script_type, script_code)`` for ``command``, or None."""
+        if not self.enabled:
+            return None
+        if not self._loaded:
+            self._load()
+        self._invalidate(prompt_sha256)
+        entry = self._entries.get(cache_key(command, prompt_sha256, project_dir))
+        if entry is None:
+            self.misses += 1
+            SCRIPT_CACHE.inc(outcome="miss")
+            return None
+        self._entries.move_to_end(entry["key"])
+        entry["hits"] += 1
+        entry["used"] = time.time()
+        self._dirty = True
+        self.hits += 1
+        self.saved_seconds += entry["seconds"]
+        SCRIPT_CACHE.inc(outcome="hit")
+        return entry["script_type"], entry["script_code"]
+
+    def put(self, command: str, prompt_sha256: str, project_dir: str, script_type: str, script_code: str, seconds: float):
+        """Store a script that ran successfully; ``seconds`` is how long generating it took."""
+        if not self.enabled:
+            return
+        if not self._loaded:
+            self._load()
+        key = cache_key(command, prompt_sha256, project_dir)
+        self._entries[key] = {
+            "key": key,
+            "command": normalize_command(command),
+            "prompt_sha256": prompt_sha256,
+            "project_dir": str(project_dir),
+            "script_type": script_type,
+            "script_code": script_code,
+            "seconds": round(seconds, 3),
+            "hits": 0,
+            "created": time.time(),
+            "used": time.time(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+            SCRIPT_CACHE.inc(outcome="evicted")
+        self.save(force=True)
+
+    def evict(self, command: str, prompt_sha256: str, project_dir: str):
+        """Forget the script for ``command`` (it failed when run from the cache)."""
+        if self._entries.pop(cache_key(command, prompt_sha256, project_dir), None) is not None:
+            self.evictions += 1
+            SCRIPT_CACHE.inc(outcome="failed")
+            self.save(force=True)
+
+    def save(self, force: bool = False):
+        """Write the cache file if anything changed since it was last written."""
+        if not (force or self._dirty) or not self._loaded:
+            return
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(list(self._entries.values()), f, indent=1)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as e:
+            ic(f"Could not write script cache {self.path}: {e}")
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 3),
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+            "saved_seconds": round(self.saved_seconds, 2),
+        }
+
+    def report(self) -> str:
+        """Summarise how many model round trips the cache saved."""
+        lines = ["[bold yellow]Bash Script Cache[/bold yellow] 📜"]
+        lines.append(f"[yellow]Lookups:[/yellow] {self.lookups} ({self.hits} hits, {self.misses} misses, {self.hit_rate:.0%} hit rate)")
+        lines.append(f"[yellow]Model time saved:[/yellow] {self.saved_seconds:.1f}s")
+        if self.evictions or self.invalidated:
+            lines.append(f"[yellow]Evicted:[/yellow] {self.evictions} (invalidated by bash.md changes: {self.invalidated})")
+        return "\n".join(lines)
+
+
+_cache: Optional[ScriptCache] = None
+
+
+def get_script_cache() -> ScriptCache:
+    """The process-wide script cache."""
+    global _cache
+    if _cache is None:
+        _cache = ScriptCache()
+    return _cache
+
+
+def set_script_cache(cache: Optional[ScriptCache]):
+    """Replace the process-wide script cache (e.g. with one in a temporary directory)."""
+    global _cache
+    _cache = cache
@@ -2,7 +2,6 @@ from enum import Enum
 from typing import Literal, Optional, List
 from pathlib import Path
 from .base import ToolResult, BaseAnthropicTool
-import os
 import subprocess
 from icecream import ic
 from rich import print as rr
@@ -105,20 +104,20 @@ class ProjectSetupTool(BaseAnthropicTool):
     async def setup_project(self, project_path: Path, packages: List[str]) -> dict:
         """Sets up a new Python project"""
         project_path.mkdir(parents=True, exist_ok=True)
-        os.chdir(project_path)
 
-        # Setup virtual environment
+        # Setup virtual environment. Commands get cwd= rather than os.chdir(), since the
+        # working directory is shared by every session in the process
         ic("Creating virtual environment...")
-        self.run_command("uv venv")
+        self.run_command("uv venv", cwd=project_path)
         try:
-            self.run_command("uv init")
+            self.run_command("uv init", cwd=project_path)
         except:
             pass
 
         # Install initial packages
         ic("Installing packages...")
         for package in packages:
-            self.run_command(f"uv add {package}")
+            self.run_command(f"uv add {package}", cwd=project_path)
 
         return {
             "command": "setup_project",
@@ -129,11 +128,9 @@ class ProjectSetupTool(BaseAnthropicTool):
 
     async def add_dependencies(self, project_path: Path, packages: List[str]) -> dict:
         """Adds additional dependencies to an existing project"""
-        os.chdir(project_path)
-        
         ic("Installing additional packages...")
         for package in packages:
-            self.run_command(f"uv add {package}")
+            self.run_command(f"uv add {package}", cwd=project_path)
 
         return {
             "command": "add_additional_depends",
@@ -144,11 +141,10 @@ class ProjectSetupTool(BaseAnthropicTool):
 
     async def run_app(self, project_path: Path, filename: str) -> dict:
         """Runs the application using uv run"""
-        os.chdir(project_path)
-        
         try:
             result = subprocess.run(
                 ["uv", "run", filename],
+                cwd=project_path,
                 capture_output=True,
                 text=True,
                 check=True
@@ -1,5 +1,5 @@
 # utils/__init__.py
-from .agent_display import AgentDisplay
+from .agent_display import AgentDisplay, NullDisplay
 from .output_manager import OutputManager
 
-__all__ = ["AgentDisplay", "OutputManager"]
\ No newline at end of file
+__all__ = ["AgentDisplay", "NullDisplay", "OutputManager"]
\ No newline at end of file
@@ -5,6 +5,7 @@ from rich.text import Text
 from rich import box
 from queue import Queue
 import asyncio
+import threading
 
 
 
@@ -23,12 +24,16 @@ class AgentDisplay:
         create_message_panel(messages, title, style): Creates a panel for displaying messages.
         create_tool_panel(results, title, style): Creates a panel for displaying tool results.
         update_display(live): Asynchronously updates the display with new messages.
+        wait_until_drained(timeout): Waits until queued messages have been drawn.
         add_message(msg_type, content): Adds a message to the queue for display.
     Example:
         display = AgentDisplay()
         display.add_message("user", "Hello")
         display.add_message("assistant", "Hi there!")
         display.add_message("tool", ("calculator", "2 + 2 = 4"))
+        display.add_message("assistant_stream", "")  # start a streamed message
+        display.add_message("assistant_delta", "Hi ")
+        display.add_message("assistant_delta", "there!")
     """
     def __init__(self):
         self.user_messages = []
@@ -37,6 +42,11 @@ class AgentDisplay:
         self.message_queue = Queue()
         self.layout = None
         self.live = None  # Add live attribute
+        self._loop = None
+        self._loop_thread = None
+        self._wakeup = None
+        self._drained = None
+        self._stream_index = None
 
     def create_layout(self):
         """Create the main layout with three panels"""
@@ -102,31 +112,83 @@ class AgentDisplay:
             box=box.ROUNDED
         )
 
-    async def update_display(self, live):
-        """Update the display with new messages"""
     async def update_display(self, live, stop_event=None):
-        """Update the display with new messages"""
+        """Update the display whenever new messages are queued.
+
+        Instead of polling on a fixed interval the task sleeps until add_message signals
+        that something was queued, then drains the queue and redraws once.
+        """
         self.live = live  # Set the live attribute
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
         while True:
             if stop_event and stop_event.is_set():
                 break
             if not self.message_queue.empty():
-                msg_type, content = self.message_queue.get()
-                if msg_type == "user":
-                    self.user_messages.append(content)
-                elif msg_type == "assistant":
-                    self.assistant_messages.append(content)
-                elif msg_type == "tool":
-                    self.tool_results.append(content)
-                
+                # Drain everything that is queued so streamed deltas don't lag behind
+                while not self.message_queue.empty():
+                    msg_type, content = self.message_queue.get()
+                    if msg_type == "user":
+                        self.user_messages.append(content)
+                    elif msg_type == "assistant":
+                        self.assistant_messages.append(content)
+                    elif msg_type == "assistant_stream":
+                        # Start a new streamed message; later deltas are appended to it even if
+                        # other assistant messages (e.g. a background summary) arrive in between
+                        self._stream_index = len(self.assistant_messages)
+                        self.assistant_messages.append(content)
+                    elif msg_type == "assistant_delta":
+                        if self._stream_index is None:
+                            self._stream_index = len(self.assistant_messages)
+                            self.assistant_messages.append("")
+                        self.assistant_messages[self._stream_index] += content
+                    elif msg_type == "tool":
+                        self.tool_results.append(content)
+
                 # Force an immediate layout update
                 live.update(self.create_layout())
-                # Smaller sleep time for more responsive updates
-                await asyncio.sleep(0.05)
-            else:
-                await asyncio.sleep(0.1)
-                await asyncio.sleep(0.1)
+            self._drained.set()
+            self._wakeup.clear()
+            try:
+                # The timeout only bounds how long it takes to notice stop_event
+                await asyncio.wait_for(self._wakeup.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_until_drained(self, timeout: float = 1.0) -> bool:
+        """
+        Waits until every queued message has been drawn by update_display.
+
+        Args:
+            timeout: Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the queue drained, False on timeout. Returns True immediately
+            when no update_display task is running.
+        """
+        if self._drained is None:
+            return True
 
+        async def _wait():
+            while not (self._drained.is_set() and self.message_queue.empty()):
+                if self._drained.is_set():
+                    # A message was queued from another thread and its wakeup is still pending
+                    await asyncio.sleep(0)
+                else:
+                    await self._drained.wait()
+
+        try:
+            await asyncio.wait_for(_wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _notify(self):
+        """Wake update_display and mark the queue as not yet drawn."""
+        self._drained.clear()
+        self._wakeup.set()
 
     def add_message(self, msg_type, content):
         """
@@ -141,6 +203,11 @@ class AgentDisplay:
         """
         try:
             self.message_queue.put((msg_type, content))
+            if self._loop is not None:
+                if threading.get_ident() == self._loop_thread:
+                    self._notify()
+                else:
+                    self._loop.call_soon_threadsafe(self._notify)
         except Exception as e:
             print(f"Error adding message to queue: {e}")
 
@@ -157,10 +224,25 @@ class AgentDisplay:
             self.user_messages.clear()
         if layout_name == "assistant" or "all":
             self.assistant_messages.clear()
+            self._stream_index = None
         if layout_name == "tool" or "all":
             self.tool_results.clear()
         # Force an immediate layout update
-        self.live.update(self.create_layout())
+        if self.live:
+            self.live.update(self.create_layout())
+
+
+            
 
+class NullDisplay(AgentDisplay):
+    """A display sink for headless runs: messages are dropped instead of queued.
 
-            
\ No newline at end of file
+    It never starts update_display or a Live display, so sampling_loop can run
+    without a terminal (batch runs, benchmarks) and without the queue growing forever.
+    """
+
+    def add_message(self, msg_type, content):
+        pass
+
+    def clear_messages(self, layout_name):
+        pass
@@ -0,0 +1,215 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Type
+
+from icecream import ic
+
+from config import CACHE_DIR, CASSETTE_MATCH, CASSETTE_MODE, CASSETTE_NAME
+
+CASSETTE_MODES = ("off", "record", "replay")
+CASSETTE_MATCHES = ("request", "sequence")
+CASSETTE_DIR = CACHE_DIR / "cassettes"
+
+
+class CassetteMiss(LookupError):
+    """A request has no recorded response in the cassette being replayed."""
+
+
+def _normalize(value: Any) -> Any:
+    # cache_control markers move between turns without changing what is asked
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k != "cache_control"}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, Path):
+        return str(value)
+    return value
+
+
+def request_key(site: str, request: Dict[str, Any]) -> str:
+    """Stable hash of a normalized request made from ``site``."""
+    payload = json.dumps({"site": site, "request": _normalize(request)}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Records model responses to disk and plays them back without the network.
+
+    Every model call goes through call() with a ``site`` label ("main", "summary",
+    "bash_script", ...), the request it is about to send and a coroutine function that
+    sends it. In "record" mode the response, its latency and (for streams) its time to
+    first token are appended to a gzip compressed JSONL file under CACHE_DIR/cassettes.
+    In "replay" mode the response recorded for the same normalized request is returned
+    after sleeping for the recorded latency scaled by ``speed`` (0 replays instantly).
+    With ``match="sequence"``, a request that was never recorded gets the next unused
+    response recorded at the same site, which keeps a replay going when tool output
+    (timestamps, temp paths) makes later requests differ slightly from the recording.
+    In "off" mode call() just awaits ``fetch``.
+
+    Usage:
+        cassette = get_cassette()
+        response = await cassette.call("summary", request, lambda: client.messages.create(**request), Message)
+    """
+
+    def __init__(
+        self,
+        name: str = CASSETTE_NAME,
+        mode: str = CASSETTE_MODE,
+        match: str = CASSETTE_MATCH,
+        speed: float = 1.0,
+        directory: Path = CASSETTE_DIR,
+    ):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {CASSETTE_MODES}")
+        if match not in CASSETTE_MATCHES:
+            raise ValueError(f"Unknown cassette match {match!r}; expected one of {CASSETTE_MATCHES}")
+        self.name = name
+        self.mode = mode
+        self.match = match
+        self.speed = speed
+        self.path = Path(directory) / f"{name}.jsonl.gz"
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._loaded = False
+        self._entries: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, Deque[int]] = defaultdict(deque)
+        self._by_site: Dict[str, Deque[int]] = defaultdict(deque)
+        self._used: set = set()
+        if mode == "replay":
+            # Load up front so the first replayed call is not slowed down by it
+            self._load()
+
+    @property
+    def active(self) -> bool:
+        return self.mode != "off"
+
+    def _load(self):
+        self._loaded = True
+        if not self.path.exists():
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from an interrupted recording
+                    continue
+                index = len(self._entries)
+                self._entries.append(entry)
+                self._by_key[entry["key"]].append(index)
+                self._by_site[entry["site"]].append(index)
+        ic(f"Cassette {self.path.name}: {len(self._entries)} recorded responses")
+
+    def _take(self, queue: Deque[int]) -> Optional[Dict[str, Any]]:
+        while queue:
+            index = queue.popleft()
+            if index not in self._used:
+                self._used.add(index)
+                return self._entries[index]
+        return None
+
+    def _lookup(self, site: str, key: str) -> Dict[str, Any]:
+        if not self._loaded:
+            self._load()
+        entry = self._take(self._by_key[key])
+        if entry is None and self.match == "sequence":
+            entry = self._take(self._by_site[site])
+        if entry is None:
+            self.misses += 1
+            raise CassetteMiss(f"No recorded response for {site} request {key[:12]} in {self.path}")
+        self.hits += 1
+        return entry
+
+    def _append(self, entry: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Every append is its own gzip member, so the file stays valid after a crash
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+        self.recorded += 1
+
+    async def call(
+        self,
+        site: str,
+        request: Dict[str, Any],
+        fetch: Callable[[], Awaitable[Any]],
+        response_type: Type,
+        on_replay: Optional[Callable[[Any], None]] = None,
+        timing: Optional[Dict[str, float]] = None,
+    ) -> Any:
+        """Send ``request`` with ``fetch`` or serve it from the cassette.
+
+        Args:
+            site: Label of the call site; part of the key and used for sequence matching.
+            request: The request parameters, used to build the key.
+            fetch: Coroutine function that sends the request and returns the response.
+            response_type: Pydantic model the response is rebuilt with on replay.
+            on_replay: Called with a replayed response at its recorded time to first token,
+                so streaming callers can show the text they would have streamed.
+            timing: For streaming callers: a dict in which ``fetch`` stores the
+                time.perf_counter() of the first token under "first_token".
+        """
+        if self.mode == "off":
+            return await fetch()
+
+        key = request_key(site, request)
+        if self.mode == "replay":
+            entry = self._lookup(site, key)
+            latency = entry["latency"] * self.speed
+            first_token = min(latency, (entry.get("first_token") or 0.0) * self.speed)
+            response = response_type.model_validate(entry["response"])
+            if first_token:
+                await asyncio.sleep(first_token)
+            if on_replay:
+                on_replay(response)
+            if latency > first_token:
+                await asyncio.sleep(latency - first_token)
+            return response
+
+        timing = timing if timing is not None else {}
+        start = time.perf_counter()
+        response = await fetch()
+        latency = time.perf_counter() - start
+        first_token = timing.get("first_token")
+        self._append({
+            "key": key,
+            "site": site,
+            "recorded_at": time.time(),
+            "latency": round(latency, 4),
+            "first_token": round(first_token - start, 4) if first_token else None,
+            "response": response.model_dump(mode="json"),
+        })
+        return response
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Cassette:
+    """The process-wide cassette, configured from config.py.
+
+    The CASSETTE_MODE, CASSETTE_NAME, CASSETTE_MATCH and CASSETTE_SPEED environment
+    variables override the configured values, so benchmarks can switch modes without
+    editing config.
+    """
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette(
+            name=os.getenv("CASSETTE_NAME", CASSETTE_NAME),
+            mode=os.getenv("CASSETTE_MODE", CASSETTE_MODE),
+            match=os.getenv("CASSETTE_MATCH", CASSETTE_MATCH),
+            speed=float(os.getenv("CASSETTE_SPEED", "1.0")),
+        )
+    return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]):
+    """Replace the process-wide cassette (None goes back to the configured one)."""
+    global _cassette
+    _cassette = cassette
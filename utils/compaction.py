@@ -0,0 +1,219 @@
+import asyncio
+import json
+from typing import List, Optional, Tuple
+
+from anthropic.types import Message
+from anthropic.types.beta import BetaMessageParam
+from icecream import ic
+
+from config import (
+    COMPACTION_KEEP_RECENT,
+    COMPACTION_TRIGGER_RATIO,
+    CONTEXT_TOKEN_BUDGET,
+    MAX_SUMMARY_TOKENS,
+    SUMMARY_MODEL,
+)
+from .agent_display import AgentDisplay
+from .cassette import get_cassette
+from .message_store import MessageStore
+from .request_scheduler import PRIORITY_COMPACTION, RequestScheduler
+from .tracing import traced
+from .token_counter import TokenCounter
+
+SUMMARY_MARKER = "[CONVERSATION SUMMARY]"
+
+COMPACTION_PROMPT = """Please provide a detailed technical summary of this part of a coding agent's conversation.
+It will replace these messages in the agent's context, so anything not in the summary is lost.
+Use exactly these sections:
+
+## Files
+All file names, paths and directory structures created, modified or inspected.
+## Actions
+Specific actions taken (tool calls and commands) and their outcomes, in order.
+## Decisions
+Technical decisions made and solutions implemented, with the reason for each.
+## Code
+Important code that was written or modified, quoted briefly.
+## Status
+The current state of the task and any pending or incomplete items.
+
+Original task prompt for context:
+{original_prompt}
+
+Conversation to summarize:
+{conversation}"""
+
+
+def _has_cache_breakpoint(message: BetaMessageParam) -> bool:
+    content = message["content"]
+    return isinstance(content, list) and any(
+        isinstance(block, dict) and "cache_control" in block for block in content
+    )
+
+
+def _conversation_text(messages: List[BetaMessageParam]) -> str:
+    conversation_text = ""
+    for msg in messages:
+        role = msg['role'].upper()
+        if isinstance(msg['content'], list):
+            for block in msg['content']:
+                if isinstance(block, dict):
+                    if block.get('type') == 'text':
+                        conversation_text += f"\n{role}: {block.get('text', '')}"
+                    elif block.get('type') == 'tool_use':
+                        conversation_text += f"\n{role} (Tool Call {block.get('name')}): {json.dumps(block.get('input', {}))}"
+                    elif block.get('type') == 'tool_result':
+                        for item in block.get('content', []):
+                            if item.get('type') == 'text':
+                                conversation_text += f"\n{role} (Tool Result): {item.get('text', '')}"
+        else:
+            conversation_text += f"\n{role}: {msg['content']}"
+    return conversation_text
+
+
+class ContextCompactor:
+    """Keeps the conversation under a token budget by summarizing its oldest span.
+
+    Token estimates come from a TokenCounter, which counts each message once. Once the
+    history passes ``trigger_ratio * token_budget`` a summary of the oldest span is
+    requested in a background task, so it is usually ready before the budget itself is
+    reached. The
+    summary replaces that span on the first turn after it arrives. The first (task)
+    message, the most recent ``keep_recent`` messages and any message still carrying a
+    prompt-cache breakpoint are never summarized, and the kept tail always starts with
+    an assistant message so tool_use / tool_result pairs stay together.
+
+    maybe_compact() never waits on the model, so compaction never stalls a turn.
+    """
+
+    def __init__(
+        self,
+        scheduler: RequestScheduler,
+        display: Optional[AgentDisplay] = None,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        trigger_ratio: float = COMPACTION_TRIGGER_RATIO,
+        keep_recent: int = COMPACTION_KEEP_RECENT,
+        model: str = SUMMARY_MODEL,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        self.scheduler = scheduler
+        self.display = display
+        self.token_budget = token_budget
+        self.trigger_ratio = trigger_ratio
+        self.keep_recent = keep_recent
+        self.model = model
+        self.compactions = 0
+        self.tokens_removed = 0
+        self.token_counter = token_counter or TokenCounter()
+        self._task: Optional[asyncio.Task] = None
+        self._span: List[BetaMessageParam] = []
+        self._retry_above = 0
+
+    @property
+    def trigger_tokens(self) -> int:
+        return int(self.token_budget * self.trigger_ratio)
+
+    def message_tokens(self, message: BetaMessageParam) -> int:
+        """Estimated tokens for one message, computed once per message."""
+        return self.token_counter.count_message(message)
+
+    def estimate(self, messages: List[BetaMessageParam]) -> int:
+        return self.token_counter.count_messages(messages)
+
+    def maybe_compact(self, messages: List[BetaMessageParam], store: Optional[MessageStore] = None) -> bool:
+        """Apply a finished summary and start a new one when the history is large enough.
+
+        Returns True if ``messages`` was compacted in place.
+        """
+        compacted = False
+        if self._task is not None and self._task.done():
+            compacted = self._apply(messages, store)
+
+        total = self.estimate(messages)
+        if self._task is None and total >= max(self.trigger_tokens, self._retry_above):
+            span = self._select_span(messages)
+            if span:
+                start, end = span
+                self._span = messages[start:end]
+                self._task = asyncio.create_task(self._summarize(messages[0], self._span))
+                ic(f"Compaction started: messages {start}-{end}, ~{total:,} tokens")
+        return compacted
+
+    def _select_span(self, messages: List[BetaMessageParam]) -> Optional[Tuple[int, int]]:
+        end = len(messages) - self.keep_recent
+        for index in range(1, max(1, end)):
+            if _has_cache_breakpoint(messages[index]):
+                end = index
+                break
+        while end > 1 and messages[end]["role"] != "assistant":
+            end -= 1
+        if end - 1 < 2:
+            return None
+        return 1, end
+
+    @traced("compaction.summarize")
+    async def _summarize(self, first: BetaMessageParam, span: List[BetaMessageParam]) -> str:
+        original_prompt = first["content"] if isinstance(first["content"], str) else _conversation_text([first])
+        request = {
+            "model": self.model,
+            "max_tokens": MAX_SUMMARY_TOKENS,
+            "messages": [{
+                "role": "user",
+                "content": COMPACTION_PROMPT.format(
+                    original_prompt=original_prompt,
+                    conversation=_conversation_text(span),
+                ),
+            }],
+        }
+        response = await get_cassette().call(
+            "compaction",
+            request,
+            lambda: self.scheduler.submit(lambda client: client.messages.create(**request), PRIORITY_COMPACTION),
+            Message,
+        )
+        return response.content[0].text
+
+    def _apply(self, messages: List[BetaMessageParam], store: Optional[MessageStore]) -> bool:
+        task, span = self._task, self._span
+        self._task, self._span = None, []
+        try:
+            summary = task.result()
+        except Exception as e:
+            # Try again once the history has grown a little more
+            ic(f"Compaction failed: {e}")
+            self._retry_above = int(self.estimate(messages) * 1.1)
+            return False
+
+        start = next((i for i, message in enumerate(messages) if message is span[0]), None)
+        end = start + len(span) if start is not None else None
+        if start is None or end > len(messages) or any(a is not b for a, b in zip(messages[start:end], span)):
+            ic("Compaction discarded: history changed while the summary was generated")
+            return False
+        if end < len(messages) and messages[end]["role"] != "assistant":
+            return False
+
+        removed = sum(self.message_tokens(message) for message in span)
+        summary_message: BetaMessageParam = {
+            "role": "user",
+            "content": [{"type": "text", "text": f"{SUMMARY_MARKER}\n\n{summary}"}],
+        }
+        messages[start:end] = [summary_message]
+        self.token_counter.forget(span)
+        if store:
+            store.reset()
+        self.compactions += 1
+        self.tokens_removed += removed - self.message_tokens(summary_message)
+        self._retry_above = 0
+        if self.display:
+            self.display.add_message("assistant", f"Compacted {len(span)} older messages (~{removed:,} tokens) into a summary.")
+        return True
+
+    async def aclose(self):
+        """Cancel a summary that is still being generated."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
@@ -0,0 +1,210 @@
+import atexit
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from icecream import ic
+
+from config import (
+    DEBUG_LOG_BACKUPS,
+    DEBUG_LOG_BUFFER_LINES,
+    DEBUG_LOG_FILE,
+    DEBUG_LOG_FLUSH_INTERVAL,
+    DEBUG_LOG_MAX_BYTES,
+)
+
+# Records formatted by the writer between yields of the GIL
+_CHUNK = 64
+
+
+def _backup(path: Path, n: int) -> Path:
+    return path.with_name(f"{path.name}.{n}.gz")
+
+
+def rotate_file(path: Path, backups: int):
+    """Move ``path`` to ``<name>.1.gz`` (gzipped), shifting older rotations up and keeping
+    ``backups`` of them; with no backups the file is just removed."""
+    if backups <= 0:
+        path.unlink()
+        return
+    _backup(path, backups).unlink(missing_ok=True)
+    for n in range(backups - 1, 0, -1):
+        if _backup(path, n).exists():
+            os.replace(_backup(path, n), _backup(path, n + 1))
+    # Move the full file aside first so the next write starts a new one even if
+    # compressing fails halfway
+    rotating = path.with_name(f"{path.name}.rotating")
+    os.replace(path, rotating)
+    with open(rotating, "rb") as src, gzip.open(_backup(path, 1), "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    rotating.unlink()
+
+
+class DebugLog:
+    """Debug output (what ic() prints) written to a JSONL file off the calling thread.
+
+    write() only appends the text and a timestamp to a bounded in-memory buffer: no
+    file I/O, no formatting and no lock shared with the writer, so the cost at a call
+    site stays a few microseconds however slow the disk is. When the buffer holds
+    ``max_lines`` records the oldest one is dropped (and counted) rather than making the
+    caller wait; the file notes how many were dropped. A background thread drains the
+    buffer every ``flush_interval`` seconds, or sooner once it is half full, formatting in
+    small chunks so it never holds the GIL for long, and appends one JSON object per record:
+        {"ts": "2024-12-01T10:00:00.123456", "msg": "ic| loop_live.py:412 ... "}
+    with ``tool_input`` added as parsed JSON when the message carries one.
+
+    A file that would grow past ``max_bytes`` is rotated first: it becomes
+    ``debug_log.json.1.gz`` (gzipped by the writer thread) and older rotations shift up,
+    keeping ``backups`` of them.
+
+    Usage:
+        log = install_debug_log()   # ic() now writes to DEBUG_LOG_FILE
+        ...
+        log.flush()                 # e.g. before reading the file
+    """
+
+    def __init__(
+        self,
+        path: Path = DEBUG_LOG_FILE,
+        max_bytes: int = DEBUG_LOG_MAX_BYTES,
+        backups: int = DEBUG_LOG_BACKUPS,
+        max_lines: int = DEBUG_LOG_BUFFER_LINES,
+        flush_interval: float = DEBUG_LOG_FLUSH_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self._pending: Deque[Tuple[float, str]] = deque(maxlen=max_lines)
+        self._wake_at = max(1, max_lines // 2)
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self._reported_dropped = 0
+        self.rotations = 0
+
+    def write(self, s: str):
+        """Queue one piece of debug output; used as ic's outputFunction."""
+        pending = self._pending
+        if len(pending) >= self.max_lines:
+            self.dropped += 1
+        pending.append((time.time(), s))
+        if self._thread is None:
+            self._start_writer()
+        elif len(pending) >= self._wake_at:
+            self._wake.set()
+
+    def _start_writer(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run_writer, name="debug-log-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run_writer(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _record(self, ts: float, s: str) -> str:
+        record: Dict[str, Any] = {"ts": datetime.fromtimestamp(ts).isoformat(timespec="microseconds"), "msg": s}
+        if "tool_input: " in s:
+            json_part = s.split("tool_input: ", 1)[1].strip()
+            if json_part.startswith("{") and json_part.endswith("}"):
+                try:
+                    record["tool_input"] = json.loads(json_part)
+                except json.JSONDecodeError:
+                    pass
+        return json.dumps(record, default=str)
+
+    def flush(self):
+        """Write every buffered record to the log file."""
+        with self._write_lock:
+            # Only what is queued now; records added meanwhile wait for the next flush
+            count = len(self._pending)
+            if not count:
+                return
+            lines = []
+            for i in range(count):
+                lines.append(self._record(*self._pending.popleft()))
+                if i % _CHUNK == _CHUNK - 1:
+                    # Let waiting threads have the GIL between chunks of formatting
+                    time.sleep(0)
+            if self.dropped > self._reported_dropped:
+                lines.append(json.dumps({
+                    "ts": datetime.now().isoformat(timespec="microseconds"),
+                    "msg": f"{self.dropped - self._reported_dropped} debug records dropped (buffer full)",
+                }))
+                self._reported_dropped = self.dropped
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                if self.max_bytes:
+                    try:
+                        size = self.path.stat().st_size
+                    except FileNotFoundError:
+                        size = 0
+                    if size and size + len(data) > self.max_bytes:
+                        self._rotate()
+                with open(self.path, "ab") as f:
+                    f.write(data)
+                self.written += count
+            except OSError:
+                # Debug logging must never break the agent
+                pass
+
+    def _rotate(self):
+        rotate_file(self.path, self.backups)
+        self.rotations += 1
+
+    def close(self):
+        """Stop the writer thread after writing what is still buffered."""
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "rotations": self.rotations,
+        }
+
+
+_debug_log: Optional[DebugLog] = None
+
+
+def get_debug_log() -> DebugLog:
+    """The process-wide debug log."""
+    global _debug_log
+    if _debug_log is None:
+        _debug_log = DebugLog()
+    return _debug_log
+
+
+def install_debug_log(log: Optional[DebugLog] = None) -> DebugLog:
+    """Send ic() output to ``log`` (the process-wide debug log by default).
+
+    ic is one shared object, so this is done once at import time, not per call.
+    """
+    global _debug_log
+    if log is not None:
+        _debug_log = log
+    log = get_debug_log()
+    ic.configureOutput(includeContext=True, outputFunction=log.write)
+    return log
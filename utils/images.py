@@ -0,0 +1,306 @@
+import base64
+import binascii
+import io
+import math
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from anthropic.types.beta import BetaMessageParam
+from icecream import ic
+
+from config import IMAGE_AUTO_CROP, IMAGE_FORMAT, IMAGE_JPEG_QUALITY, IMAGE_TOKEN_BUDGET
+from .message_store import MessageStore
+
+# (Image, ImageChops) once Pillow is imported, False if it is not installed
+_pil_modules = None
+
+# The API bills about (width * height) / 750 tokens per image, after scaling anything
+# whose long edge passes 1568 px or whose area passes ~1.15 megapixels down to fit.
+PIXELS_PER_TOKEN = 750
+MAX_LONG_EDGE = 1568
+MAX_PIXELS = 1_150_000
+# Lossier encodings tried, in order, when the re-encoded image is larger than the original:
+# (palette colours, JPEG quality) per step
+FALLBACK_ENCODINGS = ((64, 60), (16, 40))
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Tokens the API bills for an image of this size, after its own downscaling."""
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(1.0, MAX_LONG_EDGE / max(width, height), math.sqrt(MAX_PIXELS / (width * height)))
+    return math.ceil((width * scale) * (height * scale) / PIXELS_PER_TOKEN)
+
+
+def _pil():
+    """Pillow's Image and ImageChops modules, imported on first use (not at startup)."""
+    global _pil_modules
+    if _pil_modules is None:
+        try:
+            from PIL import Image, ImageChops
+            _pil_modules = (Image, ImageChops)
+        except ImportError:  # Pillow is optional; without it images are sent as they are
+            _pil_modules = False
+    return _pil_modules or None
+
+
+def _png_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Width and height from a PNG header, without decoding the image."""
+    if data[:8] != b"\x89PNG\r\n\x1a\n" or len(data) < 24:
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+@dataclass
+class PreparedImage:
+    """An image ready for a tool_result, and what preparing it changed."""
+
+    data: str
+    media_type: str
+    tokens_before: int = 0
+    tokens_after: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+
+class ImagePipeline:
+    """Crops, resizes and recompresses tool images to a token budget before they are sent.
+
+    Screenshots are the largest blocks the agent sends, and the API bills them by pixel
+    count. Each image is cropped to its content (uniform borders removed), scaled down so
+    it costs at most ``token_budget`` tokens, and encoded as PNG or JPEG, whichever is
+    smaller (``image_format="auto"``). The result is never larger than the original: when
+    resampling makes it bigger, smaller palettes and lower JPEG quality are tried, and the
+    original is sent if none of them fits. Images that already fit and cannot be made
+    smaller are left alone. Totals of tokens and bytes saved are kept for the session report.
+
+    Pillow is optional; without it images pass through unchanged and only their token
+    cost is counted.
+
+    Usage:
+        pipeline = ImagePipeline()
+        prepared = pipeline.prepare(result.base64_image)
+        result = result.replace(base64_image=prepared.data, media_type=prepared.media_type)
+    """
+
+    def __init__(
+        self,
+        token_budget: int = IMAGE_TOKEN_BUDGET,
+        auto_crop: bool = IMAGE_AUTO_CROP,
+        image_format: str = IMAGE_FORMAT,
+        jpeg_quality: int = IMAGE_JPEG_QUALITY,
+    ):
+        if image_format not in ("auto", "png", "jpeg"):
+            raise ValueError(f"Unknown image format {image_format!r}; expected 'auto', 'png' or 'jpeg'")
+        self.token_budget = token_budget
+        self.auto_crop = auto_crop
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.images = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.seconds = 0.0
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+    def _record(self, prepared: PreparedImage, started: float) -> PreparedImage:
+        self.images += 1
+        self.tokens_before += prepared.tokens_before
+        self.tokens_after += prepared.tokens_after
+        self.bytes_before += prepared.bytes_before
+        self.bytes_after += prepared.bytes_after
+        self.seconds += time.perf_counter() - started
+        return prepared
+
+    def _crop(self, image):
+        Image, ImageChops = _pil()
+        # Anything that differs from the top-left pixel is content
+        background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+        box = ImageChops.difference(image, background).getbbox()
+        if box and box != (0, 0) + image.size:
+            return image.crop(box)
+        return image
+
+    def _candidates(self, image, colors: int, quality: int, lossless: bool = False) -> List[Tuple[bytes, str]]:
+        candidates = []
+        if self.image_format in ("auto", "png"):
+            if lossless:
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                candidates.append((buffer.getvalue(), "image/png"))
+            buffer = io.BytesIO()
+            image.convert("RGB").quantize(colors=colors).save(buffer, format="PNG")
+            candidates.append((buffer.getvalue(), "image/png"))
+        if self.image_format in ("auto", "jpeg"):
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, format="JPEG", quality=quality)
+            candidates.append((buffer.getvalue(), "image/jpeg"))
+        return candidates
+
+    def _encode(self, image, max_bytes: int) -> Optional[Tuple[bytes, str]]:
+        """The smallest encoding of ``image`` no larger than ``max_bytes``, or None."""
+        # Resampled text has many grey levels; a 256-colour palette keeps it legible
+        # and is usually far smaller for screenshots
+        steps = [(256, self.jpeg_quality, True)]
+        # Those grey levels can also make a busy page several times larger than the
+        # original; then give up some fidelity rather than send more bytes
+        steps += [(colors, min(quality, self.jpeg_quality), False) for colors, quality in FALLBACK_ENCODINGS]
+        for colors, quality, lossless in steps:
+            fitting = [c for c in self._candidates(image, colors, quality, lossless) if len(c[0]) <= max_bytes]
+            if fitting:
+                return min(fitting, key=lambda candidate: len(candidate[0]))
+        return None
+
+    def prepare(self, data: str, media_type: str = "image/png") -> PreparedImage:
+        """Return ``data`` (base64) cropped, scaled and re-encoded to fit the token budget."""
+        started = time.perf_counter()
+        try:
+            raw = base64.b64decode(data)
+        except (binascii.Error, ValueError):
+            return PreparedImage(data, media_type)
+        unchanged = PreparedImage(data, media_type, bytes_before=len(raw), bytes_after=len(raw))
+
+        pil = _pil()
+        if pil is None:
+            size = _png_size(raw)
+            if size:
+                unchanged.tokens_before = unchanged.tokens_after = image_tokens(*size)
+            return self._record(unchanged, started)
+
+        Image = pil[0]
+        try:
+            image = Image.open(io.BytesIO(raw))
+            image.load()
+        except Exception as e:
+            ic(f"Image could not be decoded, sending it as is: {e}")
+            return self._record(unchanged, started)
+
+        if image.mode not in ("RGB", "RGBA", "L"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        unchanged.tokens_before = unchanged.tokens_after = image_tokens(*image.size)
+
+        if self.auto_crop:
+            image = self._crop(image)
+        width, height = image.size
+        scale = min(1.0, MAX_LONG_EDGE / max(width, height))
+        if self.token_budget and width * height * scale * scale > self.token_budget * PIXELS_PER_TOKEN:
+            scale = math.sqrt(self.token_budget * PIXELS_PER_TOKEN / (width * height))
+        if scale < 1.0:
+            image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+        best = self._encode(image, max_bytes=len(raw))
+        tokens_after = image_tokens(*image.size)
+        if best is None or (len(best[0]) >= len(raw) and tokens_after >= unchanged.tokens_before):
+            # Nothing gained, or only by sending more bytes; keep the original
+            return self._record(unchanged, started)
+        encoded, new_type = best
+        return self._record(
+            PreparedImage(
+                data=base64.b64encode(encoded).decode("ascii"),
+                media_type=new_type,
+                tokens_before=unchanged.tokens_before,
+                tokens_after=tokens_after,
+                bytes_before=len(raw),
+                bytes_after=len(encoded),
+            ),
+            started,
+        )
+
+    def report(self) -> str:
+        """Summarise the images prepared this session."""
+        lines = [
+            "[bold yellow]Images[/bold yellow] 🖼️",
+            f"[yellow]Images Prepared:[/yellow] {self.images}",
+            f"[yellow]Image Tokens:[/yellow] {self.tokens_before:,} -> {self.tokens_after:,} (saved ~{self.tokens_saved:,} per request)",
+            f"[yellow]Image Bytes:[/yellow] {self.bytes_before:,} -> {self.bytes_after:,}",
+            f"[yellow]Preparation Time:[/yellow] {self.seconds * 1000:.0f}ms",
+        ]
+        return "\n".join(lines)
+
+
+class ImageIndex:
+    """Tracks where the images in the conversation are, as messages are appended.
+
+    The retention rule (keep the newest ``keep`` images in tool results) used to rescan
+    every message and tool_result on every turn. The index only scans messages appended
+    since the last call and keeps the images oldest first, so enforcing the rule costs
+    O(new messages + images removed). If the history is rewritten (compaction, a resumed
+    session) the index is rebuilt once.
+
+    Usage:
+        index = ImageIndex()
+        removed = index.enforce(messages, keep=2, min_removal_threshold=1, store=message_store)
+    """
+
+    def __init__(self):
+        # (message index, message, tool_result content list, image block), oldest first
+        self._images: List[Tuple[int, BetaMessageParam, List[Any], dict]] = []
+        self._scanned: List[BetaMessageParam] = []
+        self.removed = 0
+
+    def __len__(self):
+        return len(self._images)
+
+    def _rewritten(self, messages: List[BetaMessageParam]) -> bool:
+        count = len(self._scanned)
+        return count > len(messages) or (count > 0 and messages[count - 1] is not self._scanned[-1])
+
+    def update(self, messages: List[BetaMessageParam]):
+        """Index the images of messages appended since the last update."""
+        if self._rewritten(messages):
+            self._images.clear()
+            self._scanned.clear()
+        for index in range(len(self._scanned), len(messages)):
+            message = messages[index]
+            self._scanned.append(message)
+            content = message["content"]
+            if not isinstance(content, list):
+                continue
+            for block in content:
+                if not (isinstance(block, dict) and block.get("type") == "tool_result"):
+                    continue
+                inner = block.get("content")
+                if isinstance(inner, list):
+                    for item in inner:
+                        if isinstance(item, dict) and item.get("type") == "image":
+                            self._images.append((index, message, inner, item))
+
+    def enforce(
+        self,
+        messages: List[BetaMessageParam],
+        keep: int,
+        min_removal_threshold: int = 1,
+        store: Optional[MessageStore] = None,
+    ) -> int:
+        """Drop the oldest tool_result images so that at most ``keep`` remain.
+
+        Images are removed in multiples of ``min_removal_threshold`` so the prompt
+        prefix (and its cache) changes less often. Returns the number removed.
+        """
+        self.update(messages)
+        to_remove = max(0, len(self._images) - keep)
+        if min_removal_threshold > 1:
+            to_remove -= to_remove % min_removal_threshold
+        touched = set()
+        for index, _message, inner, image in self._images[:to_remove]:
+            for position, item in enumerate(inner):
+                if item is image:
+                    del inner[position]
+                    break
+            touched.add(index)
+        del self._images[:to_remove]
+        if store:
+            for index in touched:
+                store.invalidate(index)
+        self.removed += to_remove
+        return to_remove
@@ -0,0 +1,96 @@
+from typing import Any, List, Optional, Set
+
+from anthropic.types.beta import BetaMessageParam
+
+from .token_counter import TokenCounter
+
+MAX_MESSAGE_CONTENT_LENGTH = 20000
+
+
+def truncate_message_content(content: Any, max_length: int = MAX_MESSAGE_CONTENT_LENGTH) -> Any:
+    """Return a copy of ``content`` with every string cut to ``max_length`` characters.
+
+    Image ``source`` blocks are passed through untouched.
+    """
+    if isinstance(content, str):
+        return content[:max_length]
+    elif isinstance(content, list):
+        return [truncate_message_content(item, max_length) for item in content]
+    elif isinstance(content, dict):
+        return {k: truncate_message_content(v, max_length) if k != 'source' else v
+                for k, v in content.items()}
+    return content
+
+
+class MessageStore:
+    """Caches the truncated, ready-to-send form of each message in the conversation.
+
+    Messages are only ever appended to the history, and the few in-place edits that do
+    happen (moving cache breakpoints, dropping old images) report the index they touched
+    through invalidate(). prepare() therefore only truncates new and invalidated messages
+    instead of rebuilding the whole history on every turn. If the history is rewritten
+    (for example shortened), the cache is rebuilt from scratch. Invalidations are passed
+    on to an optional TokenCounter so its per-message counts stay correct too.
+
+    Usage:
+        store = MessageStore()
+        planner.apply(messages, planner.plan(messages), store)
+        truncated_messages = store.prepare(messages)
+    """
+
+    def __init__(self, max_length: int = MAX_MESSAGE_CONTENT_LENGTH, token_counter: Optional[TokenCounter] = None):
+        self.max_length = max_length
+        self.token_counter = token_counter
+        self._sources: List[BetaMessageParam] = []
+        self._prepared: List[BetaMessageParam] = []
+        self._dirty: Set[int] = set()
+        self.truncations = 0
+
+    def __len__(self):
+        return len(self._prepared)
+
+    def _truncate(self, message: BetaMessageParam) -> BetaMessageParam:
+        self.truncations += 1
+        return {"role": message["role"], "content": truncate_message_content(message["content"], self.max_length)}
+
+    def _release(self, prepared: BetaMessageParam):
+        # Prepared messages are what prompt_size() counts; drop their cached counts
+        if self.token_counter:
+            self.token_counter.invalidate(prepared)
+
+    def reset(self):
+        """Forget every cached message."""
+        for prepared in self._prepared:
+            self._release(prepared)
+        self._sources.clear()
+        self._prepared.clear()
+        self._dirty.clear()
+
+    def invalidate(self, index: int):
+        """Mark the message at ``index`` as changed in place."""
+        if index < 0:
+            index += len(self._sources)
+        if 0 <= index < len(self._sources):
+            self._dirty.add(index)
+            if self.token_counter:
+                self.token_counter.invalidate(self._sources[index])
+
+    def prepare(self, messages: List[BetaMessageParam]) -> List[BetaMessageParam]:
+        """Return the truncated form of ``messages``, reusing cached entries.
+
+        The returned list is owned by the store and must not be modified by the caller.
+        """
+        cached = len(self._sources)
+        if cached > len(messages) or (cached and messages[cached - 1] is not self._sources[-1]):
+            self.reset()
+            cached = 0
+
+        for index in self._dirty:
+            self._release(self._prepared[index])
+            self._prepared[index] = self._truncate(messages[index])
+        self._dirty.clear()
+
+        for message in messages[cached:]:
+            self._sources.append(message)
+            self._prepared.append(self._truncate(message))
+        return self._prepared
@@ -0,0 +1,267 @@
+import asyncio
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from icecream import ic
+
+from config import METRICS_FILE, METRICS_INTERVAL, METRICS_PORT
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], unit: str, lock: threading.Lock):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.unit = unit
+        self._lock = lock
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        lines = [f"# TYPE {self.name} {self.kind}", f"# HELP {self.name} {self.help}"]
+        if self.unit:
+            lines.append(f"# UNIT {self.name} {self.unit}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}_total{_labels(self.labelnames, key)} {_number(v)}" for key, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(*args)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (the last one is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total[0])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the OpenMetrics text format.
+
+    Recording a value is a dict update under an uncontended lock; rendering (for the
+    metrics file or the HTTP endpoint) happens off the event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, cls, name: str, help: str, labels: Sequence[str], unit: str, **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(name, help, labels, unit, self._lock, **kwargs)
+        return self._metrics[name]
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (), unit: str = "") -> Counter:
+        return self._register(Counter, name, help, labels, unit)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), unit: str = "") -> Gauge:
+        return self._register(Gauge, name, help, labels, unit)
+
+    def histogram(
+        self, name: str, help: str, labels: Sequence[str] = (), unit: str = "", buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram, name, help, labels, unit, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                lines.extend(metric.header())
+                lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+TOKENS = REGISTRY.counter("agent_tokens", "Tokens billed for main-turn model requests.", ("kind",))
+TURNS = REGISTRY.counter("agent_turns", "Main-turn model requests completed by sampling_loop.")
+TURN_SECONDS = REGISTRY.histogram("agent_turn_seconds", "Wall time of a sampling_loop turn.", unit="seconds")
+IDLE_SECONDS = REGISTRY.counter("agent_idle_seconds", "Time turns spent waiting on the display.", ("reason",), unit="seconds")
+USER_WAIT_SECONDS = REGISTRY.counter("agent_user_wait_seconds", "Time spent waiting for the next user message.", unit="seconds")
+API_LATENCY = REGISTRY.histogram(
+    "agent_api_latency_seconds", "Duration of each model API attempt.", ("priority", "outcome"), unit="seconds"
+)
+API_FIRST_TOKEN = REGISTRY.histogram("agent_api_first_token_seconds", "Time to the first streamed event of a main turn.", unit="seconds")
+QUEUE_WAIT = REGISTRY.histogram(
+    "agent_request_queue_wait_seconds", "Time model calls waited in the request scheduler.", ("priority",), unit="seconds"
+)
+QUEUE_DEPTH = REGISTRY.gauge("agent_request_queue_depth", "Model calls waiting in the request scheduler.")
+TOOL_LATENCY = REGISTRY.histogram("agent_tool_latency_seconds", "Execution time of each tool call.", ("tool", "outcome"), unit="seconds")
+TOOL_OUTPUT_BYTES = REGISTRY.histogram(
+    "agent_tool_output_bytes", "Size of each tool result.", ("tool",), unit="bytes", buckets=BYTES_BUCKETS
+)
+
+
+class MetricsExporter:
+    """Publishes a registry as a periodically rewritten file and/or a local HTTP endpoint.
+
+    The file (METRICS_FILE, e.g. for a node_exporter textfile collector) is rendered
+    and written in a worker thread every ``interval`` seconds, through a temporary file
+    and os.replace() so readers never see a partial write. With a non-zero ``port`` the
+    registry is also served at http://127.0.0.1:<port>/metrics from a daemon thread.
+
+    Usage:
+        async with MetricsExporter(port=9464):
+            await run_sampling_loop(task, display)
+    """
+
+    def __init__(
+        self,
+        registry: MetricsRegistry = REGISTRY,
+        path: Optional[Path] = METRICS_FILE,
+        port: int = METRICS_PORT,
+        interval: float = METRICS_INTERVAL,
+    ):
+        self.registry = registry
+        self.path = Path(path) if path else None
+        self.port = port
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def write(self):
+        """Render the registry and atomically replace the metrics file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.registry.render(), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    async def _write_periodically(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.write)
+            except OSError as e:
+                ic(f"Could not write metrics to {self.path}: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _serve(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                data = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("content-type", CONTENT_TYPE)
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+        ic(f"Serving metrics at http://127.0.0.1:{self._httpd.server_address[1]}/metrics")
+
+    async def start(self):
+        if self.path and self._task is None:
+            self._task = asyncio.create_task(self._write_periodically())
+        if self.port and self._httpd is None:
+            self._serve()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Leave the final numbers behind
+            await asyncio.to_thread(self.write)
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
@@ -0,0 +1,336 @@
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from anthropic.types.beta import BetaMessage, BetaMessageParam
+from icecream import ic
+
+from config import (
+    COMPUTER_USE_BETA_FLAG,
+    MAIN_MODEL,
+    MODEL_PRICES,
+    ROUTER_ENABLED,
+    ROUTER_ERROR_COOLDOWN,
+    ROUTER_LIGHT_MODEL,
+    ROUTER_MAIN_ONLY_TOOLS,
+    ROUTER_MAX_OUTPUT_TOKENS,
+    ROUTER_MAX_RESULT_TOKENS,
+)
+from .metrics import REGISTRY
+from .prompt_caching import min_cacheable_tokens
+from .token_counter import TokenCounter
+
+# Relative to the input price, per the prompt caching pricing
+CACHE_READ_PRICE = 0.1
+CACHE_WRITE_PRICE = 1.25
+# Cached prefixes expire after five minutes without a hit
+CACHE_TTL = 300.0
+
+# Anthropic-defined tool types only the main model accepts, and the custom tools with
+# the same name and input the light model is offered instead
+LIGHT_TOOL_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "bash_20241022": {
+        "description": "Run a shell command and return its output.",
+        "input_schema": {
+            "type": "object",
+            "properties": {"command": {"type": "string", "description": "The command to run."}},
+            "required": ["command"],
+        },
+    },
+    "text_editor_20241022": {
+        "description": "View, create and edit files: view, create, str_replace, insert or undo_edit at path.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "command": {"type": "string", "enum": ["view", "create", "str_replace", "insert", "undo_edit"]},
+                "path": {"type": "string", "description": "Absolute path of the file or directory."},
+                "file_text": {"type": "string", "description": "Content of the file for create."},
+                "view_range": {"type": "array", "items": {"type": "integer"}, "description": "[start, end] lines for view."},
+                "old_str": {"type": "string", "description": "Exact text to replace for str_replace."},
+                "new_str": {"type": "string", "description": "Replacement text (str_replace) or text to insert (insert)."},
+                "insert_line": {"type": "integer", "description": "Line after which insert adds new_str."},
+            },
+            "required": ["command", "path"],
+        },
+    },
+}
+
+ROUTED_TURNS = REGISTRY.counter("agent_routed_turns", "Main-loop turns by model and routing reason.", ("model", "reason"))
+ESCALATIONS = REGISTRY.counter("agent_route_escalations", "Light-model turns re-run on the main model.", ("reason",))
+
+
+@dataclass
+class RouteDecision:
+    """The model one turn is sent to, and why."""
+
+    model: str
+    reason: str
+    light: bool = False
+    # True when the turn follows tool results (the turns the router may send elsewhere)
+    follow_up: bool = False
+
+
+@dataclass
+class ModelStats:
+    """Per-model totals for tuning the routing policy."""
+
+    requests: int = 0
+    escalated: int = 0
+    failed: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+    seconds: float = 0.0
+    cost: float = 0.0
+    reasons: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.seconds / self.requests if self.requests else 0.0
+
+    @property
+    def output_tokens_per_second(self) -> float:
+        return self.output_tokens / self.seconds if self.seconds else 0.0
+
+
+class ModelRouter:
+    """Chooses the model for each sampling_loop turn.
+
+    Turns that only react to tool results can often be handled by the light model
+    (ROUTER_LIGHT_MODEL): acknowledging a successful ``uv add``, reading a short file
+    listing, deciding on the next command. A follow-up turn goes to the light model when
+
+    - every tool result of the previous turn succeeded, and none came from a tool in
+      ``main_only_tools``;
+    - no tool failed in the last ``error_cooldown`` turns;
+    - the tool results are at most ``max_result_tokens`` tokens;
+    - follow-up answers have recently been short (an average of at most
+      ``max_output_tokens`` output tokens);
+    - the light model is expected to be cheaper. The main model usually has most of the
+      prompt cached; the light model has to write its own cache first, which pays off
+      only over a run of light turns, so the cold first turn is averaged over the
+      typical run length.
+
+    Everything else, including every message typed by the user, goes to the main
+    model. The light model does not accept the Anthropic-defined bash and editor tools,
+    so request_for() gives light turns custom tools with the same names and inputs. A light turn that fails, is cut off at max_tokens or comes back empty is
+    re-run on the main model (escalate()), and the next turns stay there.
+
+    Per-model request counts, tokens, latency and estimated cost are kept for tuning.
+
+    Usage:
+        router = ModelRouter(token_counter=token_counter)
+        decision = router.choose(messages, prompt_tokens, cache_prefix=plan.cached_prefix)
+        response = await call(model=decision.model, **router.request_for(decision, request))
+        reason = router.check(decision, response)
+        if reason:
+            decision = router.escalate(decision, reason)
+            response = await call(model=decision.model)
+        router.record(decision, response, seconds)
+    """
+
+    def __init__(
+        self,
+        main_model: str = MAIN_MODEL,
+        light_model: str = ROUTER_LIGHT_MODEL,
+        enabled: bool = ROUTER_ENABLED,
+        max_result_tokens: int = ROUTER_MAX_RESULT_TOKENS,
+        max_output_tokens: int = ROUTER_MAX_OUTPUT_TOKENS,
+        error_cooldown: int = ROUTER_ERROR_COOLDOWN,
+        main_only_tools: Sequence[str] = ROUTER_MAIN_ONLY_TOOLS,
+        token_counter: Optional[TokenCounter] = None,
+    ):
+        self.main_model = main_model
+        self.light_model = light_model
+        self.enabled = enabled and light_model != main_model
+        self.max_result_tokens = max_result_tokens
+        self.max_output_tokens = max_output_tokens
+        self.error_cooldown = error_cooldown
+        self.main_only_tools = set(main_only_tools)
+        self.token_counter = token_counter or TokenCounter()
+        self.models: Dict[str, ModelStats] = {}
+        # Output tokens of recent follow-up turns, and of light turns in a row
+        self._expected_output = 0.0
+        self._light_run = 2.0
+        self._run = 0
+        self._cooldown = 0
+        # model -> (tokens of the cached prefix, when it was last read or written)
+        self._cached: Dict[str, tuple] = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        if model not in self.models:
+            self.models[model] = ModelStats()
+        return self.models[model]
+
+    def _decide(self, model: str, reason: str, follow_up: bool = False) -> RouteDecision:
+        if reason != "light_turn" and self._run:
+            # A run of light turns ended; remember how long it was
+            self._light_run = 0.5 * self._light_run + 0.5 * self._run
+            self._run = 0
+        return RouteDecision(model, reason, light=model != self.main_model, follow_up=follow_up)
+
+    def _cached_tokens(self, model: str) -> int:
+        tokens, at = self._cached.get(model, (0, 0.0))
+        return tokens if time.monotonic() - at < CACHE_TTL else 0
+
+    def _turn_cost(self, model: str, prompt_tokens: int, output_tokens: float, cached: int, cache_prefix: int) -> float:
+        input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        cached = min(cached, prompt_tokens)
+        # Only the part up to the planned breakpoint is written to the cache (at the write
+        # price), and only if the model caches a prefix that long; the rest is plain input
+        if cache_prefix < min_cacheable_tokens(model):
+            cache_prefix = 0
+        written_to = min(max(cache_prefix, cached), prompt_tokens)
+        return (
+            cached * input_price * CACHE_READ_PRICE
+            + (written_to - cached) * input_price * CACHE_WRITE_PRICE
+            + (prompt_tokens - written_to) * input_price
+            + output_tokens * output_price
+        ) / 1_000_000
+
+    def _light_is_cheaper(self, prompt_tokens: int, cache_prefix: int) -> bool:
+        output = max(self._expected_output, 1.0)
+        main = self._turn_cost(self.main_model, prompt_tokens, output, self._cached_tokens(self.main_model), cache_prefix)
+        first = self._turn_cost(self.light_model, prompt_tokens, output, self._cached_tokens(self.light_model), cache_prefix)
+        # Later turns of the run read what the first one cached
+        later = self._turn_cost(self.light_model, prompt_tokens, output, cache_prefix, cache_prefix)
+        run = max(1.0, self._light_run)
+        return (first + (run - 1) * later) / run < main
+
+    def choose(self, messages: List[BetaMessageParam], prompt_tokens: int, cache_prefix: int = 0) -> RouteDecision:
+        """Pick the model for the next request; call once per turn.
+
+        ``cache_prefix`` is the estimated prompt size up to the last cache breakpoint
+        of the request (CachePlan.cached_prefix), 0 when nothing is cached.
+        """
+        if not self.enabled:
+            return self._decide(self.main_model, "disabled")
+        last = messages[-1] if messages else None
+        content = last.get("content") if last and last.get("role") == "user" else None
+        if not isinstance(content, list) or not content or not all(
+            isinstance(block, dict) and block.get("type") == "tool_result" for block in content
+        ):
+            return self._decide(self.main_model, "user_message")
+        if any(block.get("is_error") for block in content):
+            self._cooldown = self.error_cooldown
+            return self._decide(self.main_model, "tool_error", follow_up=True)
+        if self._cooldown:
+            self._cooldown -= 1
+            return self._decide(self.main_model, "error_streak", follow_up=True)
+        previous = messages[-2].get("content") if len(messages) > 1 else None
+        if isinstance(previous, list):
+            for block in previous:
+                if isinstance(block, dict) and block.get("type") == "tool_use" and block.get("name") in self.main_only_tools:
+                    return self._decide(self.main_model, f"tool:{block['name']}", follow_up=True)
+        if self.token_counter.count_message(last) > self.max_result_tokens:
+            return self._decide(self.main_model, "large_result", follow_up=True)
+        if self._expected_output > self.max_output_tokens:
+            return self._decide(self.main_model, "long_output", follow_up=True)
+        if not self._light_is_cheaper(prompt_tokens, cache_prefix):
+            return self._decide(self.main_model, "main_cached", follow_up=True)
+        self._run += 1
+        return self._decide(self.light_model, "light_turn", follow_up=True)
+
+    def request_for(self, decision: RouteDecision, request: Dict[str, Any]) -> Dict[str, Any]:
+        """The request parameters to send for ``decision``.
+
+        Main-model requests are returned unchanged. Light turns get custom tools in place
+        of the Anthropic-defined ones the light model does not accept, and no computer-use
+        beta.
+        """
+        if not decision.light:
+            return request
+        tools = []
+        for tool in request.get("tools") or []:
+            schema = LIGHT_TOOL_SCHEMAS.get(tool.get("type"))
+            if schema is None:
+                tools.append(tool)
+                continue
+            light_tool = {"name": tool["name"], "type": "custom", **schema}
+            if "cache_control" in tool:
+                light_tool["cache_control"] = tool["cache_control"]
+            tools.append(light_tool)
+        betas = [beta for beta in request.get("betas") or [] if beta != COMPUTER_USE_BETA_FLAG]
+        return dict(request, tools=tools, betas=betas)
+
+    def check(self, decision: RouteDecision, response: BetaMessage) -> Optional[str]:
+        """Why a light-model response should be re-run on the main model, if it should."""
+        if not decision.light:
+            return None
+        if response.stop_reason == "max_tokens":
+            return "max_tokens"
+        if not any(
+            (block.type == "text" and block.text.strip()) or block.type == "tool_use" for block in response.content
+        ):
+            return "empty"
+        return None
+
+    def escalate(self, decision: RouteDecision, reason: str) -> RouteDecision:
+        """Send the turn back to the main model after a light-model failure."""
+        stats = self._stats(decision.model)
+        if reason == "error":
+            stats.failed += 1
+        else:
+            stats.escalated += 1
+        ESCALATIONS.inc(reason=reason)
+        ic(f"Escalating turn from {decision.model} to {self.main_model}: {reason}")
+        self._cooldown = self.error_cooldown
+        return self._decide(self.main_model, f"escalated:{reason}", follow_up=decision.follow_up)
+
+    def record(self, decision: RouteDecision, response: BetaMessage, seconds: float):
+        """Account a finished request to the model that answered it."""
+        usage = response.usage
+        stats = self._stats(decision.model)
+        stats.requests += 1
+        stats.input_tokens += usage.input_tokens
+        stats.output_tokens += usage.output_tokens
+        cache_read = usage.cache_read_input_tokens or 0
+        cache_creation = usage.cache_creation_input_tokens or 0
+        stats.cache_read_tokens += cache_read
+        stats.cache_creation_tokens += cache_creation
+        stats.seconds += seconds
+        input_price, output_price = MODEL_PRICES.get(decision.model, (0.0, 0.0))
+        stats.cost += (
+            usage.input_tokens * input_price
+            + cache_read * input_price * CACHE_READ_PRICE
+            + cache_creation * input_price * CACHE_WRITE_PRICE
+            + usage.output_tokens * output_price
+        ) / 1_000_000
+        stats.reasons[decision.reason] = stats.reasons.get(decision.reason, 0) + 1
+        ROUTED_TURNS.inc(model=decision.model, reason=decision.reason)
+        if cache_read or cache_creation:
+            self._cached[decision.model] = (cache_read + cache_creation, time.monotonic())
+        if decision.follow_up:
+            self._expected_output = 0.5 * self._expected_output + 0.5 * usage.output_tokens
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model totals as plain data (for SessionStats and batch reports)."""
+        return {
+            model: {
+                "requests": s.requests,
+                "escalated": s.escalated,
+                "failed": s.failed,
+                "input_tokens": s.input_tokens,
+                "output_tokens": s.output_tokens,
+                "cache_read_tokens": s.cache_read_tokens,
+                "cache_creation_tokens": s.cache_creation_tokens,
+                "mean_seconds": round(s.mean_seconds, 3),
+                "output_tokens_per_second": round(s.output_tokens_per_second, 1),
+                "cost_usd": round(s.cost, 4),
+                "reasons": dict(s.reasons),
+            }
+            for model, s in self.models.items()
+        }
+
+    def report(self) -> str:
+        """Summarise which models answered this session's turns."""
+        lines = ["[bold yellow]Model Routing[/bold yellow] 🔀"]
+        for model, s in self.models.items():
+            lines.append(
+                f"[yellow]{model}:[/yellow] {s.requests} turns, {s.input_tokens + s.cache_read_tokens + s.cache_creation_tokens:,} in / "
+                f"{s.output_tokens:,} out, {s.mean_seconds:.2f}s mean, {s.output_tokens_per_second:.0f} tok/s, ~${s.cost:.4f}"
+            )
+            if s.escalated or s.failed:
+                lines.append(f"[yellow]  Escalated:[/yellow] {s.escalated} (failed {s.failed})")
+        return "\n".join(lines)
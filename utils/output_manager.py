@@ -20,12 +20,13 @@ class OutputManager:
         self.image_counter = 0
         self.display = display
 
-    def save_image(self, base64_data: str) -> Optional[Path]:
+    def save_image(self, base64_data: str, media_type: str = "image/png") -> Optional[Path]:
         """Save base64 image data to file and return path."""
         self.image_counter += 1
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         image_hash = hashlib.md5(base64_data.encode()).hexdigest()[:8]
-        image_path = self.image_dir / f"image_{timestamp}_{image_hash}.png"
+        extension = "jpg" if media_type == "image/jpeg" else "png"
+        image_path = self.image_dir / f"image_{timestamp}_{image_hash}.{extension}"
         try:
             image_data = base64.b64decode(base64_data)
             with open(image_path, 'wb') as f:
@@ -45,7 +46,7 @@ class OutputManager:
             text = self._truncate_string(str(result.output) or "")
             output_text += f"Output: {text}\n"
             if result.base64_image:
-                image_path = self.save_image(result.base64_image)
+                image_path = self.save_image(result.base64_image, result.media_type or "image/png")
                 if image_path:
                     output_text += f"[green]📸 Screenshot saved to {image_path}[/green]\n"
                 else:
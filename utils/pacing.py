@@ -0,0 +1,123 @@
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .agent_display import AgentDisplay
+
+PACING_MODES = ("interactive", "throughput")
+
+
+@dataclass
+class TurnTiming:
+    """Wall time of a single sampling_loop turn and how much of it was spent idle."""
+
+    turn: int
+    wall: float = 0.0
+    idle: float = 0.0
+    idle_by_reason: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def idle_ratio(self) -> float:
+        return self.idle / self.wall if self.wall else 0.0
+
+    def __str__(self):
+        reasons = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in self.idle_by_reason.items())
+        return f"turn {self.turn}: wall={self.wall:.2f}s idle={self.idle:.2f}s ({self.idle_ratio:.0%}) {reasons}"
+
+
+class TurnPacer:
+    """Paces sampling_loop on real events instead of fixed sleeps.
+
+    In "interactive" mode the loop waits for the display queue to be drawn before moving
+    on, so the user sees each message before the next request goes out. In "throughput"
+    mode there is no artificial delay at all. Either way, every wait is timed and
+    attributed to the current turn so idle time can be reported.
+
+    Usage:
+        pacer = TurnPacer(display, mode="throughput")
+        pacer.begin_turn()
+        await pacer.settle_display()
+        async with pacer.pause_live():
+            result = await tool_collection.run(...)
+        ic(pacer.end_turn())
+    """
+
+    def __init__(self, display: AgentDisplay, mode: str = "interactive", drain_timeout: float = 1.0):
+        if mode not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode '{mode}'. Expected one of: {', '.join(PACING_MODES)}")
+        self.display = display
+        self.mode = mode
+        self.drain_timeout = drain_timeout
+        self.turns: List[TurnTiming] = []
+        self._current: Optional[TurnTiming] = None
+        self._turn_started = 0.0
+
+    @property
+    def throughput(self) -> bool:
+        return self.mode == "throughput"
+
+    def begin_turn(self):
+        """Start timing a new turn."""
+        self._current = TurnTiming(turn=len(self.turns) + 1)
+        self._turn_started = time.perf_counter()
+
+    def end_turn(self) -> Optional[TurnTiming]:
+        """Finish the current turn and return its timing."""
+        timing = self._current
+        if timing is None:
+            return None
+        timing.wall = time.perf_counter() - self._turn_started
+        self.turns.append(timing)
+        self._current = None
+        return timing
+
+    def record_idle(self, reason: str, seconds: float):
+        """Attribute idle wall time to the current turn."""
+        if self._current is None:
+            return
+        self._current.idle += seconds
+        self._current.idle_by_reason[reason] = self._current.idle_by_reason.get(reason, 0.0) + seconds
+
+    async def settle_display(self):
+        """Wait until the display has drawn everything that was queued (interactive mode only)."""
+        if self.throughput:
+            return
+        start = time.perf_counter()
+        await self.display.wait_until_drained(timeout=self.drain_timeout)
+        self.record_idle("display", time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def pause_live(self):
+        """Stop the live display for the duration of the block and restart it afterwards.
+
+        Rich's stop() and start() return once the refresh thread has actually stopped or
+        started, so no extra sleep is needed around them.
+        """
+        live = self.display.live
+        if live is None:
+            yield
+            return
+        start = time.perf_counter()
+        live.stop()
+        self.record_idle("live_stop", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            start = time.perf_counter()
+            live.start()
+            self.record_idle("live_start", time.perf_counter() - start)
+
+    def report(self) -> str:
+        """Summarise idle time across all finished turns."""
+        wall = sum(t.wall for t in self.turns)
+        idle = sum(t.idle for t in self.turns)
+        share = idle / wall if wall else 0.0
+        lines = [
+            "[bold yellow]Turn Pacing[/bold yellow] ⏱️",
+            f"[yellow]Mode:[/yellow] {self.mode}",
+            f"[yellow]Turns:[/yellow] {len(self.turns)}",
+            f"[yellow]Wall Time:[/yellow] {wall:.2f}s",
+            f"[yellow]Idle Time:[/yellow] {idle:.2f}s ({share:.0%})",
+        ]
+        return "\n".join(lines)
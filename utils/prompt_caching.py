@@ -0,0 +1,166 @@
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Tuple
+
+from anthropic.types.beta import BetaCacheControlEphemeralParam, BetaMessageParam
+
+from .message_store import MessageStore
+from .token_counter import TokenCounter
+
+# The API accepts at most four cache_control blocks per request (tools, system and
+# messages combined), and ignores a breakpoint whose prefix is shorter than the
+# model's minimum cacheable length.
+MAX_CACHE_BREAKPOINTS = 4
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+MIN_CACHEABLE_TOKENS = {
+    "haiku": 2048,
+}
+
+
+def min_cacheable_tokens(model: str) -> int:
+    """Minimum prompt prefix (in tokens) the API will cache for ``model``."""
+    for family, tokens in MIN_CACHEABLE_TOKENS.items():
+        if family in model:
+            return tokens
+    return DEFAULT_MIN_CACHEABLE_TOKENS
+
+
+def strip_cache_control(value: Any) -> Any:
+    """Copy of ``value`` without cache_control markers, which move from turn to turn."""
+    if isinstance(value, dict):
+        return {k: strip_cache_control(v) for k, v in value.items() if k != "cache_control"}
+    if isinstance(value, list):
+        return [strip_cache_control(v) for v in value]
+    return value
+
+
+def _cacheable(message: BetaMessageParam) -> bool:
+    content = message["content"]
+    return message["role"] == "user" and isinstance(content, list) and bool(content)
+
+
+@dataclass
+class CachePlan:
+    """Where the breakpoints of one request go.
+
+    Attributes:
+        system: Put a breakpoint on the system prompt (caches tools + system).
+        tools: Put a breakpoint on the last tool (only used when there is no system prompt).
+        messages: Indexes of user messages whose last block gets a breakpoint.
+        static_tokens: Estimated tokens of the tools and system prompt.
+        cached_prefix: Estimated tokens covered by the last breakpoint.
+    """
+
+    system: bool = False
+    tools: bool = False
+    messages: List[int] = field(default_factory=list)
+    static_tokens: int = 0
+    cached_prefix: int = 0
+
+    @property
+    def breakpoints(self) -> int:
+        return int(self.system) + int(self.tools) + len(self.messages)
+
+    def __str__(self) -> str:
+        static = "system" if self.system else "tools" if self.tools else "none"
+        return (
+            f"cache plan: static={static} ({self.static_tokens:,} tokens), "
+            f"messages={self.messages}, cached prefix ~{self.cached_prefix:,} tokens"
+        )
+
+
+class CacheBreakpointPlanner:
+    """Chooses prompt-cache breakpoints so that each request reads as much as possible
+    from the cache written by the previous one.
+
+    A request can only read a cache entry that an earlier request wrote at a breakpoint,
+    and the API only looks back about 20 blocks from each breakpoint for one. So every turn:
+
+    * the newest user message gets a breakpoint, writing the whole history for the next turn;
+    * the breakpoints of the previous turn are kept while they are still in the history,
+      so this turn reads exactly what the last one wrote, however many blocks were added;
+    * tools + system get a breakpoint only when they are long enough to be cached on
+      their own, which keeps them cached across compactions; otherwise the slot is
+      given to the messages;
+    * breakpoints whose prefix is below the model's minimum cacheable length are dropped,
+      since the API would ignore them anyway.
+
+    Usage:
+        planner = CacheBreakpointPlanner(MAIN_MODEL, token_counter)
+        plan = planner.plan(messages, system=SYSTEM_PROMPT, tools=tool_collection.to_params(cache=False))
+        planner.apply(messages, plan, store)
+    """
+
+    def __init__(self, model: str, token_counter: Optional[TokenCounter] = None, max_breakpoints: int = MAX_CACHE_BREAKPOINTS):
+        self.model = model
+        self.token_counter = token_counter or TokenCounter()
+        self.max_breakpoints = max_breakpoints
+        self.min_tokens = min_cacheable_tokens(model)
+        # (index, message) pairs that carry a breakpoint from the last apply()
+        self._applied: List[Tuple[int, BetaMessageParam]] = []
+
+    def plan(self, messages: List[BetaMessageParam], system: Any = None, tools: Any = None) -> CachePlan:
+        plan = CachePlan(static_tokens=self.token_counter.count_static(system, tools))
+        if plan.static_tokens >= self.min_tokens:
+            if system:
+                plan.system = True
+            elif tools:
+                plan.tools = True
+            plan.cached_prefix = plan.static_tokens
+
+        # Estimated prompt size up to and including each message
+        prefix = [0] * len(messages)
+        running = plan.static_tokens
+        for index, message in enumerate(messages):
+            running += self.token_counter.count_message(message)
+            prefix[index] = running
+
+        candidates: List[int] = []
+        newest = next((i for i in range(len(messages) - 1, -1, -1) if _cacheable(messages[i])), None)
+        if newest is not None:
+            candidates.append(newest)
+        for index, message in reversed(self._applied):
+            if index < len(messages) and messages[index] is message and index not in candidates:
+                candidates.append(index)
+
+        slots = self.max_breakpoints - plan.breakpoints
+        for index in candidates:
+            if slots <= 0:
+                break
+            if prefix[index] < self.min_tokens:
+                continue
+            plan.messages.append(index)
+            plan.cached_prefix = max(plan.cached_prefix, prefix[index])
+            slots -= 1
+        plan.messages.sort()
+        return plan
+
+    @property
+    def applied(self) -> List[int]:
+        """Indexes of the messages that carry a breakpoint after the last apply()."""
+        return [index for index, _ in self._applied]
+
+    def restore(self, messages: List[BetaMessageParam], indexes: List[int], store: Optional[MessageStore] = None):
+        """Put back the breakpoints of an earlier process (e.g. after a resume), so the
+        next request reads the cache entries that process wrote."""
+        valid = [i for i in indexes if 0 <= i < len(messages) and _cacheable(messages[i])]
+        self.apply(messages, CachePlan(messages=valid), store)
+
+    def apply(self, messages: List[BetaMessageParam], plan: CachePlan, store: Optional[MessageStore] = None):
+        """Move the message breakpoints to ``plan.messages``, touching only what changes."""
+        wanted = set(plan.messages)
+        for index, message in self._applied:
+            still_here = index < len(messages) and messages[index] is message
+            if still_here and index in wanted:
+                continue
+            if message["content"][-1].pop("cache_control", None) and still_here and store:
+                store.invalidate(index)
+
+        applied: List[Tuple[int, BetaMessageParam]] = []
+        for index in plan.messages:
+            block = messages[index]["content"][-1]
+            if "cache_control" not in block:
+                block["cache_control"] = BetaCacheControlEphemeralParam({"type": "ephemeral"})
+                if store:
+                    store.invalidate(index)
+            applied.append((index, messages[index]))
+        self._applied = applied
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from icecream import ic
+
+from config import BASH_PROMPT_FILE, JOURNAL_SYSTEM_PROMPT_FILE, PROMPTS_DIR, SYSTEM_PROMPT_FILE
+
+DEFAULT_PROMPTS = {
+    "system": SYSTEM_PROMPT_FILE,
+    "journal": JOURNAL_SYSTEM_PROMPT_FILE,
+    "bash": BASH_PROMPT_FILE,
+}
+
+
+@dataclass(frozen=True)
+class PromptText:
+    """One prompt file as loaded: its text and a content hash."""
+
+    name: str
+    path: Path
+    text: str
+    sha256: str
+    # (st_mtime_ns, st_size) when it was read
+    stamp: Optional[Tuple[int, int]] = None
+
+    @property
+    def short_hash(self) -> str:
+        return self.sha256[:12]
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _stamp(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class PromptRegistry:
+    """Prompt files loaded once, kept in memory and re-read only when they change on disk.
+
+    Named prompts ("system", "journal", "bash") and the task prompts in PROMPTS_DIR are
+    read on first use. Each later lookup costs one stat(): the file is read again only
+    if its mtime or size changed. Every prompt has a sha256 of its content, so a change
+    can be told apart from a touch, and a session can check that the system prompt it
+    started with is still the one on disk (the API's prompt cache is keyed on the exact
+    prefix, so an edited system prompt makes every cached prefix miss).
+
+    Usage:
+        prompts = get_prompts()
+        system = prompts.get("system")
+        ...
+        prompts.check_pinned(system)   # each turn; warns once if the file changed
+    """
+
+    def __init__(self, prompts: Optional[Dict[str, Path]] = None, prompts_dir: Path = PROMPTS_DIR):
+        self.paths: Dict[str, Path] = {name: Path(path) for name, path in (prompts or DEFAULT_PROMPTS).items()}
+        self.prompts_dir = Path(prompts_dir)
+        self._loaded: Dict[Path, PromptText] = {}
+        self._warned: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.reads = 0
+        self.lookups = 0
+
+    def _load(self, name: str, path: Path) -> PromptText:
+        stamp = _stamp(path)
+        with self._lock:
+            self.lookups += 1
+            cached = self._loaded.get(path)
+            if cached is not None and cached.stamp == stamp:
+                return cached
+            if stamp is None:
+                # Running on an empty prompt would look valid (it has a hash), so fail instead
+                raise FileNotFoundError(f"Prompt {name!r} not found at {path}")
+            text = path.read_text(encoding="utf-8")
+            self.reads += 1
+            prompt = PromptText(name=name, path=path, text=text, sha256=_sha256(text), stamp=stamp)
+            if cached is not None and cached.sha256 != prompt.sha256:
+                ic(f"Prompt {name} changed on disk: {cached.short_hash} -> {prompt.short_hash}")
+            self._loaded[path] = prompt
+            return prompt
+
+    def get(self, name: str) -> PromptText:
+        """The current version of a named prompt ("system", "journal", "bash").
+
+        Raises FileNotFoundError if the prompt file does not exist.
+        """
+        if name not in self.paths:
+            raise KeyError(f"Unknown prompt {name!r}. Expected one of: {', '.join(self.paths)}")
+        return self._load(name, self.paths[name])
+
+    def text(self, name: str) -> str:
+        return self.get(name).text
+
+    def hash(self, name: str) -> str:
+        return self.get(name).sha256
+
+    def read(self, path: Union[str, Path]) -> PromptText:
+        """Any prompt file by path (a task prompt, or a template such as BASH_PROMPT_FILE).
+
+        Raises FileNotFoundError if the file does not exist.
+        """
+        path = Path(path)
+        return self._load(path.stem, path)
+
+    def task_prompts(self) -> List[Path]:
+        """The task prompt files in PROMPTS_DIR, sorted by name (their text is read on demand)."""
+        return sorted(self.prompts_dir.glob("*.md"))
+
+    def check_pinned(self, pinned: PromptText) -> bool:
+        """True if ``pinned`` still matches the file on disk.
+
+        A session keeps sending the prompt it started with. If the file has since
+        changed, the change is reported once (per new content) instead of being picked
+        up silently, since switching mid-session would invalidate the prompt cache.
+        """
+        try:
+            current = self._load(pinned.name, pinned.path)
+        except OSError as e:
+            if self._warned.get(pinned.name) != "missing":
+                self._warned[pinned.name] = "missing"
+                ic(f"{e}; keeping the session's version of the prompt")
+            return False
+        if current.sha256 == pinned.sha256:
+            return True
+        if self._warned.get(pinned.name) != current.sha256:
+            self._warned[pinned.name] = current.sha256
+            ic(
+                f"{pinned.path} changed during the session ({pinned.short_hash} -> {current.short_hash}); "
+                "keeping the session's version so the prompt cache stays valid"
+            )
+        return False
+
+    def hashes(self) -> Dict[str, str]:
+        """Content hash of every named prompt, e.g. for a session log."""
+        return {name: self.hash(name) for name in self.paths}
+
+
+_registry: Optional[PromptRegistry] = None
+
+
+def get_prompts() -> PromptRegistry:
+    """The process-wide prompt registry."""
+    global _registry
+    if _registry is None:
+        _registry = PromptRegistry()
+    return _registry
@@ -0,0 +1,383 @@
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from anthropic import APIConnectionError, APIStatusError, AsyncAnthropic, DefaultAsyncHttpxClient
+from icecream import ic
+
+from config import (
+    SCHEDULER_BACKGROUND_RESERVE,
+    SCHEDULER_BACKOFF_BASE,
+    SCHEDULER_BACKOFF_MAX,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_MAX_RETRIES,
+)
+from .metrics import API_LATENCY, QUEUE_DEPTH, QUEUE_WAIT
+from .tracing import span
+
+T = TypeVar("T")
+
+# Lower runs first. The main turn is what the user is waiting on; a tool's own model
+# call (bash script generation) blocks that turn; compaction and summaries can wait.
+PRIORITY_MAIN = 0
+PRIORITY_TOOL = 1
+PRIORITY_COMPACTION = 2
+PRIORITY_SUMMARY = 3
+PRIORITY_NAMES = {PRIORITY_MAIN: "main", PRIORITY_TOOL: "tool", PRIORITY_COMPACTION: "compaction", PRIORITY_SUMMARY: "summary"}
+
+# 429 is a rate limit, 529 an overloaded API; the rest are the transient errors the SDK retries
+RATE_LIMIT_STATUSES = {429, 529}
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+def _parse_reset(value: Optional[str], now: float) -> Optional[float]:
+    """An RFC 3339 reset time from a rate-limit header as a time.monotonic() deadline."""
+    if not value:
+        return None
+    try:
+        reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return now + (reset - datetime.now(timezone.utc)).total_seconds()
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def retry_after(headers: Any) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms or retry-after), if any."""
+    if headers is None:
+        return None
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except ValueError:
+            continue
+    return None
+
+
+@dataclass
+class RateLimits:
+    """The last request and token budgets reported in anthropic-ratelimit-* headers.
+
+    Reset times are time.monotonic() deadlines. A budget whose reset has passed is
+    unknown again until the next response reports it.
+    """
+
+    requests_limit: Optional[int] = None
+    requests_remaining: Optional[int] = None
+    requests_reset: Optional[float] = None
+    tokens_limit: Optional[int] = None
+    tokens_remaining: Optional[int] = None
+    tokens_reset: Optional[float] = None
+
+    def update(self, headers: Any):
+        now = time.monotonic()
+        if "anthropic-ratelimit-requests-remaining" in headers:
+            self.requests_limit = _parse_int(headers.get("anthropic-ratelimit-requests-limit"))
+            self.requests_remaining = _parse_int(headers.get("anthropic-ratelimit-requests-remaining"))
+            self.requests_reset = _parse_reset(headers.get("anthropic-ratelimit-requests-reset"), now)
+        # Prefer the input token budget, which is what a prompt estimate can be checked against
+        for prefix in ("anthropic-ratelimit-input-tokens", "anthropic-ratelimit-tokens"):
+            if f"{prefix}-remaining" in headers:
+                self.tokens_limit = _parse_int(headers.get(f"{prefix}-limit"))
+                self.tokens_remaining = _parse_int(headers.get(f"{prefix}-remaining"))
+                self.tokens_reset = _parse_reset(headers.get(f"{prefix}-reset"), now)
+                break
+
+    def consume(self, tokens: int):
+        """Count a request we are about to send, until its response reports the real budget."""
+        if self.requests_remaining is not None:
+            self.requests_remaining -= 1
+        if self.tokens_remaining is not None and tokens:
+            self.tokens_remaining -= tokens
+
+    def wait(self, tokens: int, reserve: float, now: float) -> float:
+        """Seconds until a request of ``tokens`` fits the budget, keeping ``reserve`` of each limit free."""
+        wait = 0.0
+        for remaining, limit, reset, need in (
+            (self.requests_remaining, self.requests_limit, self.requests_reset, 1),
+            (self.tokens_remaining, self.tokens_limit, self.tokens_reset, tokens),
+        ):
+            if remaining is None or reset is None or reset <= now:
+                continue
+            if remaining < need + math.ceil((limit or 0) * reserve):
+                wait = max(wait, reset - now)
+        return wait
+
+    def as_dict(self) -> Dict[str, Optional[int]]:
+        return {
+            "requests_limit": self.requests_limit,
+            "requests_remaining": self.requests_remaining,
+            "tokens_limit": self.tokens_limit,
+            "tokens_remaining": self.tokens_remaining,
+        }
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    tokens: int = field(default=0, compare=False)
+    not_before: float = field(default=0.0, compare=False)
+
+
+@dataclass
+class _WaitStats:
+    count: int = 0
+    total: float = 0.0
+    longest: float = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+
+
+class RequestScheduler:
+    """One gate for every Anthropic model call in the process.
+
+    Calls are submitted with a priority and run on a shared AsyncAnthropic client whose
+    own retries are disabled. At most ``max_concurrency`` calls are in flight; waiting
+    calls start in priority order (the main turn before a tool's model call, before
+    compaction, before quick summaries), oldest first within a priority.
+
+    Budgets are read from the anthropic-ratelimit-* headers of every response. A call
+    waits for the reset when the remaining requests or input tokens would not cover it;
+    calls below PRIORITY_TOOL also leave ``background_reserve`` of each limit for the
+    main turn. A 429 or 529 pauses every queued call for the server's retry-after (or
+    the backoff), and failed calls are retried with jittered exponential backoff up to
+    ``max_retries`` times before the error is raised.
+
+    Usage:
+        scheduler = get_scheduler()
+        response = await scheduler.submit(lambda client: client.messages.create(**request), PRIORITY_SUMMARY)
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+        max_retries: int = SCHEDULER_MAX_RETRIES,
+        backoff_base: float = SCHEDULER_BACKOFF_BASE,
+        backoff_max: float = SCHEDULER_BACKOFF_MAX,
+        background_reserve: float = SCHEDULER_BACKGROUND_RESERVE,
+        client: Optional[AsyncAnthropic] = None,
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.background_reserve = background_reserve
+        self.limits = RateLimits()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client = client
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._changed: Optional[asyncio.Condition] = None
+        # Metrics
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+        self._waits: Dict[str, _WaitStats] = {}
+
+    @property
+    def client(self) -> AsyncAnthropic:
+        if self._client is None:
+            self._client = AsyncAnthropic(
+                api_key=self.api_key,
+                max_retries=0,
+                http_client=DefaultAsyncHttpxClient(event_hooks={"response": [self._on_response]}),
+            )
+        return self._client
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    async def _on_response(self, response):
+        self.limits.update(response.headers)
+        await self._notify()
+
+    async def _notify(self):
+        async with self._condition():
+            self._changed.notify_all()
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self.loop = asyncio.get_running_loop()
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _ready_in(self, ticket: _Ticket) -> Optional[float]:
+        """Seconds until ``ticket`` may start, or None to wait for the next state change."""
+        if self._in_flight >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        for other in sorted(self._queue):
+            if other is ticket:
+                break
+            if self._own_wait(other, now) <= 0:
+                # Someone ahead of us can go now
+                return None
+        return max(0.0, self._own_wait(ticket, now))
+
+    def _own_wait(self, ticket: _Ticket, now: float) -> float:
+        reserve = self.background_reserve if ticket.priority > PRIORITY_TOOL else 0.0
+        return max(
+            self._paused_until - now,
+            ticket.not_before - now,
+            self.limits.wait(ticket.tokens, reserve, now),
+        )
+
+    async def _acquire(self, ticket: _Ticket):
+        queued_at = time.perf_counter()
+        changed = self._condition()
+        async with changed:
+            heapq.heappush(self._queue, ticket)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+            QUEUE_DEPTH.set(len(self._queue))
+            try:
+                while (delay := self._ready_in(ticket)) != 0:
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                QUEUE_DEPTH.set(len(self._queue))
+                changed.notify_all()
+            self._in_flight += 1
+            self.limits.consume(ticket.tokens)
+        name = PRIORITY_NAMES.get(ticket.priority, str(ticket.priority))
+        waited = time.perf_counter() - queued_at
+        self._waits.setdefault(name, _WaitStats()).add(waited)
+        QUEUE_WAIT.observe(waited, priority=name)
+
+    async def _release(self):
+        async with self._condition():
+            self._in_flight -= 1
+            self._changed.notify_all()
+
+    def backoff(self, attempt: int, server_wait: Optional[float] = None) -> float:
+        """Jittered exponential backoff for retry ``attempt``, never shorter than ``server_wait``."""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return max(server_wait or 0.0, ceiling * random.uniform(0.5, 1.0))
+
+    async def submit(
+        self,
+        call: Callable[[AsyncAnthropic], Awaitable[T]],
+        priority: int = PRIORITY_SUMMARY,
+        tokens: int = 0,
+    ) -> T:
+        """Run ``call(client)`` when its turn comes, retrying transient errors.
+
+        Args:
+            call: Coroutine function that makes one request with the shared client.
+            priority: One of the PRIORITY_* constants.
+            tokens: Estimated input tokens of the request, checked against the token budget.
+        """
+        ticket = _Ticket(priority, next(self._seq), tokens)
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        attempt = 0
+        while True:
+            with span("scheduler.wait", priority=name, attempt=attempt):
+                await self._acquire(ticket)
+            self.requests += 1
+            started = time.perf_counter()
+            try:
+                with span("api.attempt", priority=name, attempt=attempt):
+                    response = await call(self.client)
+                API_LATENCY.observe(time.perf_counter() - started, priority=name, outcome="ok")
+                return response
+            except (APIStatusError, APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                API_LATENCY.observe(time.perf_counter() - started, priority=name, outcome=str(status or "connection"))
+                if status is not None and status not in RETRYABLE_STATUSES:
+                    self.failures += 1
+                    raise
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+                response = getattr(e, "response", None)
+                delay = self.backoff(attempt, retry_after(response.headers if response is not None else None))
+                if status in RATE_LIMIT_STATUSES:
+                    if status == 429:
+                        self.rate_limited += 1
+                    else:
+                        self.overloaded += 1
+                    # Everyone queued would hit the same limit, so hold them all
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                ticket.not_before = time.monotonic() + delay
+                attempt += 1
+                self.retries += 1
+                ic(f"Model request failed with {status or type(e).__name__}, retry {attempt} in {delay:.1f}s")
+            finally:
+                await self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and retry metrics since the scheduler was created."""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "overloaded": self.overloaded,
+            "failures": self.failures,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self._in_flight,
+            "wait_seconds": {
+                name: {"count": w.count, "total": round(w.total, 3), "max": round(w.longest, 3)}
+                for name, w in self._waits.items()
+            },
+            "limits": self.limits.as_dict(),
+        }
+
+    def __str__(self) -> str:
+        waits = ", ".join(f"{name} {w.total:.2f}s/{w.count}" for name, w in self._waits.items())
+        return (
+            f"requests={self.requests} retries={self.retries} 429s={self.rate_limited} 529s={self.overloaded} "
+            f"queue={self.queue_depth} (max {self.max_queue_depth}) waits: {waits or 'none'}"
+        )
+
+
+_scheduler: Optional[RequestScheduler] = None
+
+
+def get_scheduler(api_key: Optional[str] = None) -> RequestScheduler:
+    """The scheduler shared by every model call on the running event loop.
+
+    Its client and queue belong to one event loop, so a new scheduler is created when
+    called from a different loop (e.g. a second asyncio.run()).
+    """
+    global _scheduler
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or (_scheduler.loop is not None and _scheduler.loop is not loop):
+        _scheduler = RequestScheduler(api_key=api_key)
+    return _scheduler
+
+
+def set_scheduler(scheduler: Optional[RequestScheduler]):
+    """Replace the process-wide scheduler (None creates a fresh one on next use)."""
+    global _scheduler
+    _scheduler = scheduler
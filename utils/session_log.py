@@ -0,0 +1,182 @@
+import json
+import os
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from anthropic.types.beta import BetaMessageParam
+from icecream import ic
+
+from config import LOGS_DIR
+from .prompt_caching import strip_cache_control
+
+SESSIONS_DIR = LOGS_DIR / "sessions"
+
+
+def _encode(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+    return f"{zlib.crc32(payload.encode('utf-8')):08x} {payload}\n".encode("utf-8")
+
+
+def _decode(line: bytes) -> Optional[Dict[str, Any]]:
+    """The record stored on ``line``, or None if the line is torn or corrupt."""
+    if not line.endswith(b"\n") or len(line) < 10 or line[8:9] != b" ":
+        return None
+    payload = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+@dataclass
+class SessionState:
+    """Everything read back from a session log."""
+
+    session_id: str
+    meta: Dict[str, Any] = field(default_factory=dict)
+    messages: List[BetaMessageParam] = field(default_factory=list)
+    usage: List[Dict[str, Any]] = field(default_factory=list)
+    cache_breakpoints: List[int] = field(default_factory=list)
+    records: int = 0
+    discarded_bytes: int = 0
+
+
+def resolve_session(session: str, directory: Path = SESSIONS_DIR) -> Path:
+    """Map a session id (or a path to its log) to the log file."""
+    path = Path(session)
+    if path.suffix == ".jsonl" and path.exists():
+        return path
+    return Path(directory) / f"{session}.jsonl"
+
+
+def read_session_log(path: Path) -> SessionState:
+    """Rebuild a session from its log in one pass.
+
+    Reading stops at the first torn or corrupt line (for example a write cut short by a
+    crash); that tail is cut off the file so new records append cleanly after it.
+    """
+    path = Path(path)
+    state = SessionState(session_id=path.stem)
+    good_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            record = _decode(line)
+            if record is None:
+                break
+            good_bytes += len(line)
+            state.records += 1
+            kind, data = record["type"], record["data"]
+            if kind == "session":
+                state.meta.update(data)
+            elif kind == "message":
+                state.messages.append(data)
+            elif kind == "truncate":
+                del state.messages[data["length"]:]
+            elif kind == "usage":
+                state.usage.append(data)
+            elif kind == "cache_plan":
+                state.cache_breakpoints = data["messages"]
+    size = path.stat().st_size
+    if size > good_bytes:
+        state.discarded_bytes = size - good_bytes
+        with open(path, "r+b") as f:
+            f.truncate(good_bytes)
+        ic(f"Session log {path.name}: discarded {state.discarded_bytes} bytes of torn tail")
+    return state
+
+
+class SessionLog:
+    """Append-only, checksummed log of one sampling_loop session.
+
+    Every line is ``<crc32 hex> <json record>``. Records are written as the session runs:
+    the session metadata, each message appended to the history (a "truncate" record
+    first if earlier messages were replaced, e.g. by compaction), the tool calls of each
+    turn, the usage of each response and the message breakpoints of the prompt-cache
+    plan. Messages are stored without cache_control markers, exactly as they were sent,
+    so a resumed session sends a byte-identical prefix and keeps hitting the cache.
+    Lines are flushed as they are written and fsynced once per turn.
+
+    Usage:
+        log = SessionLog.create("my_prompt", task=task)      # new session
+        log, state = SessionLog.resume("my_prompt_20241201-120000")
+        log.sync(messages)
+        log.usage(response.usage)
+        log.end_turn()
+    """
+
+    def __init__(self, path: Path, logged: Optional[List[BetaMessageParam]] = None):
+        self.path = Path(path)
+        self.session_id = self.path.stem
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab")
+        # The messages the log knows about, so sync() only writes what changed
+        self._logged: List[BetaMessageParam] = list(logged or [])
+        self._breakpoints: List[int] = []
+        # Set by resume(); sampling_loop restores the token totals and cache plan from it
+        self.restored: Optional[SessionState] = None
+
+    @classmethod
+    def create(cls, name: str, directory: Path = SESSIONS_DIR, **meta) -> "SessionLog":
+        session_id = f"{name}_{time.strftime('%Y%m%d-%H%M%S')}"
+        log = cls(Path(directory) / f"{session_id}.jsonl")
+        log._write("session", {"session_id": session_id, "created": time.time(), **meta})
+        return log
+
+    @classmethod
+    def resume(cls, session: str, directory: Path = SESSIONS_DIR) -> Tuple["SessionLog", SessionState]:
+        path = resolve_session(session, directory)
+        if not path.exists():
+            raise FileNotFoundError(f"No session log at {path}")
+        state = read_session_log(path)
+        log = cls(path, logged=state.messages)
+        log._breakpoints = list(state.cache_breakpoints)
+        log.restored = state
+        log._write("resumed", {"at": time.time(), "messages": len(state.messages)})
+        return log, state
+
+    def _write(self, kind: str, data: Any):
+        self._file.write(_encode({"type": kind, "t": round(time.time(), 3), "data": data}))
+        self._file.flush()
+
+    def sync(self, messages: List[BetaMessageParam]):
+        """Write the messages appended (or replaced) since the last sync."""
+        common = 0
+        limit = min(len(self._logged), len(messages))
+        while common < limit and messages[common] is self._logged[common]:
+            common += 1
+        if common < len(self._logged):
+            self._write("truncate", {"length": common})
+            del self._logged[common:]
+        for message in messages[common:]:
+            self._write("message", strip_cache_control(message))
+            self._logged.append(message)
+
+    def tool_calls(self, calls: List[Dict[str, Any]], results: List[Dict[str, Any]]):
+        """Record the tool_use blocks of a turn and whether each result was an error."""
+        self._write("tool_calls", [
+            {"id": call["id"], "name": call["name"], "input": call.get("input"), "is_error": result.get("is_error", False)}
+            for call, result in zip(calls, results)
+        ])
+
+    def usage(self, usage: Any):
+        self._write("usage", usage.model_dump(mode="json") if hasattr(usage, "model_dump") else dict(usage))
+
+    def cache_plan(self, breakpoints: List[int]):
+        """Record the message breakpoints of the cache plan when they change."""
+        if breakpoints != self._breakpoints:
+            self._breakpoints = list(breakpoints)
+            self._write("cache_plan", {"messages": self._breakpoints})
+
+    def end_turn(self):
+        """Make everything written so far durable."""
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.end_turn()
+            self._file.close()
@@ -0,0 +1,157 @@
+import base64
+import hashlib
+import json
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+from anthropic.types.beta import BetaMessageParam
+
+# Anthropic bills roughly (width * height) / 750 tokens per image, capped by the
+# downscaling the API applies to large images
+IMAGE_TOKENS_PER_PIXEL = 1 / 750
+MAX_IMAGE_TOKENS = 1600
+# Fixed per-block overhead for the JSON framing the API adds around content
+BLOCK_OVERHEAD_TOKENS = 4
+
+
+def _png_size(data: str) -> Optional[Tuple[int, int]]:
+    """Read width and height from the IHDR chunk of a base64 encoded PNG."""
+    try:
+        header = base64.b64decode(data[:44])
+    except Exception:
+        return None
+    if len(header) < 24 or header[:8] != b"\x89PNG\r\n\x1a\n":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+class TokenCounter:
+    """Fast local token estimates, calibrated against the usage the API reports.
+
+    Every content block gets a cheap local estimate (characters per token for text and
+    JSON, pixel count for images). Estimates are cached per message, so a message is
+    counted once unless it is invalidated after an in-place edit. When the real usage of
+    a request comes back, calibrate() compares it with the estimate made for that
+    request and nudges a scale factor, so estimates converge on the tokenizer's counts.
+
+    Usage:
+        counter = TokenCounter()
+        prompt_tokens = counter.prompt_size(messages, system=system, tools=tools)
+        ...
+        counter.calibrate(response.usage)
+    """
+
+    def __init__(self, chars_per_token: float = 3.5, smoothing: float = 0.3):
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+        self.scale = 1.0
+        self.last_prompt_estimate = 0
+        self._raw_last_prompt = 0
+        self._messages: Dict[int, Tuple[BetaMessageParam, int]] = {}
+        self._exact: Dict[str, int] = {}
+
+    def _text_tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    def estimate_block(self, block: Any) -> int:
+        """Uncalibrated estimate for one content block (or a plain string)."""
+        if isinstance(block, str):
+            return self._text_tokens(block)
+        if not isinstance(block, dict):
+            return self._text_tokens(str(block))
+        block_type = block.get("type")
+        if block_type == "text":
+            return self._text_tokens(block.get("text", "")) + BLOCK_OVERHEAD_TOKENS
+        if block_type == "image":
+            source = block.get("source", {})
+            size = _png_size(source.get("data", "")) if source.get("type") == "base64" else None
+            if size is None:
+                return MAX_IMAGE_TOKENS
+            width, height = size
+            return min(MAX_IMAGE_TOKENS, int(width * height * IMAGE_TOKENS_PER_PIXEL) + 1)
+        if block_type == "tool_use":
+            return self._text_tokens(block.get("name", "") + json.dumps(block.get("input", {}))) + BLOCK_OVERHEAD_TOKENS * 2
+        if block_type == "tool_result":
+            content = block.get("content", [])
+            if isinstance(content, str):
+                return self._text_tokens(content) + BLOCK_OVERHEAD_TOKENS * 2
+            return sum(self.estimate_block(item) for item in content) + BLOCK_OVERHEAD_TOKENS * 2
+        return self._text_tokens(json.dumps(block, default=str))
+
+    def _raw_message_tokens(self, message: BetaMessageParam) -> int:
+        cached = self._messages.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        content = message["content"]
+        if isinstance(content, str):
+            tokens = self._text_tokens(content)
+        else:
+            tokens = sum(self.estimate_block(block) for block in content)
+        tokens += BLOCK_OVERHEAD_TOKENS
+        self._messages[id(message)] = (message, tokens)
+        return tokens
+
+    def count_block(self, block: Any) -> int:
+        """Calibrated token estimate for one content block."""
+        return int(self.estimate_block(block) * self.scale)
+
+    def count_message(self, message: BetaMessageParam) -> int:
+        """Calibrated token estimate for a message; computed once and then cached."""
+        return int(self._raw_message_tokens(message) * self.scale)
+
+    def count_messages(self, messages: List[BetaMessageParam]) -> int:
+        return int(sum(self._raw_message_tokens(message) for message in messages) * self.scale)
+
+    def invalidate(self, message: BetaMessageParam):
+        """Forget the cached count for a message that was edited in place."""
+        self._messages.pop(id(message), None)
+
+    def forget(self, messages: List[BetaMessageParam]):
+        """Drop cached counts for messages that left the history."""
+        for message in messages:
+            self.invalidate(message)
+
+    def _raw_static_tokens(self, system: Any = None, tools: Any = None) -> int:
+        raw = 0
+        if isinstance(system, dict):
+            system = [system]
+        if system:
+            raw += self._text_tokens(system) if isinstance(system, str) else sum(self.estimate_block(b) for b in system)
+        if tools:
+            raw += self._text_tokens(json.dumps(tools, default=str))
+        return raw
+
+    def count_static(self, system: Any = None, tools: Any = None) -> int:
+        """Calibrated estimate for the tools and system prompt that precede the messages."""
+        return int(self._raw_static_tokens(system, tools) * self.scale)
+
+    def prompt_size(self, messages: List[BetaMessageParam], system: Any = None, tools: Any = None) -> int:
+        """Estimated input tokens of the next request, remembered for calibrate()."""
+        raw = sum(self._raw_message_tokens(message) for message in messages)
+        raw += self._raw_static_tokens(system, tools)
+        self._raw_last_prompt = raw
+        self.last_prompt_estimate = int(raw * self.scale)
+        return self.last_prompt_estimate
+
+    def calibrate(self, usage: Any):
+        """Adjust the scale factor using the real usage of the request last sized by prompt_size()."""
+        if not self._raw_last_prompt or usage is None:
+            return
+        actual = (
+            (getattr(usage, "input_tokens", 0) or 0)
+            + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+            + (getattr(usage, "cache_read_input_tokens", 0) or 0)
+        )
+        if actual <= 0:
+            return
+        observed = actual / self._raw_last_prompt
+        self.scale = (1 - self.smoothing) * self.scale + self.smoothing * observed
+        self._raw_last_prompt = 0
+
+    async def count_exact(self, client, **request) -> int:
+        """Exact input tokens from the count_tokens endpoint, cached by request contents."""
+        key = hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        if key not in self._exact:
+            result = await client.beta.messages.count_tokens(**request)
+            self._exact[key] = result.input_tokens
+        return self._exact[key]
@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import atexit
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+from config import TRACE_BACKUPS, TRACE_BUFFER_SPANS, TRACE_ENABLED, TRACE_FILE, TRACE_MAX_BYTES
+from .debug_log import rotate_file
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+
+
+def _lane() -> str:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return task.get_name()
+    return f"thread-{threading.get_ident()}"
+
+
+class Span:
+    """One timed phase. Use as a context manager, or start() and finish() explicitly."""
+
+    __slots__ = ("tracer", "name", "attrs", "id", "parent", "_start", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.id = 0
+        self.parent = 0
+        self._start = 0
+        self._token = None
+
+    def set(self, **attrs):
+        """Add attributes known only once the phase is under way (sizes, outcomes)."""
+        self.attrs.update(attrs)
+
+    def start(self) -> "Span":
+        parent = _current.get()
+        self.parent = parent.id if parent else 0
+        self.id = next(self.tracer._ids)
+        self._token = _current.set(self)
+        self._start = time.perf_counter_ns()
+        return self
+
+    def finish(self):
+        if self._token is None:
+            return
+        end = time.perf_counter_ns()
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Finished from another context than it was started in
+            pass
+        self._token = None
+        self.tracer._emit(self, end)
+
+    def __enter__(self) -> "Span":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.finish()
+        return False
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled."""
+
+    def set(self, **attrs):
+        pass
+
+    def start(self) -> "_NoopSpan":
+        return self
+
+    def finish(self):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """Nested tracing spans written to a JSONL file.
+
+    A span times one phase of the agent (a sampling_loop turn, preparing the request,
+    the model call, a tool and the stages inside it). Spans nest through a contextvar,
+    so a span opened in an asyncio task created inside another span has that span as its
+    parent. Finished spans are queued in memory and appended to ``path`` by a background
+    thread, which keeps the cost on the event loop to a few microseconds per span. At
+    most ``max_spans`` wait in the queue: if the writer falls behind, the oldest are
+    dropped and counted in ``dropped``. Past ``max_bytes`` the file is rotated to
+    ``trace.jsonl.1.gz``, keeping ``backups`` old files.
+
+    Each line of the file is one span, with ``ts`` (epoch) and ``dur`` in microseconds
+    and ``lane`` the asyncio task (or thread) that ran it:
+        {"name": "tool", "id": 7, "parent": 3, "ts": 1733050000123456, "dur": 5120,
+         "pid": 4242, "lane": "Task-12", "attrs": {"tool": "bash"}}
+
+    Usage:
+        with span("prepare", messages=len(messages)):
+            ...
+
+        @traced("web.read_info")
+        async def read_info(...): ...
+
+    Convert a trace for chrome://tracing or https://ui.perfetto.dev with
+    ``python -m utils.tracing logs/trace.jsonl -o trace.json``.
+    """
+
+    def __init__(
+        self,
+        path: Path = TRACE_FILE,
+        enabled: bool = TRACE_ENABLED,
+        flush_interval: float = 1.0,
+        max_bytes: int = TRACE_MAX_BYTES,
+        backups: int = TRACE_BACKUPS,
+        max_spans: int = TRACE_BUFFER_SPANS,
+    ):
+        self.path = Path(path)
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_spans = max_spans
+        self.dropped = 0
+        self.rotations = 0
+        self.pid = os.getpid()
+        self._ids = itertools.count(1)
+        self._pending: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # perf_counter is monotonic but has no epoch; anchor it once
+        self._epoch_ns = time.time_ns() - time.perf_counter_ns()
+
+    def span(self, name: str, **attrs) -> Span:
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def _emit(self, span: Span, end: int):
+        record = {
+            "name": span.name,
+            "id": span.id,
+            "parent": span.parent,
+            "ts": (self._epoch_ns + span._start) // 1000,
+            "dur": (end - span._start) // 1000,
+            "pid": self.pid,
+            "lane": _lane(),
+        }
+        if span.attrs:
+            record["attrs"] = span.attrs
+        if len(self._pending) >= self.max_spans:
+            self.dropped += 1
+        self._pending.append(record)
+        if self._thread is None:
+            self._start_writer()
+
+    def _start_writer(self):
+        self._thread = threading.Thread(target=self._run_writer, name="trace-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run_writer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write every pending span to the trace file."""
+        with self._write_lock:
+            if not self._pending:
+                return
+            lines = []
+            while self._pending:
+                lines.append(json.dumps(self._pending.popleft(), default=str))
+            data = "\n".join(lines) + "\n"
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                if self.max_bytes:
+                    try:
+                        size = self.path.stat().st_size
+                    except FileNotFoundError:
+                        size = 0
+                    if size and size + len(data) > self.max_bytes:
+                        rotate_file(self.path, self.backups)
+                        self.rotations += 1
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(data)
+            except OSError:
+                # Tracing must never break the agent
+                pass
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """Replace the process-wide tracer (e.g. to trace a benchmark to its own file)."""
+    global _tracer
+    _tracer = tracer
+
+
+def span(name: str, **attrs) -> Span:
+    """A span on the process-wide tracer; start it with ``with`` or start()."""
+    return _tracer.span(name, **attrs)
+
+
+def traced(name: str):
+    """Decorator that wraps every call of a function (sync or async) in a span."""
+
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def to_chrome_trace(path: Path) -> Dict[str, Any]:
+    """Convert a JSONL trace into the Chrome trace event format."""
+    events: List[Dict[str, Any]] = []
+    lanes: Dict[tuple, int] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            lane = (record["pid"], record["lane"])
+            if lane not in lanes:
+                lanes[lane] = len(lanes) + 1
+                events.append({
+                    "ph": "M", "name": "thread_name", "pid": record["pid"], "tid": lanes[lane],
+                    "args": {"name": record["lane"]},
+                })
+            events.append({
+                "ph": "X",
+                "name": record["name"],
+                "cat": record["name"].split(".")[0],
+                "ts": record["ts"],
+                "dur": record["dur"],
+                "pid": record["pid"],
+                "tid": lanes[lane],
+                "args": dict(record.get("attrs", {}), id=record["id"], parent=record["parent"]),
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a JSONL span trace to Chrome trace format.")
+    parser.add_argument("trace", nargs="?", default=str(TRACE_FILE), help="JSONL trace file")
+    parser.add_argument("-o", "--output", default="trace.json", help="Chrome trace JSON to write")
+    args = parser.parse_args()
+    trace = to_chrome_trace(Path(args.trace))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(trace, f)
+    print(f"Wrote {len(trace['traceEvents'])} events to {args.output}")
+
+
+if __name__ == "__main__":
+    main()